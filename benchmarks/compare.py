@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+# metrics compared between results, with whether a higher value is better
+INDEXING_METRICS = {"mb_per_second": True, "lines_per_second": True}
+MEMORY_METRICS = {"allocated_bytes_per_line": False, "table_bytes_per_line": False}
+LOAD_METRICS = {"rps": True, "p50": False, "p99": False}
+
+
+def compare(base: dict, new: dict, threshold: float) -> list[str]:
+    """
+    Print every metric found in both results side by side, with its relative change
+    :param base: Results of the benchmark suite for the reference commit
+    :param new: Results of the benchmark suite for the commit being evaluated
+    :param threshold: Relative change beyond which a metric getting worse is reported as a regression
+    :return: description of each regression
+    """
+    rows = []
+    for name, higher_is_better in INDEXING_METRICS.items():
+        rows.append((f"indexing {name}", base["indexing"][name], new["indexing"][name], higher_is_better))
+    for name, higher_is_better in MEMORY_METRICS.items():
+        rows.append((f"memory {name}", base["memory"][name], new["memory"][name], higher_is_better))
+
+    def key(run: dict) -> tuple:
+        # results saved before lines could be requested as raw bytes only measured JSON responses
+        return run["target"], run["distribution"], run.get("format", "text"), run["concurrency"]
+
+    base_runs = {key(run): run for run in base["load"]}
+    for run in new["load"]:
+        base_run = base_runs.get(key(run))
+        if base_run is None:
+            continue
+        label = "{} {} {} x{}".format(*key(run))
+        for name, higher_is_better in LOAD_METRICS.items():
+            base_value = base_run[name] if name == "rps" else base_run["latency_ms"][name]
+            new_value = run[name] if name == "rps" else run["latency_ms"][name]
+            rows.append((f"{label} {name}", base_value, new_value, higher_is_better))
+
+    regressions = []
+    print(f"{'Metric':>40} | {'Base':>12} | {'New':>12} | {'Change':>8}")
+    for name, base_value, new_value, higher_is_better in rows:
+        change = (new_value - base_value) / base_value if base_value else 0.0
+        worse = -change if higher_is_better else change
+        flag = " !" if worse > threshold else ""
+        print(f"{name:>40} | {base_value:>12.2f} | {new_value:>12.2f} | {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(f"{name}: {base_value:.2f} -> {new_value:.2f} ({change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Benchmark comparison",
+        description="Compares two results of the benchmark suite, exiting with an error if any metric got worse by "
+                    "more than the threshold"
+    )
+    parser.add_argument("base", type=str, help="JSON results of the reference commit")
+    parser.add_argument("new", type=str, help="JSON results of the commit being evaluated")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative change beyond which a metric getting worse is a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.new) as new_file:
+        found = compare(json.load(base_file), json.load(new_file), args.threshold)
+
+    if found:
+        print(f"{len(found)} regression(s) beyond {args.threshold:.0%}:", *found, sep="\n")
+        sys.exit(1)
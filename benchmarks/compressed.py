@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from compress_file import compress_file
+from file_generator import generate_file
+from src.file_handlers.cache import LineCache
+from src.file_handlers.manager_compressed import CompressedFileManager
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers.reader import AsyncReader
+
+
+async def measure_latency(manager: FileManagerWithPreProcessing, n_requests: int, seed: int) -> dict[str, float]:
+    """
+    Retrieve random lines one after the other, timing each of them
+    :param manager: Pre-processed file manager
+    :param n_requests: Number of lines to retrieve
+    :param seed: Seed of the random line indices, so that every manager retrieves the same lines
+    :return: median and 99th percentile of the time taken to retrieve a line, in microseconds
+    """
+    rng = random.Random(seed)
+    n_lines = len(manager.bytes_before_line)
+    latencies = []
+    for _ in range(n_requests):
+        line_index = rng.randrange(n_lines)
+        start = time.perf_counter()
+        await manager.get_line_bytes(line_index)
+        latencies.append((time.perf_counter() - start) * 10**6)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {"p50": percentiles[49], "p99": percentiles[98]}
+
+
+async def main(path: os.PathLike, compressed_path: os.PathLike, n_requests: int, block_cache_bytes: int) -> None:
+    reader = AsyncReader(16)
+    logger = logging.getLogger(__name__)
+    managers = {
+        "uncompressed, mmap": FileManagerWithPreProcessing(path, logger),
+        "uncompressed, pread": FileManagerWithPreProcessing(path, logger, reader=reader),
+        "compressed, no cache": CompressedFileManager(compressed_path, logger),
+        "compressed, block cache": CompressedFileManager(compressed_path, logger,
+                                                         block_cache=LineCache(block_cache_bytes)),
+        "compressed, thread pool": CompressedFileManager(compressed_path, logger, reader=reader,
+                                                         block_cache=LineCache(block_cache_bytes)),
+    }
+    print(f"{'Read path':>24} | {'Indexing':>10} | {'p50':>10} | {'p99':>10}")
+    for name, manager in managers.items():
+        start = time.perf_counter()
+        manager.pre_process()
+        indexing = time.perf_counter() - start
+        await measure_latency(manager, min(n_requests, 1000), seed=1)  # warm up the page cache
+        latency = await measure_latency(manager, n_requests, seed=2)
+        print(f"{name:>24} | {indexing:>8.2f} s | {latency['p50']:>7.1f} µs | {latency['p99']:>7.1f} µs")
+        manager.close()
+    reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Compressed serving benchmark",
+        description="Compares the indexing time and the latency of random line reads between a file and its "
+                    "block-compressed copy"
+    )
+    parser.add_argument("path", type=str, nargs="?", help="File to serve. If omitted, a temporary file is generated")
+    parser.add_argument("-l", "--lines", type=int, default=1000000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=200,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-n", "--requests", type=int, default=10000, help="Number of lines to retrieve")
+    parser.add_argument("--block-cache-bytes", type=int, default=16 * 1024 * 1024,
+                        help="Maximum total size of the decompressed blocks kept in memory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file_path = args.path
+        if file_path is None:
+            file_path = Path(tmpdir, "fixture.txt")
+            # random characters compress far less than real text, so a small alphabet is used to narrow the gap
+            generate_file(file_path, args.lines, args.max_chars_per_line, string.ascii_lowercase[:8] + " ")
+        compressed_file_path = Path(tmpdir, "fixture.txt.gz")
+        start = time.perf_counter()
+        compress_file(file_path, compressed_file_path)
+        size, compressed_size = os.path.getsize(file_path), os.path.getsize(compressed_file_path)
+        print(f"File size: {size / 10**6:.1f} MB, compressed: {compressed_size / 10**6:.1f} MB "
+              f"({size / compressed_size:.1f}x, in {time.perf_counter() - start:.1f} s)")
+        asyncio.run(main(file_path, compressed_file_path, args.requests, args.block_cache_bytes))
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from file_generator import generate_file
+from src import constants
+from src.service import LineService
+
+
+async def measure(n_requests: int) -> dict[str, float]:
+    """
+    Call the line service directly, bypassing HTTP, once with a `LineService` created per request (as the previous
+    `Depends()` did, reusing the pre-processed offsets) and once with the instance shared by the app
+    :param n_requests: Number of handler calls
+    :return: average time per handler call of each approach, in microseconds
+    """
+    shared_service = LineService()
+    bytes_before_line = shared_service.pre_process()
+    n_lines = len(bytes_before_line)
+
+    async def per_request_service(line_index: int) -> str:
+        service = LineService()
+        service.manager.bytes_before_line = bytes_before_line
+        return await service.get_line(line_index)
+
+    async def shared(line_index: int) -> str:
+        return await shared_service.get_line(line_index)
+
+    results = {}
+    for name, handler in (("service per request", per_request_service), ("shared service", shared)):
+        start = time.perf_counter()
+        for _ in range(n_requests):
+            await handler(random.randrange(n_lines))
+        results[name] = (time.perf_counter() - start) / n_requests * 10**6
+
+    shared_service.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Handler benchmark",
+        description="Measures the time spent in the line handler with a service per request and with a shared service"
+    )
+    parser.add_argument("-n", "--requests", type=int, default=10000, help="Number of handler calls")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir, "fixture.txt")
+        generate_file(path, 10000, 100, string.ascii_letters)
+        # reads and caching are disabled so that only the cost of the handler itself is compared
+        with patch.object(constants, "FILE_PATH_TO_SERVE", path), patch.object(constants, "PERSIST_INDEX", False), \
+             patch.object(constants, "READ_CONCURRENCY", 0), patch.object(constants, "CACHE_MAX_BYTES", 0):
+            for approach, duration in asyncio.run(measure(args.requests)).items():
+                print(f"{approach:>20}: {duration:>8.2f} µs per request")
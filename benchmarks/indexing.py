@@ -0,0 +1,65 @@
+import argparse
+import os
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from file_generator import generate_file
+from src.file_handlers import scanner
+from src.file_handlers.offsets import LineOffsets
+
+
+def scan_with_readline(path: os.PathLike) -> LineOffsets:
+    """Previous pre-processing implementation: one `readline` call and one `append` per line, in text mode"""
+    offsets = LineOffsets()
+    with open(path, "r") as f:
+        line = f.readline()
+        offset = 0
+        while line != "":
+            offsets.append(offset)
+            offset += len(line)
+            line = f.readline()
+    return offsets
+
+
+def measure(path: os.PathLike, repeat: int) -> dict[str, float]:
+    """
+    :param path: Path to the file to index
+    :param repeat: Number of times each implementation is executed; the best time is kept
+    :return: throughput of each implementation, in MB/s
+    """
+    size = os.path.getsize(path)
+    results = {}
+    for name, scan in (("readline", scan_with_readline), ("chunked", scanner.scan_line_offsets)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            scan(path)
+            best = min(best, time.perf_counter() - start)
+        results[name] = size / best / 10**6
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Indexing benchmark",
+        description="Compares the throughput of the readline-based and chunked pre-processing implementations"
+    )
+    parser.add_argument("path", type=str, nargs="?", help="File to index. If omitted, a temporary file is generated")
+    parser.add_argument("-l", "--lines", type=int, default=100000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=2000,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of runs of each implementation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.path
+        if path is None:
+            path = Path(tmpdir, "fixture.txt")
+            generate_file(path, args.lines, args.max_chars_per_line, string.ascii_letters)
+
+        assert scan_with_readline(path) == scanner.scan_line_offsets(path), "implementations disagree"
+        print(f"File size: {os.path.getsize(path) / 10**6:.1f} MB")
+        for name, throughput in measure(path, args.repeat).items():
+            print(f"{name:>10}: {throughput:>8.1f} MB/s")
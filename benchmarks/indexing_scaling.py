@@ -0,0 +1,54 @@
+import argparse
+import os
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from file_generator import generate_file
+from src.file_handlers import scanner
+
+
+def measure(path: os.PathLike, workers: int, repeat: int) -> float:
+    """
+    :param path: Path to the file to index
+    :param workers: Number of processes scanning the file in parallel
+    :param repeat: Number of runs; the best time is kept
+    :return: time taken to index the file, in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scanner.scan_line_offsets(path, workers=workers, min_range_size=1)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Indexing scaling benchmark",
+        description="Measures how the pre-processing time of a file scales with the number of indexing workers"
+    )
+    parser.add_argument("path", type=str, nargs="?", help="File to index. If omitted, a temporary file is generated")
+    parser.add_argument("-l", "--lines", type=int, default=500000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=2000,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-w", "--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}), help="Worker counts to measure")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of runs for each worker count")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.path
+        if path is None:
+            path = Path(tmpdir, "fixture.txt")
+            generate_file(path, args.lines, args.max_chars_per_line, string.ascii_letters)
+
+        size = os.path.getsize(path)
+        print(f"File size: {size / 10**6:.1f} MB, CPU count: {os.cpu_count()}")
+        print(f"{'Workers':>8} | {'Time':>9} | {'Throughput':>12} | {'Speedup':>7}")
+        baseline = None
+        for workers in args.workers:
+            elapsed = measure(path, workers, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{workers:>8} | {elapsed:>7.3f} s | {size / elapsed / 10**6:>7.1f} MB/s | {baseline / elapsed:>6.2f}x")
@@ -0,0 +1,49 @@
+import argparse
+import random
+import tracemalloc
+
+from src.file_handlers.offsets import LineOffsets
+
+
+def measure(n_lines: int, average_line_length: int) -> tuple[float, float]:
+    """
+    Measure the memory needed to keep the offsets of a file with the provided number of lines, both as a list of
+    Python integers (previous implementation) and as a `LineOffsets` table
+    :param n_lines: Number of lines in the simulated file
+    :param average_line_length: Average number of bytes per line in the simulated file
+    :return: bytes per line used by the list, and bytes per line used by the `LineOffsets` table
+    """
+    def offsets():
+        offset = 0
+        for _ in range(n_lines):
+            yield offset
+            offset += random.randint(1, 2 * average_line_length)
+
+    results = []
+    for factory in (list, LineOffsets):
+        tracemalloc.start()
+        table = factory(offsets())
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(size / n_lines)
+        del table
+
+    return results[0], results[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Offsets memory benchmark",
+        description="Compares the memory used per line by a list of integers and by the LineOffsets table"
+    )
+    parser.add_argument("-l", "--lines", type=int, nargs="+", default=[10**4, 10**5, 10**6, 10**7],
+                        help="Number of lines of each simulated file")
+    parser.add_argument("-c", "--average-chars-per-line", type=int, default=1000,
+                        help="Average number of characters per line of each simulated file")
+    args = parser.parse_args()
+
+    print(f"{'Lines':>12} | {'File size':>10} | {'list[int]':>16} | {'LineOffsets':>16}")
+    for n in args.lines:
+        list_size, table_size = measure(n, args.average_chars_per_line)
+        file_size = n * args.average_chars_per_line / 10**9
+        print(f"{n:>12} | {file_size:>7.2f} GB | {list_size:>8.2f} B/line | {table_size:>8.2f} B/line")
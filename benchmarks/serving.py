@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from file_generator import generate_file
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers.reader import AsyncReader
+
+
+async def get_line_with_open(manager: FileManagerWithPreProcessing, line_index: int) -> str:
+    """Previous read path: the served file is opened, seeked and read in text mode for every line"""
+    with open(manager.path, "r") as f:
+        f.seek(manager.bytes_before_line[line_index])
+        return f.readline()
+
+
+async def run_load(get_line, manager: FileManagerWithPreProcessing, n_requests: int, concurrency: int) -> float:
+    """
+    Retrieve random lines from concurrent tasks, as the event loop would when serving simultaneous requests
+    :param get_line: Coroutine function retrieving a line from the manager
+    :param manager: Pre-processed file manager
+    :param n_requests: Total number of lines to retrieve
+    :param concurrency: Number of concurrent tasks
+    :return: number of lines retrieved per second
+    """
+    n_lines = len(manager.bytes_before_line)
+
+    async def worker(n: int) -> None:
+        for _ in range(n):
+            await get_line(manager, random.randrange(n_lines))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n_requests // concurrency) for _ in range(concurrency)))
+    return n_requests // concurrency * concurrency / (time.perf_counter() - start)
+
+
+async def main(path: os.PathLike, n_requests: int, concurrency: int, read_concurrency: int) -> None:
+    reader = AsyncReader(read_concurrency)
+    managers = {
+        "open/seek/readline": FileManagerWithPreProcessing(path, logging.getLogger(__name__)),
+        "mmap": FileManagerWithPreProcessing(path, logging.getLogger(__name__)),
+        "pread in thread pool": FileManagerWithPreProcessing(path, logging.getLogger(__name__), reader=reader),
+    }
+    for name, manager in managers.items():
+        manager.pre_process()
+        get_line = get_line_with_open if name == "open/seek/readline" else FileManagerWithPreProcessing.get_line
+        await run_load(get_line, manager, min(n_requests, 1000), concurrency)  # warm up the page cache
+        rps = await run_load(get_line, manager, n_requests, concurrency)
+        print(f"{name:>20}: {rps:>10.0f} lines/s")
+        manager.close()
+    reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Serving benchmark",
+        description="Compares how many random lines per second each read path serves under concurrent load"
+    )
+    parser.add_argument("path", type=str, nargs="?", help="File to serve. If omitted, a temporary file is generated")
+    parser.add_argument("-l", "--lines", type=int, default=100000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=2000,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-n", "--requests", type=int, default=100000, help="Number of lines to retrieve")
+    parser.add_argument("--concurrency", type=int, default=100, help="Number of concurrent tasks")
+    parser.add_argument("--read-concurrency", type=int, default=16,
+                        help="Number of threads reading lines, for the thread pool read path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file_path = args.path
+        if file_path is None:
+            file_path = Path(tmpdir, "fixture.txt")
+            generate_file(file_path, args.lines, args.max_chars_per_line, string.ascii_letters)
+        asyncio.run(main(file_path, args.requests, args.concurrency, args.read_concurrency))
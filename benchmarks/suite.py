@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from file_generator import generate_file
+from src import constants
+from src.file_handlers import scanner
+
+DISTRIBUTIONS = ("random", "sequential", "skewed")
+TARGETS = ("in-process", "uvicorn")
+FORMATS = ("text", "raw")  # lines returned as JSON strings, or as the raw bytes of the file
+RESULTS_DIRECTORY = Path(__file__).parent.joinpath("results")
+READY_TIMEOUT = 600  # seconds to wait for the served file to be pre-processed
+
+
+def line_indices(distribution: str, n_lines: int, n_requests: int, seed: int) -> list[int]:
+    """
+    :param distribution: How requested lines are distributed: "random" (uniformly), "sequential" (one after the other,
+        from the start of the file), or "skewed" (a few hot lines receive most requests, as their rank is drawn from a
+        log-uniform distribution; ranks are then scattered across the file, so hot lines are not next to each other)
+    :param n_lines: Number of lines of the served file
+    :param n_requests: Number of line indices to generate
+    :param seed: Seed of the random number generator, so that runs are reproducible
+    :return: index of the line requested by each request
+    """
+    rng = random.Random(seed)
+    if distribution == "random":
+        return [rng.randrange(n_lines) for _ in range(n_requests)]
+    if distribution == "sequential":
+        return [i % n_lines for i in range(n_requests)]
+    if distribution == "skewed":
+        scatter = 2654435761  # prime multiplier, coprime with most line counts, spreading consecutive ranks apart
+        return [(int(n_lines ** rng.random()) - 1) * scatter % n_lines for _ in range(n_requests)]
+    raise ValueError(f"Unknown distribution: {distribution}")
+
+
+def measure_indexing(path: os.PathLike, repeat: int) -> dict:
+    """
+    :param path: Path to the file to index
+    :param repeat: Number of runs; the best time is kept
+    :return: time taken to pre-process the file, and the resulting throughput
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        offsets = scanner.scan_line_offsets(path)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "seconds": best,
+        "mb_per_second": os.path.getsize(path) / best / 10**6,
+        "lines_per_second": len(offsets) / best,
+    }
+
+
+def measure_memory(path: os.PathLike) -> dict:
+    """
+    :param path: Path to the file to index
+    :return: memory allocated to keep the pre-processing result, and the size of the table itself, per line
+    """
+    tracemalloc.start()
+    offsets = scanner.scan_line_offsets(path)
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "allocated_bytes_per_line": allocated / len(offsets),
+        "peak_bytes_per_line": peak / len(offsets),
+        "table_bytes_per_line": offsets.nbytes / len(offsets),
+    }
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict:
+    """
+    :param latencies: Duration of each request, in seconds
+    :param elapsed: Duration of the whole run, in seconds
+    :param errors: Number of requests which did not succeed
+    :return: throughput of the run, and percentiles of the request latencies, in milliseconds
+    """
+    latencies = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(50),
+            "p90": percentile(90),
+            "p99": percentile(99),
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+async def run_load(client: httpx.AsyncClient, indices: list[int], concurrency: int, line_format: str = "text") -> dict:
+    """
+    Request lines with a fixed number of concurrent clients, each one sending its next request as soon as it receives
+    a response, until every line index was requested
+    :param client: HTTP client sending requests to the app
+    :param indices: Index of the line requested by each request
+    :param concurrency: Number of requests in flight at any time
+    :param line_format: Representation of the lines in the responses
+    :return: summary of the run
+    """
+    latencies = []
+    errors = 0
+    pending = iter(indices)  # shared by the clients, so each index is requested once
+
+    async def send_requests() -> None:
+        nonlocal errors
+        for line_index in pending:
+            start = time.perf_counter()
+            response = await client.get(f"/lines/{line_index}", params={"format": line_format})
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send_requests() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def wait_until_ready(client: httpx.AsyncClient) -> None:
+    """
+    :param client: HTTP client sending requests to the app
+    :raises TimeoutError: if the served file is not pre-processed in time
+    """
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:  # server not listening yet
+            pass
+        await asyncio.sleep(0.05)
+    raise TimeoutError("The served file was not pre-processed in time")
+
+
+@asynccontextmanager
+async def in_process_client(path: Path) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Run the app in this process, sending requests directly to it rather than through a socket, so that only the cost
+    of the app itself is measured
+    :param path: Path to the file to serve
+    :return: HTTP client sending requests to the app
+    """
+    constants.FILE_PATH_TO_SERVE = path
+    constants.INDEX_FILE_PATH = Path(f"{path}.idx")
+    from src import main  # imported once the constants are set
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(path: Path, concurrency: int, workers: int) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Run the app with uvicorn in another process, as it runs in production, sending requests through a local socket
+    :param path: Path to the file to serve
+    :param concurrency: Number of requests in flight at any time, which is also the number of open connections
+    :param workers: Number of uvicorn worker processes
+    :return: HTTP client sending requests to the app
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "FILE_PATH_TO_SERVE": str(path)}
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port),
+                               "--workers", str(workers), "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def measure_load(target: str, path: Path, n_lines: int, args: argparse.Namespace) -> list[dict]:
+    """
+    :param target: How the app is run: "in-process" or "uvicorn"
+    :param path: Path to the file to serve
+    :param n_lines: Number of lines of the served file
+    :param args: Command line arguments
+    :return: summary of a run for each distribution, format and concurrency level
+    """
+    results = []
+    for concurrency in args.concurrency:
+        app = in_process_client(path) if target == "in-process" else uvicorn_client(path, concurrency, args.workers)
+        async with app as client:
+            await wait_until_ready(client)
+            await run_load(client, line_indices("random", n_lines, args.warmup, args.seed), concurrency)
+            for distribution in args.distributions:
+                indices = line_indices(distribution, n_lines, args.requests, args.seed)
+                for line_format in args.formats:
+                    result = await run_load(client, indices, concurrency, line_format)
+                    results.append({"target": target, "distribution": distribution, "format": line_format,
+                                    "concurrency": concurrency, **result})
+                    print(f"{target:>10} | {distribution:>10} | {line_format:>6} | {concurrency:>11} "
+                          f"| {result['rps']:>8.0f} | {result['latency_ms']['p50']:>8.2f} ms "
+                          f"| {result['latency_ms']['p99']:>8.2f} ms | {result['errors']:>6}")
+    return results
+
+
+def git_commit() -> str | None:
+    """
+    :return: hash of the commit being benchmarked, with a "-dirty" suffix if there are uncommitted changes, or None if
+        it cannot be found
+    """
+    try:
+        cwd = Path(__file__).parent
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run(args: argparse.Namespace, path: Path) -> dict:
+    """
+    :param args: Command line arguments
+    :param path: Path to the file to serve, which is generated if it does not exist
+    :return: results of every benchmark, with the conditions they were obtained in
+    """
+    if not path.exists():
+        generate_file(path, args.lines, args.max_chars_per_line, string.ascii_letters + string.digits + " ",
+                      seed=args.seed, workers=os.cpu_count() or 1)
+    n_lines = len(scanner.scan_line_offsets(path))
+    size = os.path.getsize(path)
+    print(f"File size: {size / 10**6:.1f} MB, {n_lines} lines")
+
+    indexing = measure_indexing(path, args.repeat)
+    print(f"Indexing: {indexing['mb_per_second']:.1f} MB/s, {indexing['lines_per_second']:.0f} lines/s")
+    memory = measure_memory(path)
+    print(f"Index memory: {memory['allocated_bytes_per_line']:.2f} B/line")
+
+    print(f"{'Target':>10} | {'Access':>10} | {'Format':>6} | {'Concurrency':>11} | {'RPS':>8} | {'p50':>11} "
+          f"| {'p99':>11} | Errors")
+    load = []
+    for target in args.targets:
+        load.extend(asyncio.run(measure_load(target, path, n_lines, args)))
+
+    return {
+        "metadata": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "fixture": {"lines": n_lines, "bytes": size},
+        "indexing": indexing,
+        "memory": memory,
+        "load": load,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Benchmark suite",
+        description="Measures indexing throughput, index memory, and request throughput and latency under concurrent "
+                    "load, and saves the results as JSON, so they can be compared between commits"
+    )
+    parser.add_argument("path", type=str, nargs="?",
+                        help="File to serve. If omitted, a temporary file is generated from the seed")
+    parser.add_argument("-l", "--lines", type=int, default=200000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=200,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-n", "--requests", type=int, default=5000, help="Number of requests per run")
+    parser.add_argument("--warmup", type=int, default=500, help="Number of requests sent before the runs")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64],
+                        help="Numbers of requests in flight at any time")
+    parser.add_argument("-d", "--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS),
+                        help="How requested lines are distributed")
+    parser.add_argument("-f", "--formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="Representations of the lines requested: JSON strings, or raw bytes")
+    parser.add_argument("-t", "--targets", nargs="+", choices=TARGETS, default=list(TARGETS),
+                        help="How the app is run: in this process, or with uvicorn in another one")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of uvicorn worker processes")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of indexing runs; the best one is kept")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Seed of the generated file and requested lines")
+    parser.add_argument("-o", "--output", type=str,
+                        help=f"JSON file where results are saved. Defaults to {RESULTS_DIRECTORY}/COMMIT.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = run(args, Path(args.path).resolve() if args.path else Path(tmpdir, "fixture.txt"))
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIRECTORY.joinpath(f"{results['metadata']['commit'] or 'results'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
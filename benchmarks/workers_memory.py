@@ -0,0 +1,87 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from file_generator import generate_file
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+
+
+def proportional_memory() -> int:
+    """
+    :return: proportional set size of the current process, in bytes: memory shared with other processes only counts
+        for its share. Only available on Linux
+    """
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("Proportional set size not found")
+
+
+def worker(path: os.PathLike, index_path: os.PathLike | None, barrier, results) -> None:
+    """
+    Pre-process the file as an app worker would, and report the time it took and the memory it uses once every worker
+    holds its table
+    :param path: Path to the served file
+    :param index_path: Path to the index file shared by the workers, or None for each worker to keep its own table
+    :param barrier: Barrier shared by the workers, so they start and measure their memory at the same time
+    :param results: Queue where the time taken and the memory used are put
+    """
+    manager = FileManagerWithPreProcessing(path, logging.getLogger(__name__), index_path=index_path)
+    barrier.wait()
+    before = proportional_memory()
+    start = time.perf_counter()
+    table = manager.pre_process()
+    elapsed = time.perf_counter() - start
+    sum(table)  # make sure every page of the table is resident, as it would be after serving many requests
+    barrier.wait()
+    results.put((elapsed, proportional_memory() - before))
+    barrier.wait()
+
+
+def measure(path: os.PathLike, workers: int, index_path: os.PathLike | None) -> tuple[float, float]:
+    """
+    :param path: Path to the served file
+    :param workers: Number of worker processes pre-processing the file at the same time
+    :param index_path: Path to the index file shared by the workers, or None for each worker to keep its own table
+    :return: time until every worker is ready, in seconds, and total memory used by the tables of all workers, in bytes
+    """
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(path, index_path, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return max(elapsed for elapsed, _ in measurements), sum(memory for _, memory in measurements)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Workers memory benchmark",
+        description="Compares the startup time and memory of several app workers, with and without a shared index"
+    )
+    parser.add_argument("-l", "--lines", type=int, default=2000000, help="Number of lines of the generated file")
+    parser.add_argument("-c", "--max-chars-per-line", type=int, default=100,
+                        help="Maximum number of characters per line of the generated file")
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to measure")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir, "fixture.txt")
+        generate_file(path, args.lines, args.max_chars_per_line, string.ascii_letters)
+        print(f"File size: {os.path.getsize(path) / 10**6:.1f} MB, {args.lines} lines")
+        print(f"{'Workers':>8} | {'Private tables':>22} | {'Shared index':>22}")
+        for workers in args.workers:
+            private_time, private_memory = measure(path, workers, None)
+            index_path = Path(tmpdir, f"fixture.{workers}.idx")  # built by one of the workers
+            shared_time, shared_memory = measure(path, workers, index_path)
+            print(f"{workers:>8} | {private_time:>7.3f} s {private_memory / 10**6:>9.1f} MB "
+                  f"| {shared_time:>7.3f} s {shared_memory / 10**6:>9.1f} MB")
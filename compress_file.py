@@ -0,0 +1,35 @@
+import argparse
+import os
+from pathlib import Path
+
+from src.file_handlers import bgzf
+
+
+def compress_file(source: os.PathLike, destination: os.PathLike, level: int = 6) -> None:
+    """
+    Create or overwrite a block-compressed copy of a file, which the server serves without decompressing it entirely.
+    The file is compressed in blocks of up to 64 KiB of its contents, each one of them being a gzip member, so the
+    result can still be decompressed by any gzip tool. It is assumed that the destination directory already exists.
+    :param source: path to the file to compress
+    :param destination: path to the block-compressed file to create
+    :param level: compression level, from 1 (fastest) to 9 (smallest)
+    """
+    with open(Path(source).resolve(), "rb") as source_file, open(Path(destination).resolve(), "wb") as destination_file:
+        while data := source_file.read(bgzf.BLOCK_SIZE):
+            destination_file.write(bgzf.compress_block(data, level))
+        destination_file.write(bgzf.EOF_BLOCK)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="File compressor",
+        description="Creates a block-compressed copy of a file, whose lines can be served without decompressing it "
+                    "entirely"
+    )
+    parser.add_argument("path", type=str, help="Path to the file to compress")
+    parser.add_argument("-o", "--output", type=str, help="Path to the file to create. Defaults to the path with .gz")
+    parser.add_argument("--level", type=int, default=6, choices=range(1, 10), metavar="[1-9]",
+                        help="Compression level, from 1 (fastest) to 9 (smallest)")
+    args = parser.parse_args()
+
+    compress_file(args.path, args.output if args.output is not None else f"{args.path}.gz", args.level)
@@ -2,37 +2,158 @@ import argparse
 import os
 import random
 import string
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
 from pathlib import Path
 
+from src.file_handlers.offsets import LineOffsets, OFFSET_TYPECODE
 
-def generate_file(path: os.PathLike, n_lines: int, max_characters_per_line: int,
-                  character_pool: str) -> None:
+BATCH_SIZE = 8 * 1024 * 1024  # approximate number of bytes generated and written at a time
+
+
+def generate_file(path: os.PathLike, n_lines: int, max_characters_per_line: int, character_pool: str,
+                  seed: int | None = None, workers: int = 1, index_path: os.PathLike | None = None) -> None:
     """
     Create or overwrite a file on the provided path, and populate it with the provided number of lines, with a
     random number of characters (up to a given limit per line), selected randomly from a predefined pool, per line.
-    It is assumed that the directory already exists.
+    Lines are generated in batches of about 8 MB, each one of them from its own random generator seeded from `seed`,
+    so the file only depends on the seed, and batches can be generated and written in parallel, at their final
+    position in the file. It is assumed that the directory already exists.
     :param path: path to the file to generate
     :param n_lines: number of lines to generate as the file contents
     :param max_characters_per_line: maximum number of characters to write per line
+    :param character_pool: pool of up to 256 ASCII characters to select randomly from
+    :param seed: seed of the generated contents. If not provided, it is drawn from the `random` module
+    :param workers: number of processes generating and writing batches of lines in parallel
+    :param index_path: optional path to a file where the number of bytes before each line begins is written, as
+        unsigned 64-bit integers in the byte order of the machine (see `load_offsets`)
+    :raises ValueError: if the character pool is empty, too large or contains non-ASCII characters
+    """
+    pool = _encode_pool(character_pool)
+    if seed is None:
+        seed = random.getrandbits(64)
+    lines_per_batch = max(BATCH_SIZE // (max_characters_per_line // 2 + 1), 1)
+
+    # the lengths of the lines are drawn first, so that the position of every batch is known before it is generated
+    batches = []
+    offsets = LineOffsets() if index_path is not None else None
+    position = 0
+    for batch, first_line in enumerate(range(0, n_lines, lines_per_batch)):
+        n_batch_lines = min(lines_per_batch, n_lines - first_line)
+        lengths = _line_lengths(random.Random(f"{seed}:{batch}"), n_batch_lines, max_characters_per_line)
+        if offsets is not None:
+            offsets.extend(accumulate((length + 1 for length in lengths[:-1]), initial=position))
+        batches.append((position, n_batch_lines, batch))
+        position += sum(lengths) + n_batch_lines
+
+    path = Path(path).resolve()
+    with open(path, "wb") as f:
+        f.truncate(position)
+    arguments = [(path, *batch, max_characters_per_line, seed, pool) for batch in batches]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            for future in [executor.submit(_generate_batch, *batch_arguments) for batch_arguments in arguments]:
+                future.result()
+    else:
+        for batch_arguments in arguments:
+            _generate_batch(*batch_arguments)
+
+    if offsets is not None:
+        with open(Path(index_path).resolve(), "wb") as f:
+            offsets.buffer.tofile(f)
+
+
+def load_offsets(index_path: os.PathLike) -> LineOffsets:
+    """
+    Read the offsets written by `generate_file`, to check the offsets computed by the server against them
+    :param index_path: path to the file where the offsets were written
+    :return: table representing the number of bytes before the n-th line of the generated file begins
+    """
+    offsets = array(OFFSET_TYPECODE)
+    offsets.frombytes(Path(index_path).resolve().read_bytes())
+    return LineOffsets(offsets)
+
+
+def _encode_pool(character_pool: str) -> bytes:
+    """
+    Internal function to convert the pool of characters to the bytes they are written as
     :param character_pool: pool of characters to select randomly from
+    :raises ValueError: if the character pool is empty, too large or contains non-ASCII characters
+    :return: byte of each character of the pool
     """
-    with open(Path(path).resolve(), "w") as f:
-        for _ in range(n_lines):
-            line = generate_line(max_characters_per_line, character_pool)
-            f.write(line)
+    if not 0 < len(character_pool) <= 256:
+        raise ValueError("The character pool must contain between 1 and 256 characters")
+    try:
+        return character_pool.encode("ascii")
+    except UnicodeEncodeError:
+        raise ValueError("The character pool must only contain ASCII characters")
 
 
-def generate_line(max_chars: int, char_pool: str) -> str:
+def _line_lengths(rng: random.Random, n_lines: int, max_chars: int) -> list[int]:
     """
-    Generate a line by selecting a character from a predefined string, and repeating this process up to the
-    provided maximum number of characters. It is possible that a line is empty if the randomly selected
-    number of characters is 0
+    Internal function to draw the number of characters of each line of a batch. It is possible that a line is empty
+    if the randomly selected number of characters is 0
+    :param rng: random generator of the batch
+    :param n_lines: number of lines of the batch
     :param max_chars: maximum number of characters to write per line
-    :param char_pool: pool of characters to select randomly from
-    :return: generated line, including the newline character
+    :return: number of characters of each line, excluding the newline character
+    """
+    return rng.choices(range(max_chars + 1), k=n_lines)
+
+
+def _random_characters(rng: random.Random, n_chars: int, pool: bytes) -> bytes:
+    """
+    Internal function to select characters randomly from a pool, in bulk: random bytes are mapped onto the pool, and
+    the bytes beyond the largest multiple of the size of the pool are discarded, so every character is equally likely
+    :param rng: random generator of the batch
+    :param n_chars: number of characters to select
+    :param pool: byte of each character of the pool
+    :return: selected characters
     """
-    n_chars = random.randint(0, max_chars)
-    return "".join(random.choices(char_pool, k=n_chars)) + "\n"
+    table = bytes(pool[byte % len(pool)] for byte in range(256))
+    kept = 256 - 256 % len(pool)
+    discarded = bytes(range(kept, 256))
+    parts = []
+    while n_chars > 0:
+        # slightly more bytes than expected to be kept are drawn, so a second draw is rarely needed
+        part = rng.randbytes(n_chars * 256 // kept + n_chars // 64 + 16).translate(table, discarded)[:n_chars]
+        parts.append(part)
+        n_chars -= len(part)
+    return b"".join(parts)
+
+
+def _generate_batch(path: Path, position: int, n_lines: int, batch: int, max_chars: int, seed: int,
+                    pool: bytes) -> None:
+    """
+    Internal function to generate a batch of lines, and write it at its position in the file, with a single call
+    :param path: path to the file to populate, which already has its final size
+    :param position: number of bytes in the file before the batch begins
+    :param n_lines: number of lines of the batch
+    :param batch: index of the batch, from which its random generator is seeded
+    :param max_chars: maximum number of characters to write per line
+    :param seed: seed of the generated contents
+    :param pool: byte of each character of the pool
+    """
+    rng = random.Random(f"{seed}:{batch}")
+    lengths = _line_lengths(rng, n_lines, max_chars)
+    characters = _random_characters(rng, sum(lengths), pool)
+    lines = []
+    start = 0
+    for length in lengths:
+        lines.append(characters[start:start + length])
+        start += length
+    lines.append(b"")  # so that the last line ends with a newline character too
+    content = memoryview(b"\n".join(lines))
+
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        while content:
+            written = os.pwrite(fd, content, position)
+            content = content[written:]
+            position += written
+    finally:
+        os.close(fd)
 
 
 if __name__ == "__main__":
@@ -45,7 +166,14 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--lines", type=int, default=1000, help="Number of lines to create")
     parser.add_argument("-c", "--max-chars-per-line", type=int, default=1000,
                         help="Maximum number of characters to create per line")
+    parser.add_argument("-s", "--seed", type=int, help="Seed of the contents, so that the same file can be created "
+                                                       "again. Random by default")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of processes creating the file in parallel")
+    parser.add_argument("-i", "--index", type=str,
+                        help="Path to a file where the number of bytes before each line begins is written, as unsigned "
+                             "64-bit integers")
     args = parser.parse_args()
 
     pool = string.ascii_letters + string.digits + string.punctuation + " \t"
-    generate_file(args.path, args.lines, args.max_chars_per_line, pool)
+    generate_file(args.path, args.lines, args.max_chars_per_line, pool, args.seed, args.workers, args.index)
@@ -3,5 +3,10 @@ if [[ $# -eq 0 ]] ; then
   exit 1
 fi
 
-export FILE_PATH_TO_SERVE="$1"
-poetry run uvicorn src.main:app --reload
+if [[ -d "$1" ]] ; then
+  export FILES_TO_SERVE="$1"
+else
+  export FILE_PATH_TO_SERVE="$1"
+fi
+# Seconds an idle connection is kept open, so that clients and proxies sending many requests reuse their connections
+poetry run uvicorn src.main:app --reload --timeout-keep-alive "${KEEP_ALIVE_TIMEOUT:-5}"
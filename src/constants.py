@@ -3,4 +3,42 @@ from pathlib import Path
 
 
 FILENAME = os.getenv("FILENAME", ".base.txt")
-FILE_PATH_TO_SERVE = Path(os.getenv("FILE_PATH_TO_SERVE", Path(__file__).parent.parent.joinpath(FILENAME))).resolve()
+# Directory whose files are all served, or JSON manifest mapping names to the paths of the files to serve, under /files
+FILES_TO_SERVE = Path(os.environ["FILES_TO_SERVE"]).resolve() if os.getenv("FILES_TO_SERVE") else None
+# File served under /lines. When FILES_TO_SERVE is set, there is none unless this is set too
+FILE_PATH_TO_SERVE = Path(os.getenv("FILE_PATH_TO_SERVE", Path(__file__).parent.parent.joinpath(FILENAME))).resolve() \
+    if os.getenv("FILE_PATH_TO_SERVE") or FILES_TO_SERVE is None else None
+# Number of processes scanning byte ranges of the served file in parallel during the pre-processing step
+INDEXING_WORKERS = int(os.getenv("INDEXING_WORKERS", "1"))
+# Pre-processing result is persisted next to the served file, so that restarts do not need to read the entire file
+PERSIST_INDEX = os.getenv("PERSIST_INDEX", "true").lower() in ("1", "true", "yes")
+# File where the pre-processing result of the file served under /lines is persisted. There is none without such a file
+INDEX_FILE_PATH = Path(os.getenv("INDEX_FILE_PATH", f"{FILE_PATH_TO_SERVE}.idx")).resolve() \
+    if FILE_PATH_TO_SERVE is not None else None
+# Encoding of the served files, used to decode lines returned as text. Lines are split on b"\n" bytes, so it must be
+# ASCII-compatible (UTF-8, Latin-1, ...). Bytes which cannot be decoded are replaced with U+FFFD
+FILE_ENCODING = os.getenv("FILE_ENCODING", "utf-8")
+# Cache-Control header of the lines returned with `format=raw` or `format=plain`, along with an ETag header. Clients and
+# caches revalidate them after this long, which costs no file read when they did not change
+CACHE_CONTROL = os.getenv("CACHE_CONTROL", "public, max-age=60")
+# Maximum number of lines read at the same time in a thread pool, outside the event loop. 0 reads in the event loop
+READ_CONCURRENCY = int(os.getenv("READ_CONCURRENCY", "16"))
+# Maximum number of lines retrieved by a single batch or range request
+MAX_LINES_PER_REQUEST = int(os.getenv("MAX_LINES_PER_REQUEST", "10000"))
+# Maximum number of bytes read from the served file at a time when streaming lines
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+# Maximum total size, in bytes, of the recently retrieved lines kept in memory. 0 disables the cache
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Maximum total size, in bytes, of the recently decompressed blocks of each block-compressed served file kept in memory.
+# 0 disables the cache
+BLOCK_CACHE_MAX_BYTES = int(os.getenv("BLOCK_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Number of seconds between checks of whether the served file changed, in the background. Appended lines are indexed
+# incrementally, and a rewritten file is pre-processed again. 0 disables the checks
+FILE_VALIDATION_INTERVAL = float(os.getenv("FILE_VALIDATION_INTERVAL", "1"))
+# Maximum number of seconds clients are asked to wait for the pre-processing step before retrying a request
+MAX_RETRY_AFTER = int(os.getenv("MAX_RETRY_AFTER", "60"))
+# Maximum total size, in bytes, of the offsets tables of the files served under /files which are kept loaded, and of
+# their decompressed blocks kept in memory
+INDEX_MEMORY_BUDGET = int(os.getenv("INDEX_MEMORY_BUDGET", str(256 * 1024 * 1024)))
+# Maximum number of files served under /files which are kept open
+MAX_OPEN_FILES = int(os.getenv("MAX_OPEN_FILES", "128"))
@@ -0,0 +1,221 @@
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from src.file_handlers import scanner
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.offsets import LineOffsets, OFFSET_TYPECODE
+from src.file_handlers.progress import IndexingProgress
+
+# Block-compressed files follow the BGZF format: a series of gzip members (blocks), each holding at most 64 KiB of the
+# decompressed contents, with the size of the compressed block stored in an extra field of its gzip header. Standard
+# gzip tools decompress them as any gzip file, while a block can be located and decompressed on its own.
+BLOCK_SIZE = 0xff00  # decompressed bytes per block, so that a compressed block always fits in 64 KiB
+MAX_BLOCK_SIZE = 0x10000  # size of the largest compressed block, header and trailer included
+# gzip header with a single extra subfield "BC", holding the size of the compressed block minus 1
+HEADER = struct.Struct("<4BI2BH2BHH")
+TRAILER = struct.Struct("<2I")  # CRC32 and size of the decompressed block
+GZIP_MAGIC = b"\x1f\x8b\x08\x04"  # gzip identification, DEFLATE compression method and FEXTRA flag
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")  # empty block ending a file
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """
+    :param data: Decompressed contents of the block, of at most `BLOCK_SIZE` bytes
+    :param level: Compression level, from 1 (fastest) to 9 (smallest)
+    :return: compressed block, with its header and trailer
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)  # raw DEFLATE stream, the gzip framing is written here
+    compressed = compressor.compress(data) + compressor.flush()
+    block_size = HEADER.size + len(compressed) + TRAILER.size
+    header = HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, block_size - 1)
+    return header + compressed + TRAILER.pack(zlib.crc32(data), len(data))
+
+
+def is_block_compressed(path: os.PathLike) -> bool:
+    """
+    :param path: Path to a file
+    :return: whether the file starts with a block of a block-compressed file. False if it cannot be read
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(MAX_BLOCK_SIZE)
+        _block_size(header, 0)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _block_size(buffer: bytes | memoryview, offset: int) -> int:
+    """
+    Internal method to read the size of a compressed block from the extra field of its header
+    :param buffer: Bytes holding the header of the block
+    :param offset: Position of the block in the buffer
+    :raises ValueError: if the buffer does not hold the header of a block at this position
+    :return: size of the compressed block, header and trailer included
+    """
+    if buffer[offset:offset + 4] != GZIP_MAGIC or len(buffer) < offset + 12:
+        raise ValueError("Not a block-compressed file")
+    extra_length, = struct.unpack_from("<H", buffer, offset + 10)
+    position, end = offset + 12, offset + 12 + extra_length
+    if len(buffer) < end:
+        raise ValueError("Truncated block header")
+    while position + 4 <= end:
+        subfield_id, subfield_length = buffer[position:position + 2], struct.unpack_from("<H", buffer, position + 2)[0]
+        if subfield_id == b"BC" and subfield_length == 2:
+            return struct.unpack_from("<H", buffer, position + 4)[0] + 1
+        position += 4 + subfield_length
+    raise ValueError("Not a block-compressed file")
+
+
+def decompress_block(buffer: bytes | memoryview, offset: int = 0) -> bytes:
+    """
+    :param buffer: Bytes holding an entire compressed block, such as the contents of the file
+    :param offset: Position of the block in the buffer
+    :raises ValueError: if the buffer does not hold a block at this position
+    :return: decompressed contents of the block
+    """
+    block_size = _block_size(buffer, offset)
+    extra_length, = struct.unpack_from("<H", buffer, offset + 10)
+    try:
+        return zlib.decompress(buffer[offset + 12 + extra_length:offset + block_size - TRAILER.size], -15)
+    except zlib.error as e:
+        raise ValueError(f"Corrupted block at position {offset}: {e}")
+
+
+def read_block(fd: int, offset: int) -> bytes:
+    """
+    Read a block of an open file with `os.pread`, and decompress it. Both release the GIL, so this can run in a thread
+    :param fd: File descriptor of the block-compressed file
+    :param offset: Position of the block in the file
+    :raises ValueError: if there is no block at this position
+    :return: decompressed contents of the block
+    """
+    return decompress_block(os.pread(fd, MAX_BLOCK_SIZE, offset))
+
+
+class BlockIndex:
+    """
+    Position of each block of a block-compressed file, both in the compressed file and in its decompressed contents, so
+    that the block holding any decompressed position is found with a binary search. Empty blocks are left out
+    """
+    __slots__ = ("offsets", "positions", "size")
+
+    def __init__(self) -> None:
+        self.offsets = array(OFFSET_TYPECODE)  # position of each block in the compressed file
+        self.positions = array(OFFSET_TYPECODE)  # position of the first byte of each block in the decompressed contents
+        self.size = 0  # size of the decompressed contents of the blocks indexed so far
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def append(self, offset: int, decompressed_size: int) -> None:
+        """
+        :param offset: Position of the next block in the compressed file
+        :param decompressed_size: Size of the decompressed contents of the block
+        """
+        self.offsets.append(offset)  # before its position, so that a block found by a reader always has an offset
+        self.positions.append(self.size)
+        self.size += decompressed_size
+
+    def find(self, position: int) -> int:
+        """
+        :param position: Position in the decompressed contents, which must be indexed already
+        :return: index of the block holding this position
+        """
+        return bisect_right(self.positions, position) - 1
+
+
+def iter_blocks(f: BinaryIO, decompress: bool = True,
+                end: int | None = None) -> Iterator[tuple[int, int, bytes | None]]:
+    """
+    Read the blocks of a block-compressed file, from its current position
+    :param f: Block-compressed file, opened in binary mode
+    :param decompress: Whether the blocks are decompressed. If not, only their headers and trailers are read
+    :param end: Position in the file where reading stops, if not at its end
+    :raises ValueError: if the file is not block-compressed or is truncated
+    :return: iterator over the position of each block in the file, the size of its decompressed contents and, if
+        decompressed, its contents
+    """
+    offset = f.tell()
+    while (end is None or offset < end) and (header := f.read(12)):
+        if len(header) == 12:
+            header += f.read(struct.unpack_from("<H", header, 10)[0])  # extra field, holding the block size
+        block_size = _block_size(header, 0)
+        if decompress:
+            block = header + f.read(block_size - len(header))
+            trailer = block[-TRAILER.size:] if len(block) == block_size else b""
+        else:
+            f.seek(offset + block_size - TRAILER.size)
+            block, trailer = None, f.read(TRAILER.size)
+        if len(trailer) < TRAILER.size:
+            raise ValueError(f"Truncated block at position {offset}")
+
+        crc, decompressed_size = TRAILER.unpack(trailer)
+        data = decompress_block(block) if decompress else None
+        if data is not None and (len(data) != decompressed_size or zlib.crc32(data) != crc):
+            raise ValueError(f"Corrupted block at position {offset}")
+        yield offset, decompressed_size, data
+        offset += block_size
+
+
+def read_block_index(path: os.PathLike, size: int | None = None) -> BlockIndex:
+    """
+    Index the blocks of a block-compressed file, reading only their headers and trailers
+    :param path: Path to the block-compressed file
+    :param size: Number of bytes of the file holding the blocks to index. Defaults to its current size
+    :raises ValueError: if the file is not block-compressed or is truncated
+    :return: position of each block
+    """
+    blocks = BlockIndex()
+    with open(path, "rb") as f:
+        for offset, decompressed_size, _ in iter_blocks(f, decompress=False, end=size):
+            if decompressed_size:
+                blocks.append(offset, decompressed_size)
+    return blocks
+
+
+def scan_line_offsets(path: os.PathLike, offsets: LineOffsets | None = None, blocks: BlockIndex | None = None,
+                      progress: IndexingProgress | None = None,
+                      size: int | None = None) -> tuple[LineOffsets, BlockIndex]:
+    """
+    Decompress the entire block-compressed file, one block at a time, and compute the number of decompressed bytes
+    before each line begins, along with the position of each block
+    :param path: Path to the block-compressed file
+    :param offsets: Optional empty table to populate, so that the offsets found so far can be used while the file is
+        being scanned. Until the scan is done, the last offset may belong to a line which is not complete yet
+    :param blocks: Optional empty block index to populate. A block is indexed before the lines it holds
+    :param progress: Optional progress to update after each block is scanned, in compressed bytes
+    :param size: Number of bytes of the file to scan, such as its size when its signature was computed, so that blocks
+        appended while it is scanned are left for the next scan. Defaults to its current size
+    :raises FileNotFoundError: if the file does not exist
+    :raises ValueError: if the file is not block-compressed or is corrupted
+    :raises IndexingCancelledError: if the progress is cancelled before the scan is done
+    :return: table representing the number of decompressed bytes before the n-th line begins, and the block index
+    """
+    offsets = offsets if offsets is not None else LineOffsets()
+    blocks = blocks if blocks is not None else BlockIndex()
+    progress = progress if progress is not None else IndexingProgress()
+    progress.total_bytes = size if size is not None else os.path.getsize(path)
+
+    with open(path, "rb") as f:
+        for offset, decompressed_size, data in iter_blocks(f, end=progress.total_bytes):
+            if progress.cancelled:
+                raise IndexingCancelledError()
+            if decompressed_size:
+                position = blocks.size
+                blocks.append(offset, decompressed_size)
+                if position == 0:
+                    offsets.append(0)
+                offsets.extend(scanner.find_chunk_line_starts(data, position))
+            progress.update(f.tell(), len(offsets))
+
+    if len(offsets) > 1 and offsets[-1] == blocks.size:
+        offsets.pop()  # a newline at the end of the file does not start a new line
+    progress.update(progress.total_bytes, len(offsets))
+
+    return offsets, blocks
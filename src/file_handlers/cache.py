@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+
+class LineCache:
+    """
+    Least-recently-used cache of line contents, bounded by the total number of bytes it holds rather than by its number
+    of entries, so that a few very long lines cannot use an unbounded amount of memory
+    """
+    def __init__(self, max_bytes: int) -> None:
+        """
+        :param max_bytes: Maximum total size of the cached lines. Lines larger than this are never cached
+        """
+        self.max_bytes = max_bytes
+        self.size = 0  # total size of the cached lines, in bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lines: OrderedDict[int, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups that found the line in the cache, or 0 if there were no lookups"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, line_index: int) -> bytes | None:
+        """
+        :param line_index: Index of the line to look up
+        :return: cached line contents, or None if the line is not cached
+        """
+        line = self._lines.get(line_index)
+        if line is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._lines.move_to_end(line_index)
+        return line
+
+    def put(self, line_index: int, line: bytes) -> None:
+        """
+        Cache the contents of a line, evicting the least recently used lines until it fits
+        :param line_index: Index of the line
+        :param line: Line contents
+        """
+        if len(line) > self.max_bytes:
+            return
+
+        previous = self._lines.pop(line_index, None)
+        if previous is not None:
+            self.size -= len(previous)
+
+        while self.size + len(line) > self.max_bytes:
+            _, evicted = self._lines.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+        self._lines[line_index] = line
+        self.size += len(line)
+
+    def discard(self, line_index: int) -> None:
+        """
+        Remove a line from the cache, if it is cached, for instance because it was not complete yet
+        :param line_index: Index of the line
+        """
+        line = self._lines.pop(line_index, None)
+        if line is not None:
+            self.size -= len(line)
+
+    def clear(self) -> None:
+        """Remove all cached lines, for instance because the served file changed. Counters are kept"""
+        self._lines.clear()
+        self.size = 0
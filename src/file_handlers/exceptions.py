@@ -1,2 +1,14 @@
 class LineIndexOutOfRangeError(IndexError):
     """Exception raised when the provided line index is beyond the end of the file"""
+
+
+class IndexNotReadyError(LookupError):
+    """Exception raised when the requested line has not been reached yet by the pre-processing step"""
+
+
+class IndexingCancelledError(Exception):
+    """Exception raised when the pre-processing step is cancelled before it is done"""
+
+
+class UnknownFileError(KeyError):
+    """Exception raised when no file is served under the provided name"""
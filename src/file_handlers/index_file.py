@@ -0,0 +1,227 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import cached_property
+from pathlib import Path
+
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.offsets import LineOffsets, OFFSET_TYPECODE
+
+INDEX_FILE_SUFFIX = ".idx"
+LOCK_FILE_SUFFIX = ".lock"
+LOCK_POLL_INTERVAL = 0.05  # seconds between attempts to acquire the lock of an index file held by another process
+FINGERPRINT_BLOCK_SIZE = 64 * 1024  # bytes hashed at the start of the file and right before its end
+
+# magic (8 bytes, last one being the byte order), file size, mtime in ns, number of lines, head digest, tail digest
+_HEADER = struct.Struct("<8sQqQ16s16s")
+_MAGIC = b"LSIDX1" + b"\x00" + (b"<" if sys.byteorder == "little" else b">")
+_OFFSET_SIZE = 8
+
+
+class FileSignature:
+    """Identifies a given version of the served file, so a persisted index can be validated against it"""
+    def __init__(self, size: int, mtime_ns: int, head_digest: bytes, tail_digest: bytes) -> None:
+        """
+        :param size: Size of the file, in bytes
+        :param mtime_ns: Last modification time of the file, in nanoseconds
+        :param head_digest: Digest of the first bytes of the file
+        :param tail_digest: Digest of the last bytes of the file
+        """
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.head_digest = head_digest
+        self.tail_digest = tail_digest
+
+    @classmethod
+    def of(cls, path: os.PathLike) -> "FileSignature":
+        """
+        Compute the signature of a file. Only a bounded number of bytes is read, regardless of the file size
+        :param path: Path to the file
+        :raises FileNotFoundError: if the file does not exist
+        :return: signature of the file
+        """
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            head_digest = _digest(f, 0, stat.st_size)
+            tail_digest = _digest(f, max(stat.st_size - FINGERPRINT_BLOCK_SIZE, 0), stat.st_size)
+        return cls(stat.st_size, stat.st_mtime_ns, head_digest, tail_digest)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Short hexadecimal digest of the signature, which changes whenever the file does, such as in entity tags"""
+        header = struct.pack("<Qq", self.size, self.mtime_ns)
+        return hashlib.blake2b(header + self.head_digest + self.tail_digest, digest_size=8).hexdigest()
+
+    def is_prefix_of(self, path: os.PathLike) -> bool:
+        """
+        Tell whether a file starts with the version of the file identified by this signature, meaning that it was only
+        appended to since. Like the signature itself, only a bounded number of bytes is compared
+        :param path: Path to the file
+        :raises FileNotFoundError: if the file does not exist
+        :return: whether the file starts with the same bytes as the version identified by this signature
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < self.size:
+                return False
+            return _digest(f, 0, self.size) == self.head_digest and \
+                _digest(f, max(self.size - FINGERPRINT_BLOCK_SIZE, 0), self.size) == self.tail_digest
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FileSignature):
+            return NotImplemented
+        return (self.size, self.mtime_ns, self.head_digest, self.tail_digest) == \
+            (other.size, other.mtime_ns, other.head_digest, other.tail_digest)
+
+
+def _digest(f, start: int, size: int) -> bytes:
+    """
+    :param f: File opened in binary mode
+    :param start: Position of the first byte to hash
+    :param size: Size of the file, so that no more than `FINGERPRINT_BLOCK_SIZE` bytes are hashed
+    :return: digest of up to `FINGERPRINT_BLOCK_SIZE` bytes of the file, starting at `start`
+    """
+    f.seek(start)
+    return hashlib.blake2b(f.read(min(FINGERPRINT_BLOCK_SIZE, size - start)), digest_size=16).digest()
+
+
+def index_path_for(path: os.PathLike) -> Path:
+    """
+    :param path: Path to the served file
+    :return: default path of the index file, stored next to the served file
+    """
+    path = Path(path)
+    return path.with_name(path.name + INDEX_FILE_SUFFIX)
+
+
+@contextmanager
+def lock_index(index_path: os.PathLike, cancelled: Callable[[], bool] = lambda: False) -> Iterator[None]:
+    """
+    Hold an exclusive lock on an index file, so that when several processes (e.g. uvicorn workers) serve the same file,
+    only one of them builds the index while the others wait for it to be persisted, and then map it. The lock is
+    released by the operating system if the process holding it dies. If the lock file cannot be created (e.g. read-only
+    directory), no lock is held
+    :param index_path: Path of the index file
+    :param cancelled: Function telling whether to stop waiting for the lock
+    :raises IndexingCancelledError: if `cancelled` returns True while waiting for the lock
+    """
+    index_path = Path(index_path)
+    try:
+        fd = os.open(index_path.with_name(index_path.name + LOCK_FILE_SUFFIX), os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if cancelled():
+                    raise IndexingCancelledError()
+                time.sleep(LOCK_POLL_INTERVAL)
+        yield
+    finally:
+        os.close(fd)  # also releases the lock
+
+
+def save_index(index_path: os.PathLike, signature: FileSignature, bytes_before_line: LineOffsets) -> None:
+    """
+    Persist the pre-processing result in a compact binary file: a fixed size header followed by one unsigned 64-bit
+    integer per line. The file is written to a temporary location first and then moved, so that readers never see a
+    partially written index
+    :param index_path: Path of the index file to create or overwrite
+    :param signature: Signature of the served file at the moment the pre-processing step started
+    :param bytes_before_line: Number of bytes in the served file before the n-th line begins
+    :raises OSError: if the index file cannot be written
+    """
+    index_path = Path(index_path)
+    header = _HEADER.pack(_MAGIC, signature.size, signature.mtime_ns, len(bytes_before_line), signature.head_digest,
+                          signature.tail_digest)
+
+    tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(bytes_before_line.buffer)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def append_index(index_path: os.PathLike, signature: FileSignature, offsets: LineOffsets) -> None:
+    """
+    Add the offsets of lines appended to the served file to a persisted index, in place, so that it matches the new
+    version of the served file without being written again entirely. The offsets are written before the header, so a
+    reader never sees a header describing offsets which were not written yet. Processes which mapped the index before
+    keep seeing its previous contents
+    :param index_path: Path of the index file, which must be valid and describe a prefix of the served file
+    :param signature: Signature of the served file, once lines were appended to it
+    :param offsets: Number of bytes in the served file before each of the appended lines begins
+    :raises OSError: if the index file cannot be written
+    :raises ValueError: if the index file is missing, corrupted or does not match its expected size
+    """
+    with open(index_path, "r+b") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"Index file {index_path} is corrupted")
+        magic, _, _, n_lines, _, _ = _HEADER.unpack(header)
+        end = _HEADER.size + n_lines * _OFFSET_SIZE
+        if magic != _MAGIC or os.fstat(f.fileno()).st_size != end:
+            raise ValueError(f"Index file {index_path} is corrupted")
+
+        f.seek(end)
+        f.write(offsets.buffer)
+        f.flush()
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, signature.size, signature.mtime_ns, n_lines + len(offsets),
+                             signature.head_digest, signature.tail_digest))
+
+
+def read_index(index_path: os.PathLike) -> tuple[FileSignature, LineOffsets] | None:
+    """
+    Memory-map a persisted index, if it exists, whatever version of the served file it was built for. The returned view
+    reads the offsets directly from the page cache, so no time is spent parsing the file and memory is shared between
+    processes
+    :param index_path: Path of the index file
+    :return: signature of the served file the index was built for, and read-only table of the number of bytes before
+        the n-th line begins, or None if the index file is missing or corrupted
+    """
+    try:
+        with open(index_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # missing, unreadable or empty file
+        return None
+
+    if len(mapped) < _HEADER.size:
+        mapped.close()
+        return None
+
+    magic, size, mtime_ns, n_lines, head_digest, tail_digest = _HEADER.unpack_from(mapped)
+    if magic != _MAGIC or len(mapped) != _HEADER.size + n_lines * _OFFSET_SIZE:
+        mapped.close()
+        return None
+
+    offsets = LineOffsets(memoryview(mapped)[_HEADER.size:].cast(OFFSET_TYPECODE))
+    return FileSignature(size, mtime_ns, head_digest, tail_digest), offsets
+
+
+def load_index(index_path: os.PathLike, signature: FileSignature) -> LineOffsets | None:
+    """
+    Memory-map a persisted index, if it exists and matches the served file
+    :param index_path: Path of the index file
+    :param signature: Current signature of the served file
+    :return: read-only table of the number of bytes before the n-th line begins, or None if the index file is missing,
+        corrupted or outdated
+    """
+    persisted = read_index(index_path)
+    if persisted is None or persisted[0] != signature:
+        return None
+    return persisted[1]
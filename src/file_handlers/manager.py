@@ -4,17 +4,20 @@ import os
 from pathlib import Path
 
 from src.file_handlers.exceptions import LineIndexOutOfRangeError
+from src.file_handlers.reader import AsyncReader
 
 
 class FileManager:
     """Class responsible for handling the file to serve"""
-    def __init__(self, path: os.PathLike, logger: logging.Logger) -> None:
+    def __init__(self, path: os.PathLike, logger: logging.Logger, reader: AsyncReader | None = None) -> None:
         """
         :param path: Path to the file to serve, which must exist. Otherwise, HTTP 500 will be raised
         :param logger: Logger instance
+        :param reader: Optional thread pool where the file is read, outside the event loop
         """
         self.path = Path(path).resolve()
         self.logger = logger
+        self.reader = reader
 
     async def get_line(self, line_index: int) -> str:
         """
@@ -23,6 +26,17 @@ class FileManager:
         :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
         :return: line text
         """
+        if self.reader is None:
+            return self._read_line(line_index)
+        return await self.reader.run(self._read_line, line_index)
+
+    def _read_line(self, line_index: int) -> str:
+        """
+        Internal method to read the file until the n-th line, which blocks until it is found
+        :param line_index: Index of the line to retrieve. Indices start at 0
+        :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
+        :return: line text
+        """
         try:
             with open(self.path, "r") as f:
                 return next(itertools.islice(f, line_index, line_index+1))
@@ -0,0 +1,173 @@
+import logging
+import os
+
+from src.file_handlers import bgzf, index_file
+from src.file_handlers.cache import LineCache
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing, FileState
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.reader import AsyncReader
+from src.metrics import ServingMetrics
+
+
+class CompressedFileState(FileState):
+    """Version of the block-compressed file being served, along with the index of its blocks"""
+    def __init__(self, offsets: LineOffsets | None = None, signature: index_file.FileSignature | None = None) -> None:
+        """
+        :param offsets: Table representing the number of decompressed bytes before the n-th line begins
+        :param signature: Signature of the version of the file which the table was built for
+        """
+        super().__init__(offsets, signature)
+        self.blocks: bgzf.BlockIndex | None = None  # built along with the offsets table, or when the file is opened
+
+
+class CompressedFileManager(FileManagerWithPreProcessing):
+    """
+    Serves lines from a block-compressed file (see `bgzf`) without ever decompressing it entirely. The offsets table
+    holds positions in the decompressed contents, and the block index maps each of them to the compressed block holding
+    it, so that reading a line only decompresses the blocks it spans. Recently decompressed blocks are cached
+    """
+    def __init__(self, path: os.PathLike, logger: logging.Logger, bytes_before_line: LineOffsets | None = None,
+                 index_path: os.PathLike | None = None, reader: AsyncReader | None = None,
+                 cache: LineCache | None = None, block_cache: LineCache | None = None,
+                 metrics: ServingMetrics | None = None) -> None:
+        """
+        :param path: Path to the block-compressed file to serve, which must exist. Otherwise, HTTP 500 will be raised
+        :param logger: Logger instance
+        :param bytes_before_line: Table representing the number of decompressed bytes before the n-th line begins
+        :param index_path: Optional path of the file where the offsets table is persisted. The block index is not
+            persisted, as it is rebuilt from the headers of the blocks without decompressing them
+        :param reader: Optional thread pool where blocks are read and decompressed, outside the event loop. If not
+            provided, they are read and decompressed in the event loop
+        :param cache: Optional cache of recently retrieved lines, which is cleared whenever the file is pre-processed
+        :param block_cache: Optional cache of recently decompressed blocks, by index, which is cleared whenever the file
+            is pre-processed
+        :param metrics: Optional histograms where the time spent looking lines up in the offsets table, reading them and
+            pre-processing the file is recorded
+        """
+        super().__init__(path, logger, bytes_before_line, index_path, reader=reader, cache=cache, metrics=metrics)
+        self.block_cache = block_cache
+
+    def _scan(self) -> LineOffsets:
+        """
+        Internal method to decompress the entire served file and compute the number of decompressed bytes before each
+        line begins, indexing its blocks along the way. Both are populated in place, so the lines found so far can
+        already be retrieved
+        :return: table representing the number of decompressed bytes before the n-th line begins
+        """
+        state = self._state
+        state.offsets = LineOffsets()
+        state.blocks = bgzf.BlockIndex()
+        bgzf.scan_line_offsets(self.path, offsets=state.offsets, blocks=state.blocks, progress=self.progress,
+                               size=state.signature.size)
+        return state.offsets
+
+    def _load_persisted_index(self, signature: index_file.FileSignature) -> LineOffsets | None:
+        """
+        Internal method to memory-map the persisted offsets table of the served file, and index its blocks. Lines
+        appended to a compressed file cannot be found without decompressing it, so an index built for a previous
+        version of the file is never reused
+        :param signature: Current signature of the served file
+        :return: table representing the number of decompressed bytes before the n-th line begins, or None if the index
+            file is missing, corrupted, or was built for another version of the served file
+        """
+        offsets = index_file.load_index(self.index_path, signature)
+        if offsets is not None:
+            self._state.blocks = bgzf.read_block_index(self.path, signature.size)
+        return offsets
+
+    def _scan_appended_lines(self) -> None:
+        """
+        Internal method telling that the served file must be pre-processed again entirely whenever it changes, as its
+        appended blocks would have to be decompressed anyway
+        :return: None
+        """
+        return None
+
+    def _line_bounds(self, state: CompressedFileState, first: int, last: int) -> tuple[int, int]:
+        """
+        Internal method to locate a run of consecutive lines in the decompressed contents of a version of the served
+        file
+        :param state: Version of the served file
+        :param first: Index of the first line of the run
+        :param last: Index of the last line of the run
+        :return: position of the first decompressed byte of the run, and position right after its last byte
+        """
+        if state.file is None:
+            self._open(state)
+        offsets = state.offsets
+        return offsets[first], offsets[last + 1] if last + 1 < len(offsets) else state.blocks.size
+
+    async def _read_range(self, state: CompressedFileState, start: int, end: int) -> bytes:
+        """
+        Internal method to read a range of the decompressed contents of a version of the served file, decompressing
+        each block it spans unless it is cached
+        :param state: Version of the served file, which is in use until the read is done
+        :param start: Position of the first decompressed byte to read
+        :param end: Position right after the last decompressed byte to read
+        :return: decompressed bytes read
+        """
+        blocks = state.blocks
+        parts = []
+        block = blocks.find(start)
+        position = start
+        while position < end:
+            data = await self._read_block(state, block)
+            block_start = blocks.positions[block]
+            parts.append(data[position - block_start:end - block_start])
+            position = block_start + len(data)
+            block += 1
+        return b"".join(parts)
+
+    async def _read_block(self, state: CompressedFileState, block: int) -> bytes:
+        """
+        Internal method to decompress a block of a version of the served file, unless it is cached
+        :param state: Version of the served file, which is in use until the read is done
+        :param block: Index of the block in the block index
+        :return: decompressed contents of the block
+        """
+        if self.block_cache is not None:
+            data = self.block_cache.get(block)
+            if data is not None:
+                return data
+
+        offset = state.blocks.offsets[block]
+        version = self._version
+        if self.reader is None:
+            data = bgzf.read_block(state.file.fileno(), offset)
+        else:
+            data = await self.reader.run(bgzf.read_block, state.file.fileno(), offset)
+        if self.block_cache is not None and version == self._version:
+            self.block_cache.put(block, data)
+        return data
+
+    def _open(self, state: CompressedFileState) -> None:
+        """
+        Internal method to open a version of the served file, indexing its blocks if they were not indexed along with
+        the offsets table
+        :param state: Version of the served file
+        """
+        super()._open(state)
+        if state.blocks is None:
+            size = state.signature.size if state.signature is not None else None
+            state.blocks = bgzf.read_block_index(self.path, size)
+
+    def _new_state(self, offsets: LineOffsets | None = None,
+                   signature: index_file.FileSignature | None = None) -> CompressedFileState:
+        """
+        Internal method to create a version of the served file, whose blocks are indexed when it is pre-processed or
+        opened
+        :param offsets: Table representing the number of decompressed bytes before the n-th line begins
+        :param signature: Signature of the version of the file which the table was built for
+        :return: version of the served file
+        """
+        return CompressedFileState(offsets, signature)
+
+    def _replace_state(self, state: CompressedFileState) -> None:
+        """
+        Internal method to serve another version of the served file, dropping the decompressed blocks of the previous
+        one. The block index is rebuilt on the next read, unless the file is pre-processed again
+        :param state: Version of the served file to serve from now on
+        """
+        super()._replace_state(state)
+        if self.block_cache is not None:
+            self.block_cache.clear()
@@ -1,56 +1,440 @@
+import asyncio
 import logging
 import os
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from pathlib import Path
+from typing import BinaryIO
 
-from src.file_handlers.exceptions import LineIndexOutOfRangeError
+from src.file_handlers import index_file, scanner
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import IndexNotReadyError, LineIndexOutOfRangeError
 from src.file_handlers.manager import FileManager
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.progress import IndexingProgress
+from src.file_handlers.reader import AsyncReader
+from src.metrics import ServingMetrics
+
+
+class FileState:
+    """
+    Version of the served file: its offsets table and signature, along with the file opened on the first read.
+    Whenever the served file is pre-processed again, a new state replaces this one, while the reads which started with
+    this one keep using it, so that it is only closed once they are done
+    """
+    def __init__(self, offsets: LineOffsets | None = None, signature: index_file.FileSignature | None = None) -> None:
+        """
+        :param offsets: Table representing the number of bytes in the file before the n-th line begins
+        :param signature: Signature of the version of the file which the table was built for
+        """
+        self.offsets = offsets
+        self.signature = signature
+        self.file: BinaryIO | None = None
+        self.readers = 0  # reads in progress using this state
+        self.replaced = False  # once replaced, it is closed as soon as no read uses it
+
+    def close(self) -> None:
+        """Close the file, if it is open"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
 
 
 class FileManagerWithPreProcessing(FileManager):
-    def __init__(self, path: os.PathLike, logger: logging.Logger, bytes_before_line: list[int] | None = None) -> None:
+    def __init__(self, path: os.PathLike, logger: logging.Logger, bytes_before_line: LineOffsets | None = None,
+                 index_path: os.PathLike | None = None, indexing_workers: int = 1,
+                 reader: AsyncReader | None = None, cache: LineCache | None = None,
+                 metrics: ServingMetrics | None = None) -> None:
         """
         :param path: Path to the file to serve, which must exist. Otherwise, HTTP 500 will be raised
         :param logger: Logger instance
-        :param bytes_before_line: List representing the number of bytes in a file before the n-th line begins. From
+        :param bytes_before_line: Table representing the number of bytes in a file before the n-th line begins. From
             the moment this is populated, retrieving a line will not require the pre-processing step
+        :param index_path: Optional path of the file where the pre-processing result is persisted. If provided, a
+            valid index file is loaded instead of reading the entire served file, and a new one is written otherwise
+        :param indexing_workers: Number of processes reading the served file in parallel during the pre-processing step
+        :param reader: Optional thread pool where lines are read, outside the event loop. If not provided, lines are
+            read in the event loop, which blocks it if they are not in the page cache
+        :param cache: Optional cache of recently retrieved lines, which is cleared whenever the file is pre-processed
+        :param metrics: Optional histograms where the time spent looking lines up in the offsets table, reading them and
+            pre-processing the file is recorded
+        """
+        super().__init__(path, logger, reader)
+        self._state = self._new_state(bytes_before_line)
+        self._state_lock = threading.Lock()  # the state is replaced by the pre-processing step, in another thread
+        self.index_path = Path(index_path) if index_path is not None else None
+        self.indexing_workers = indexing_workers
+        self.cache = cache
+        self.metrics = metrics
+        # incremented whenever the served file changes, so that lines read from a previous version are not cached
+        self._version = 0
+        self.progress: IndexingProgress | None = None  # progress of the current or last pre-processing step
+
+    @property
+    def indexing(self) -> bool:
+        """Whether the pre-processing step is running, in which case only the lines found so far can be retrieved"""
+        return self.progress is not None and not self.progress.done
+
+    @property
+    def bytes_before_line(self) -> LineOffsets | None:
+        """Table representing the number of bytes in the served file before the n-th line begins, once populated"""
+        return self._state.offsets
+
+    @bytes_before_line.setter
+    def bytes_before_line(self, offsets: LineOffsets | None) -> None:
+        self._state.offsets = offsets
+
+    @property
+    def signature(self) -> index_file.FileSignature | None:
+        """Version of the served file which was pre-processed, if it was"""
+        return self._state.signature
+
+    @property
+    def ready(self) -> bool:
+        """Whether the pre-processing step is done, so that every line of the served file can be retrieved"""
+        return self.bytes_before_line is not None and not self.indexing
+
+    def begin_pre_processing(self) -> IndexingProgress:
         """
-        super().__init__(path, logger)
-        self.bytes_before_line = bytes_before_line
+        Mark the pre-processing step as started, before it actually starts in another thread. From this moment,
+        requests for lines which were not found yet raise `IndexNotReadyError` instead of triggering the step again
+        :return: progress of the pre-processing step, which is updated by the next call to `pre_process`
+        """
+        self.progress = IndexingProgress()
+        return self.progress
+
+    def cancel_pre_processing(self) -> None:
+        """Ask the running pre-processing step, if any, to stop as soon as possible"""
+        if self.indexing:
+            self.progress.cancel()
 
-    def pre_process(self) -> list[int]:
+    def pre_process(self) -> LineOffsets:
         """
-        Pre-process the served file by reading all of its contents, with only one line in memory at a time,
+        Pre-process the served file by reading all of its contents, one large chunk at a time,
         and computing the number of bytes appearing before each line begins.
-        This is an expensive operation as it requires reading the entire file; as such, it should occur only once
-        :return: list representing the number of bytes in a file before the n-th line begins
+        This is an expensive operation as it requires reading the entire file; as such, it should occur only once.
+        If an index file is configured and matches the served file, it is memory-mapped instead. When several processes
+        pre-process the same file at once, only one of them reads it, while the others wait and then map its index.
+        This method may run in another thread, in which case the lines found so far can be retrieved while it runs.
+        If the served file was only appended to since its index was persisted, only the appended bytes are read
+        :raises IndexingCancelledError: if the pre-processing step is cancelled before it is done
+        :return: table representing the number of bytes in a file before the n-th line begins
         """
-        self.bytes_before_line = []
+        if not self.indexing:
+            self.begin_pre_processing()
+        progress = self.progress
 
-        with open(self.path, "r") as f:
-            # First line
-            line = f.readline()
-            self.bytes_before_line = [0]
-            # Subsequent lines
-            while line != "":
-                self.bytes_before_line.append(self.bytes_before_line[-1] + len(line))
-                line = f.readline()
+        try:
+            # the served file may have changed since it was pre-processed and opened
+            self._version += 1
+            self._replace_state(self._new_state())
+            if self.cache is not None:
+                self.cache.clear()
 
-        self.bytes_before_line.pop()  # remove last element
+            # other processes serving the same file wait for this one to persist the index, and map it
+            with self._lock_index(cancelled=lambda: progress.cancelled):
+                signature = index_file.FileSignature.of(self.path)
+                self._state.signature = signature
+                progress.total_bytes = signature.size
+                if self.index_path is None:
+                    self.bytes_before_line = self._scan()
+                else:
+                    self.bytes_before_line = self._load_or_build_index(signature)
+        except BaseException:
+            self.bytes_before_line = None  # a partial table must not be taken for a complete one
+            self._state.signature = None
+            raise
+        finally:
+            progress.finish()
 
+        if self.metrics is not None:
+            self.metrics.index_build.observe(progress.elapsed_seconds)
         return self.bytes_before_line
 
+    def _load_or_build_index(self, signature: index_file.FileSignature) -> LineOffsets:
+        """
+        Internal method to memory-map the persisted index of the served file, building and persisting it first if it is
+        missing or outdated. Once persisted, the table built by this process is replaced by the mapped index, so that
+        every process serving the file shares the same pages of memory instead of holding its own copy
+        :param signature: Signature of the served file at the moment the pre-processing step started
+        :return: table representing the number of bytes in a file before the n-th line begins
+        """
+        persisted = self._load_persisted_index(signature)
+        if persisted is not None:
+            self.logger.info("Loaded persisted index", extra={"index_path": str(self.index_path)})
+            self.progress.update(signature.size, len(persisted))
+            return persisted
+
+        offsets = self._scan()
+        try:
+            index_file.save_index(self.index_path, signature, offsets)
+        except OSError as e:
+            self.logger.warning(f"Could not persist index to {self.index_path}: {e}")
+            return offsets
+
+        persisted = index_file.load_index(self.index_path, signature)
+        return persisted if persisted is not None else offsets
+
+    def _load_persisted_index(self, signature: index_file.FileSignature) -> LineOffsets | None:
+        """
+        Internal method to memory-map the persisted index of the served file. If it was built for a previous version of
+        the served file, which was only appended to since, the offsets of the appended lines are added to it first
+        :param signature: Current signature of the served file
+        :return: table representing the number of bytes in a file before the n-th line begins, or None if the index
+            file is missing, corrupted, or was built for a version of the served file which was not only appended to
+        """
+        persisted = index_file.read_index(self.index_path)
+        if persisted is None:
+            return None
+        stored, offsets = persisted
+        if stored == signature:
+            return offsets
+        if not stored.is_prefix_of(self.path):
+            return None
+
+        appended = scanner.scan_appended_line_offsets(self.path, stored.size, signature.size)
+        try:
+            index_file.append_index(self.index_path, signature, appended)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not persist index to {self.index_path}: {e}")
+            return None
+        return index_file.load_index(self.index_path, signature)
+
+    def _lock_index(self, cancelled: Callable[[], bool] = lambda: False) -> AbstractContextManager:
+        """
+        Internal method to lock the persisted index, if any, so that other processes do not build or update it at the
+        same time
+        :param cancelled: Function telling whether to stop waiting for the lock
+        :return: context manager holding the lock
+        """
+        return index_file.lock_index(self.index_path, cancelled) if self.index_path is not None else nullcontext()
+
+    async def refresh(self) -> bool:
+        """
+        Bring the pre-processing result up to date with the served file, if it changed since it was pre-processed.
+        If lines were only appended to it, only the appended bytes are read, in another thread, and the new lines can
+        be retrieved once they are all found; other lines can be retrieved all along. If the served file was rewritten
+        or truncated, it is pre-processed again entirely, in another thread, with the lines found so far being
+        retrievable as during the first pre-processing step
+        :raises FileNotFoundError: if the served file does not exist anymore
+        :raises IndexingCancelledError: if the served file is pre-processed again, and this is cancelled
+        :return: whether the served file changed
+        """
+        state = self._state
+        if self.indexing or state.signature is None:
+            return False
+        stat = os.stat(self.path)
+        if (stat.st_size, stat.st_mtime_ns) == (state.signature.size, state.signature.mtime_ns):
+            return False
+
+        # a file replaced by another one is pre-processed again even if it starts with the same lines, as the previous
+        # one is still open; with a persisted index, only the lines which were appended are read anyway
+        replaced = state.file is not None and not os.path.samestat(os.fstat(state.file.fileno()), stat)
+        appended = await asyncio.to_thread(self._scan_appended_lines) if not replaced else None
+        if appended is None:
+            self.logger.info("Served file was rewritten, pre-processing it again")
+            self.begin_pre_processing()
+            await asyncio.to_thread(self.pre_process)
+            return True
+
+        # applied on the event loop, so that requests never see the offsets without the signature covering their lines
+        signature, persisted, offsets = appended
+        n_lines = len(state.offsets)
+        if persisted is not None:
+            state.offsets = persisted
+        else:
+            state.offsets.extend(offsets)
+        state.signature = signature
+        self._version += 1
+        if self.cache is not None and n_lines:
+            self.cache.discard(n_lines - 1)  # the last line may not have been complete
+        self.logger.info("Indexed lines appended to served file", extra={"n_lines": len(self.bytes_before_line)})
+        return True
+
+    def _scan_appended_lines(self) -> tuple[index_file.FileSignature, LineOffsets | None, LineOffsets | None] | None:
+        """
+        Internal method to find the lines appended to the served file since it was pre-processed, updating the
+        persisted index if any, unless another process serving the same file already did it
+        :return: None if the served file was not only appended to. Otherwise, its current signature, along with either
+            the updated persisted index or, if there is none, the table to add to the end of the current one
+        """
+        with self._lock_index():
+            previous = self.signature
+            signature = index_file.FileSignature.of(self.path)
+            if not previous.is_prefix_of(self.path):
+                return None
+            if self.index_path is not None:
+                persisted = self._load_persisted_index(signature)
+                if persisted is not None:
+                    return signature, persisted, None
+            return signature, None, scanner.scan_appended_line_offsets(self.path, previous.size, signature.size)
+
+    def _scan(self) -> LineOffsets:
+        """
+        Internal method to read the served file, up to its size in its signature, and compute the number of bytes before
+        each line begins. Bytes appended since the signature was computed are left for the next refresh, so that they
+        are not indexed twice. The table is populated in place while the file is read, so the lines found so far can
+        already be retrieved
+        :return: table representing the number of bytes in a file before the n-th line begins
+        """
+        self.bytes_before_line = LineOffsets()
+        return scanner.scan_line_offsets(self.path, workers=self.indexing_workers, offsets=self.bytes_before_line,
+                                         progress=self.progress, size=self.signature.size)
+
     async def get_line(self, line_index: int) -> str:
         """
         Retrieve the n-th line from the served file, with `n` starting at 0.
         If the served file has not been pre-processed yet, this step will occur at this time
         :param line_index: Index of the line to retrieve. Indices start at 0
         :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
+        :raises IndexNotReadyError: if the n-th line was not reached yet by the running pre-processing step
         :return: line text
         """
-        if self.bytes_before_line is None:
-            self.pre_process()
+        self._ensure_pre_processed()
 
         return await self._get_line_pre_processed(line_index)
 
+    async def get_line_bytes(self, line_index: int) -> bytes:
+        """
+        Retrieve the raw contents of the n-th line from the served file, with `n` starting at 0, without decoding them.
+        If the served file has not been pre-processed yet, this step will occur at this time
+        :param line_index: Index of the line to retrieve. Indices start at 0
+        :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
+        :raises IndexNotReadyError: if the n-th line was not reached yet by the running pre-processing step
+        :return: line contents, including the newline character
+        """
+        self._ensure_pre_processed()
+
+        return await self._read_line_bytes(line_index)
+
+    async def get_lines_bytes(self, line_indices: Sequence[int]) -> list[bytes]:
+        """
+        Retrieve the raw contents of several lines from the served file, in the requested order. Indices are sorted,
+        and each run of consecutive lines is read at once, from the start of its first line to the end of its last one.
+        If the served file has not been pre-processed yet, this step will occur at this time
+        :param line_indices: Indices of the lines to retrieve, which may be unsorted or repeated. Indices start at 0
+        :raises LineIndexOutOfRangeError: if any of the lines doesn't exist in the file
+        :raises IndexNotReadyError: if any of the lines was not reached yet by the running pre-processing step
+        :return: contents of each line, including the newline character
+        """
+        self._ensure_pre_processed()
+
+        started = time.perf_counter()
+        with self._use_state() as state:
+            n_lines = self._n_available_lines(state)
+            for line_index in line_indices:
+                self._check_line_index(line_index, n_lines)
+            return await self._read_lines(state, line_indices, started)
+
+    async def get_line_range_bytes(self, start: int, count: int) -> list[bytes]:
+        """
+        Retrieve the raw contents of up to `count` consecutive lines from the served file, with a single read.
+        If the served file has not been pre-processed yet, this step will occur at this time
+        :param start: Index of the first line to retrieve. Indices start at 0
+        :param count: Maximum number of lines to retrieve. Fewer lines are returned if the end of the file is reached
+        :raises LineIndexOutOfRangeError: if the first line doesn't exist in the file
+        :raises IndexNotReadyError: if any of the lines was not reached yet by the running pre-processing step
+        :return: contents of each line, including the newline character
+        """
+        self._ensure_pre_processed()
+
+        started = time.perf_counter()
+        with self._use_state() as state:
+            n_lines = self._n_available_lines(state)
+            self._check_line_range(start, count, n_lines)
+            return await self._read_lines(state, range(start, min(start + count, n_lines)), started)
+
+    def get_line_range_bounds(self, start: int, count: int) -> tuple[FileState, int, int]:
+        """
+        Locate up to `count` consecutive lines in the served file, without reading them. The version of the served file
+        holding them is in use until `iter_bytes` is done reading them from it, which must be called next.
+        If the served file has not been pre-processed yet, this step will occur at this time
+        :param start: Index of the first line. Indices start at 0
+        :param count: Maximum number of lines. Fewer lines are located if the end of the file is reached
+        :raises LineIndexOutOfRangeError: if the first line doesn't exist in the file
+        :raises IndexNotReadyError: if any of the lines was not reached yet by the running pre-processing step
+        :return: version of the served file holding the lines, position of the first byte of the lines, and position
+            right after their last byte
+        """
+        self._ensure_pre_processed()
+
+        started = time.perf_counter()
+        state = self._acquire_state()
+        try:
+            n_lines = self._n_available_lines(state)
+            self._check_line_range(start, count, n_lines)
+            bounds = self._line_bounds(state, start, min(start + count, n_lines) - 1)
+        except BaseException:
+            self._release_state(state)
+            raise
+        self._observe_index_lookup(started)
+        return state, *bounds
+
+    async def iter_bytes(self, state: FileState, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+        """
+        Read a byte range of a version of the served file in chunks, so that memory usage does not depend on the size
+        of the range, and stop using this version once done
+        :param state: Version of the served file, as returned by `get_line_range_bounds`
+        :param start: Position of the first byte to read, as returned by `get_line_range_bounds`
+        :param end: Position right after the last byte to read, as returned by `get_line_range_bounds`
+        :param chunk_size: Maximum number of bytes read at a time
+        :return: asynchronous iterator over the chunks read
+        """
+        try:
+            for chunk_start in range(start, end, chunk_size):
+                yield await self._read_bytes(state, chunk_start, min(chunk_start + chunk_size, end))
+        finally:
+            self._release_state(state)
+
+    def _ensure_pre_processed(self) -> None:
+        """
+        Internal method to pre-process the served file if it was not pre-processed yet.
+        Nothing is done while the pre-processing step is running in another thread
+        """
+        if self.bytes_before_line is None and not self.indexing:
+            self.pre_process()
+
+    def _n_available_lines(self, state: FileState) -> int:
+        """
+        :param state: Version of the served file which the lines are read from
+        :return: number of lines which can be retrieved. While the pre-processing step is running, the last line found
+            is excluded, as it may not be complete yet
+        """
+        if state.offsets is None:
+            return 0
+        n_lines = len(state.offsets)
+        return max(n_lines - 1, 0) if self.indexing else n_lines
+
+    def _check_line_index(self, line_index: int, n_lines: int) -> None:
+        """
+        Internal method to validate that a line can be retrieved
+        :param line_index: Index of the line to retrieve
+        :param n_lines: Number of lines which can be retrieved, as returned by `_n_available_lines`
+        :raises LineIndexOutOfRangeError: if the line doesn't exist in the file
+        :raises IndexNotReadyError: if the line was not reached yet by the running pre-processing step
+        """
+        if 0 <= line_index < n_lines:
+            return
+        if line_index >= 0 and self.indexing:
+            raise IndexNotReadyError()
+        raise LineIndexOutOfRangeError()
+
+    def _check_line_range(self, start: int, count: int, n_lines: int) -> None:
+        """
+        Internal method to validate that a range of lines can be retrieved. While the pre-processing step is running, a
+        range going past the lines found so far is not cut short, as the file may not end there
+        :param start: Index of the first line of the range
+        :param count: Maximum number of lines of the range
+        :param n_lines: Number of lines which can be retrieved, as returned by `_n_available_lines`
+        :raises LineIndexOutOfRangeError: if the first line doesn't exist in the file
+        :raises IndexNotReadyError: if any of the lines was not reached yet by the running pre-processing step
+        """
+        self._check_line_index(start, n_lines)
+        if self.indexing and start + count > n_lines:
+            raise IndexNotReadyError()
+
     async def _get_line_pre_processed(self, line_index: int) -> str:
         """
         Internal method to retrieve the n-th line from the served file, with `n` starting at 0.
@@ -59,11 +443,194 @@ class FileManagerWithPreProcessing(FileManager):
         :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
         :return: line text
         """
+        return (await self._read_line_bytes(line_index)).decode()
+
+    async def _read_line_bytes(self, line_index: int) -> bytes:
+        """
+        Internal method to read the n-th line of the served file, which is opened only once, unless it is
+        found in the cache
+        :param line_index: Index of the line to retrieve. Indices start at 0
+        :raises LineIndexOutOfRangeError: if the n-th line doesn't exist in the file
+        :raises IndexNotReadyError: if the n-th line was not reached yet by the running pre-processing step
+        :return: line contents, including the newline character
+        """
+        started = time.perf_counter()
+        with self._use_state() as state:
+            self._check_line_index(line_index, self._n_available_lines(state))
+
+            if self.cache is not None:
+                line = self.cache.get(line_index)
+                if line is not None:
+                    self._observe_index_lookup(started)
+                    return line
+
+            bounds = self._line_bounds(state, line_index, line_index)
+            self._observe_index_lookup(started)
+            version = self._version
+            line = await self._read_bytes(state, *bounds)
+        if self.cache is not None and version == self._version:  # the file may have changed while the line was read
+            self.cache.put(line_index, line)
+        return line
+
+    async def _read_lines(self, state: FileState, line_indices: Sequence[int], started: float) -> list[bytes]:
+        """
+        Internal method to read several lines of a version of the served file, which must exist, in the requested order.
+        Indices are sorted, and each run of consecutive lines is read at once
+        :param state: Version of the served file, which is in use until the lines are read
+        :param line_indices: Indices of the lines to retrieve, which may be unsorted or repeated
+        :param started: Value of `time.perf_counter` when the lookup started
+        :return: contents of each line, including the newline character
+        """
+        runs = [(first, last, *self._line_bounds(state, first, last))
+                for first, last in _consecutive_runs(sorted(set(line_indices)))]
+        self._observe_index_lookup(started)
+
+        lines = {}
+        for first, last, run_start, run_end in runs:
+            run = await self._read_bytes(state, run_start, run_end)
+            for line_index in range(first, last + 1):
+                start, end = self._line_bounds(state, line_index, line_index)
+                lines[line_index] = run[start - run_start:end - run_start]
+        return [lines[line_index] for line_index in line_indices]
+
+    def _observe_index_lookup(self, started: float) -> None:
+        """
+        Internal method to record the time spent validating line indices and locating lines, if metrics are recorded
+        :param started: Value of `time.perf_counter` when the lookup started
+        """
+        if self.metrics is not None:
+            self.metrics.index_lookup.observe(time.perf_counter() - started)
+
+    def _line_bounds(self, state: FileState, first: int, last: int) -> tuple[int, int]:
+        """
+        Internal method to locate a run of consecutive lines in a version of the served file, which must exist
+        :param state: Version of the served file
+        :param first: Index of the first line of the run
+        :param last: Index of the last line of the run
+        :return: position of the first byte of the run, and position right after its last byte
+        """
+        offsets = state.offsets
+        if state.file is None:
+            self._open(state)
+        if last + 1 < len(offsets):
+            return offsets[first], offsets[last + 1]
+        # the served file may have grown since it was pre-processed, so it must not be read until its end
+        if state.signature is not None:
+            return offsets[first], state.signature.size
+        return offsets[first], os.fstat(state.file.fileno()).st_size
+
+    async def _read_bytes(self, state: FileState, start: int, end: int) -> bytes:
+        """
+        Internal method to read a byte range of a version of the served file, which must be open already, recording
+        the time it took if metrics are recorded
+        :param state: Version of the served file, which is in use until the read is done
+        :param start: Position of the first byte to read
+        :param end: Position right after the last byte to read
+        :return: bytes read
+        """
+        started = time.perf_counter()
+        data = await self._read_range(state, start, end)
+        if self.metrics is not None:
+            self.metrics.file_read.observe(time.perf_counter() - started)
+        return data
+
+    async def _read_range(self, state: FileState, start: int, end: int) -> bytes:
+        """
+        Internal method to read a byte range of a version of the served file, which must be open already, with
+        `os.pread`: in a thread with a reader, as it releases the GIL, and in the event loop otherwise. Unlike slicing a
+        memory-mapped file, which crashes the process with SIGBUS once the file is truncated, it reads fewer bytes
+        :param state: Version of the served file, which is in use until the read is done
+        :param start: Position of the first byte to read
+        :param end: Position right after the last byte to read
+        :return: bytes read
+        """
+        if self.reader is None:
+            return os.pread(state.file.fileno(), end - start, start)
+        return await self.reader.run(os.pread, state.file.fileno(), end - start, start)
+
+    def _open(self, state: FileState) -> None:
+        """
+        Internal method to open a version of the served file
+        :param state: Version of the served file
+        """
+        state.file = open(self.path, "rb")
+
+    def _new_state(self, offsets: LineOffsets | None = None,
+                   signature: index_file.FileSignature | None = None) -> FileState:
+        """
+        Internal method to create a version of the served file, which is opened on its first read
+        :param offsets: Table representing the number of bytes in the file before the n-th line begins
+        :param signature: Signature of the version of the file which the table was built for
+        :return: version of the served file
+        """
+        return FileState(offsets, signature)
+
+    def _replace_state(self, state: FileState) -> None:
+        """
+        Internal method to serve another version of the served file. The previous one is closed right away if no read
+        uses it, and otherwise by the last read using it, so that a read never uses a closed (or reused) file descriptor
+        :param state: Version of the served file to serve from now on
+        """
+        with self._state_lock:
+            previous, self._state = self._state, state
+            previous.replaced = True
+            unused = previous.readers == 0
+        if unused:
+            previous.close()
+
+    @contextmanager
+    def _use_state(self) -> Iterator[FileState]:
+        """
+        Internal method to hold the current version of the served file while checking which lines exist and reading
+        them, so that both are done against the same version, which is not closed if it is replaced in the meantime
+        :return: context manager holding the current version of the served file
+        """
+        state = self._acquire_state()
         try:
-            with open(self.path, "r") as f:
-                f.seek(self.bytes_before_line[line_index])
-                return f.readline()
-        except IndexError:
-            raise LineIndexOutOfRangeError()
+            yield state
+        finally:
+            self._release_state(state)
+
+    def _acquire_state(self) -> FileState:
+        """
+        Internal method to start using the current version of the served file, until `_release_state` is called
+        :return: current version of the served file
+        """
+        with self._state_lock:
+            state = self._state
+            state.readers += 1
+        return state
+
+    def _release_state(self, state: FileState) -> None:
+        """
+        Internal method to stop using a version of the served file, closing it if it was replaced and no read uses it
+        :param state: Version of the served file, as returned by `_acquire_state`
+        """
+        with self._state_lock:
+            state.readers -= 1
+            unused = state.replaced and state.readers == 0
+        if unused:
+            state.close()
+
+    def close(self) -> None:
+        """
+        Release the served file, if it is open, once the reads using it are done. It is opened again on the next read
+        """
+        self._replace_state(self._new_state(self.bytes_before_line, self.signature))
 
 
+def _consecutive_runs(line_indices: Iterable[int]) -> Iterator[tuple[int, int]]:
+    """
+    :param line_indices: Sorted, unique line indices
+    :return: first and last index of each run of consecutive indices
+    """
+    first = last = None
+    for line_index in line_indices:
+        if last is not None and line_index == last + 1:
+            last = line_index
+            continue
+        if first is not None:
+            yield first, last
+        first = last = line_index
+    if first is not None:
+        yield first, last
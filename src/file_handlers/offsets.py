@@ -0,0 +1,84 @@
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+
+OFFSET_TYPECODE = "Q"  # unsigned 64-bit integers, so files larger than 4 GB are supported
+
+
+class LineOffsets(Sequence):
+    """
+    Compact table with the number of bytes in a file before the n-th line begins.
+    Offsets are stored in a contiguous buffer of unsigned 64-bit integers (8 bytes per line), instead of a list of
+    Python integers (~36 bytes per line), while keeping O(1) random access. The buffer is either owned by this
+    instance or a read-only view over memory shared with other processes, such as a memory-mapped index file
+    """
+    __slots__ = ("_offsets",)
+
+    def __init__(self, offsets: Iterable[int] | memoryview = ()) -> None:
+        """
+        :param offsets: Initial offsets. A memoryview of unsigned 64-bit integers is used as-is, without copying it
+        """
+        if isinstance(offsets, memoryview) and offsets.format == OFFSET_TYPECODE:
+            self._offsets = offsets
+        elif isinstance(offsets, array) and offsets.typecode == OFFSET_TYPECODE:
+            self._offsets = offsets
+        else:
+            self._offsets = array(OFFSET_TYPECODE, offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, line_index: int) -> int:
+        return self._offsets[line_index]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._offsets)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, LineOffsets):
+            return self._offsets == other._offsets
+        if isinstance(other, Sequence):
+            return len(self) == len(other) and all(a == b for a, b in zip(self._offsets, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"LineOffsets(<{len(self)} lines, {self.nbytes} bytes>)"
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the underlying buffer, in bytes"""
+        return len(self._offsets) * self._offsets.itemsize
+
+    @property
+    def buffer(self) -> array | memoryview:
+        """Underlying buffer, which can be written directly to a binary file"""
+        return self._offsets
+
+    def append(self, offset: int) -> None:
+        """
+        :param offset: Number of bytes before a new line begins, which is added to the end of the table
+        """
+        self._ensure_owned()
+        self._offsets.append(offset)
+
+    def extend(self, offsets: Iterable[int]) -> None:
+        """
+        :param offsets: Number of bytes before each of the new lines begins, which are added to the end of the table
+        """
+        self._ensure_owned()
+        self._offsets.extend(offsets)
+
+    def pop(self) -> int:
+        """
+        :return: offset removed from the end of the table
+        """
+        self._ensure_owned()
+        return self._offsets.pop()
+
+    def _ensure_owned(self) -> None:
+        """Internal method to copy a read-only view into an owned buffer before it is modified"""
+        if isinstance(self._offsets, memoryview):
+            owned = array(OFFSET_TYPECODE)
+            owned.frombytes(self._offsets.cast("B"))
+            self._offsets = owned
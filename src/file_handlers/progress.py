@@ -0,0 +1,63 @@
+import time
+
+
+class IndexingProgress:
+    """Progress of the pre-processing step of a file, which may be running in another thread"""
+    def __init__(self, total_bytes: int = 0) -> None:
+        """
+        :param total_bytes: Size of the file being pre-processed, in bytes, if already known
+        """
+        self.total_bytes = total_bytes
+        self.bytes_scanned = 0
+        self.lines_found = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.cancelled = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the pre-processing step finished, successfully or not"""
+        return self.finished_at is not None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        """Time spent pre-processing the file so far, or in total if it is done"""
+        return (self.finished_at if self.finished_at is not None else time.monotonic()) - self.started_at
+
+    @property
+    def eta_seconds(self) -> float | None:
+        """Estimated time until the pre-processing step is done, or None if it cannot be estimated yet"""
+        if self.done:
+            return 0.0
+        if self.bytes_scanned == 0:
+            return None
+        return (self.total_bytes - self.bytes_scanned) * self.elapsed_seconds / self.bytes_scanned
+
+    def update(self, bytes_scanned: int, lines_found: int) -> None:
+        """
+        :param bytes_scanned: Number of bytes of the file scanned so far, from its beginning
+        :param lines_found: Number of lines found so far
+        """
+        self.bytes_scanned = bytes_scanned
+        self.lines_found = lines_found
+
+    def finish(self) -> None:
+        """Mark the pre-processing step as done"""
+        self.finished_at = time.monotonic()
+
+    def cancel(self) -> None:
+        """Ask the pre-processing step to stop as soon as possible"""
+        self.cancelled = True
+
+    def as_dict(self) -> dict:
+        """
+        :return: progress as a JSON-serializable dictionary
+        """
+        return {
+            "done": self.done,
+            "bytes_scanned": self.bytes_scanned,
+            "total_bytes": self.total_bytes,
+            "lines_found": self.lines_found,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "eta_seconds": round(self.eta_seconds, 3) if self.eta_seconds is not None else None,
+        }
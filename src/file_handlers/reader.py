@@ -0,0 +1,43 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncReader:
+    """
+    Runs blocking file reads in a bounded thread pool, so that a slow read (cold page cache, slow storage) does not
+    block the event loop and every other in-flight request. Reads beyond the concurrency limit wait in a queue
+    """
+    def __init__(self, max_concurrency: int) -> None:
+        """
+        :param max_concurrency: Maximum number of reads executed at the same time
+        """
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0  # reads currently being executed by a thread
+        self.queued = 0  # reads waiting for a free thread
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="line-reader")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Execute a blocking function in the thread pool, waiting for a free thread if the concurrency limit is reached
+        :param func: Blocking function to execute, which should release the GIL while waiting for I/O (e.g. `os.pread`)
+        :param args: Positional arguments of the function
+        :return: result of the function
+        """
+        self.queued += 1
+        async with self._semaphore:
+            self.queued -= 1
+            self.in_flight += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def close(self) -> None:
+        """Stop the thread pool once pending reads are done"""
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+from src.file_handlers import bgzf, index_file
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import UnknownFileError
+from src.file_handlers.manager_compressed import CompressedFileManager
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers.reader import AsyncReader
+from src.metrics import ServingMetrics
+
+# files found in a served directory which are never served themselves, as they are written by the app
+IGNORED_SUFFIXES = (index_file.INDEX_FILE_SUFFIX, index_file.LOCK_FILE_SUFFIX, ".tmp")
+
+
+def load_manifest(path: os.PathLike) -> dict[str, Path]:
+    """
+    Find the files to serve, and the name under which each of them is served
+    :param path: Either a directory, whose files are all served under their own name (except hidden files and index
+        files), or a JSON file with an object mapping names to paths, relative to the JSON file or absolute
+    :raises OSError: if the directory or JSON file cannot be read
+    :raises ValueError: if the JSON file is not an object mapping names to paths
+    :return: path of each file to serve, by name
+    """
+    path = Path(path)
+    if path.is_dir():
+        return {file.name: file.resolve() for file in sorted(path.iterdir())
+                if file.is_file() and not file.name.startswith(".") and not file.name.endswith(IGNORED_SUFFIXES)}
+
+    with open(path) as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or not all(isinstance(file, str) for file in manifest.values()):
+        raise ValueError(f"Manifest {path} must be a JSON object mapping names to paths")
+    return {name: path.parent.joinpath(file).resolve() for name, file in manifest.items()}
+
+
+class FileRegistry:
+    """
+    Serves many files from a single process. Each file is pre-processed on its first access (or its persisted index is
+    loaded), rather than when the app starts, and only the most recently used files are kept loaded: once their number
+    or the total size of their offsets tables exceeds the configured limits, the least recently used files are
+    released, and pre-processed (or loaded) again on their next access
+    """
+    def __init__(self, paths: dict[str, Path], logger: logging.Logger, memory_budget: int, max_open_files: int,
+                 persist_index: bool = True, reader: AsyncReader | None = None, block_cache_max_bytes: int = 0,
+                 metrics: ServingMetrics | None = None, on_release: Callable[[str], None] | None = None) -> None:
+        """
+        :param paths: Path of each file to serve, by name
+        :param logger: Logger instance
+        :param memory_budget: Maximum total size, in bytes, of the offsets tables of the files kept loaded, and of their
+            decompressed blocks kept in memory, checked whenever a file is loaded. The most recently used file is kept
+            loaded even if it alone exceeds it
+        :param max_open_files: Maximum number of files kept loaded, each one of them being open
+        :param persist_index: Whether the pre-processing result of each file is persisted next to it
+        :param reader: Optional thread pool where lines are read, outside the event loop, shared by all files
+        :param block_cache_max_bytes: Maximum total size of the recently decompressed blocks kept in memory for each
+            block-compressed file kept loaded. 0 disables the cache
+        :param metrics: Optional histograms where the time spent serving lines and loading files is recorded
+        :param on_release: Optional function called with the name of each file released to respect the limits, so that
+            whatever was built around its manager can be released as well
+        """
+        self.paths = paths
+        self.logger = logger
+        self.memory_budget = memory_budget
+        self.max_open_files = max_open_files
+        self.persist_index = persist_index
+        self.reader = reader
+        self.block_cache_max_bytes = block_cache_max_bytes
+        self.metrics = metrics
+        self.on_release = on_release
+        self.evictions = 0
+        self._managers: OrderedDict[str, FileManagerWithPreProcessing] = OrderedDict()  # least recently used first
+        self._loading: dict[str, asyncio.Task] = {}  # pre-processing step of the files being loaded
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+    @property
+    def index_memory_usage(self) -> int:
+        """Total size of the offsets tables of the files kept loaded, in bytes"""
+        return sum(manager.bytes_before_line.nbytes for manager in self._managers.values()
+                   if manager.bytes_before_line is not None)
+
+    @property
+    def memory_usage(self) -> int:
+        """Total size of the offsets tables of the files kept loaded, and of their decompressed blocks, in bytes"""
+        return sum(_memory_usage(manager) for manager in self._managers.values())
+
+    async def get(self, name: str) -> FileManagerWithPreProcessing:
+        """
+        Retrieve the manager of a served file, loading it first if it is not loaded. The file is pre-processed in
+        another thread, so requests for files which are already loaded are not delayed meanwhile
+        :param name: Name of the file
+        :raises UnknownFileError: if no file is served under this name
+        :raises FileNotFoundError: if the file does not exist
+        :return: manager of the file, which was pre-processed
+        """
+        manager = self._managers.get(name)
+        if manager is None:
+            if name not in self.paths:
+                raise UnknownFileError(name)
+            manager = self._load(name)
+        self._managers.move_to_end(name)
+
+        loading = self._loading.get(name)
+        if loading is not None:
+            await asyncio.shield(loading)  # a cancelled request does not cancel the step for the other ones
+        return manager
+
+    def _load(self, name: str) -> FileManagerWithPreProcessing:
+        """
+        Internal method to create the manager of a served file and start pre-processing it in another thread
+        :param name: Name of the file
+        :return: manager of the file, which is being pre-processed
+        """
+        path = self.paths[name]
+        index_path = index_file.index_path_for(path) if self.persist_index else None
+        if bgzf.is_block_compressed(path):
+            block_cache = LineCache(self.block_cache_max_bytes) if self.block_cache_max_bytes > 0 else None
+            manager = CompressedFileManager(path, self.logger, index_path=index_path, reader=self.reader,
+                                            block_cache=block_cache, metrics=self.metrics)
+        else:
+            manager = FileManagerWithPreProcessing(path, self.logger, index_path=index_path, reader=self.reader,
+                                                   metrics=self.metrics)
+        manager.begin_pre_processing()
+        self._managers[name] = manager
+        self._loading[name] = asyncio.create_task(self._pre_process(name, manager))
+        return manager
+
+    async def _pre_process(self, name: str, manager: FileManagerWithPreProcessing) -> None:
+        """
+        Internal method to pre-process a served file in another thread, and release the least recently used files once
+        it is loaded. A file which could not be pre-processed is not kept, so that it is retried on its next access
+        :param name: Name of the file
+        :param manager: Manager of the file
+        """
+        try:
+            await asyncio.to_thread(manager.pre_process)
+        except BaseException:
+            if self._managers.get(name) is manager:
+                del self._managers[name]
+            raise
+        finally:
+            del self._loading[name]
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Internal method to release the least recently used files until the limits are respected. Files being loaded
+        are never released. A released file is closed once the requests reading it are done
+        """
+        memory_usage = self.memory_usage
+        for name in list(self._managers):
+            if len(self._managers) <= 1 or \
+                    (len(self._managers) <= self.max_open_files and memory_usage <= self.memory_budget):
+                break
+            if name in self._loading:
+                continue
+            manager = self._managers.pop(name)
+            memory_usage -= _memory_usage(manager)
+            manager.close()
+            self.evictions += 1
+            self.logger.debug("Released served file", extra={"file_name": name})
+            if self.on_release is not None:
+                self.on_release(name)
+
+    def close(self) -> None:
+        """Stop pre-processing the files being loaded, and release every file"""
+        for manager in self._managers.values():
+            manager.cancel_pre_processing()
+            manager.close()
+        self._managers.clear()
+
+
+def _memory_usage(manager: FileManagerWithPreProcessing) -> int:
+    """
+    :param manager: Manager of a served file
+    :return: size of the offsets table of the file, and of its decompressed blocks kept in memory, in bytes
+    """
+    usage = manager.bytes_before_line.nbytes if manager.bytes_before_line is not None else 0
+    if isinstance(manager, CompressedFileManager) and manager.block_cache is not None:
+        usage += manager.block_cache.size
+    return usage
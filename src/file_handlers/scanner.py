@@ -0,0 +1,227 @@
+import multiprocessing
+import os
+from array import array
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, islice, repeat
+from operator import add
+
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.offsets import LineOffsets, OFFSET_TYPECODE
+from src.file_handlers.progress import IndexingProgress
+
+CHUNK_SIZE = 1024 * 1024  # bytes read from the file at a time when looking for newline characters
+# Below this average line length (in bytes), splitting a chunk in bulk is faster than searching for each newline
+SHORT_LINE_LENGTH = 64
+# Byte ranges scanned by each worker in parallel mode are never smaller than this, as starting processes is not free
+MIN_RANGE_SIZE = 64 * 1024 * 1024
+# Workers scan the file in tasks of this many bytes, so that progress is reported, and cancellation takes effect, as
+# often as this regardless of the number of workers
+RANGE_SIZE = 16 * 1024 * 1024
+# Workers are not forked from the app, whose event loop and reader threads may hold locks that a forked child would
+# find locked forever, but from a single-threaded server process
+START_METHOD = "forkserver"
+
+
+def iter_line_starts(path: os.PathLike, start: int, end: int,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[tuple[array, int]]:
+    """
+    Find the position right after every newline character in a byte range of a file, one chunk at a time.
+    The file is read in large binary chunks. Chunks with long lines are searched with `bytes.find`, which skips over
+    the line contents in C; chunks with many short lines are split on newline characters in bulk, so that the
+    positions are computed without executing Python code for every line
+    :param path: Path to the file to scan
+    :param start: Position of the first byte of the range
+    :param end: Position right after the last byte of the range
+    :param chunk_size: Number of bytes to read at a time
+    :return: iterator over arrays of unsigned 64-bit integers with the position right after each newline character in
+        a chunk, along with the position right after the last byte of that chunk
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            chunk = f.read(min(chunk_size, end - position))
+            if not chunk:
+                break
+            line_starts = find_chunk_line_starts(chunk, position)
+            position += len(chunk)
+            yield line_starts, position
+
+
+def find_chunk_line_starts(chunk: bytes, position: int) -> array:
+    """
+    Find the position right after every newline character in a chunk of a file
+    :param chunk: Bytes read from the file
+    :param position: Position of the first byte of the chunk in the file
+    :return: array of unsigned 64-bit integers with the position right after each newline character in the chunk
+    """
+    line_starts = array(OFFSET_TYPECODE)
+    n_newlines = chunk.count(b"\n")
+    if n_newlines * SHORT_LINE_LENGTH > len(chunk):
+        _split_chunk(chunk, position, n_newlines, line_starts)
+    else:
+        _search_chunk(chunk, position, line_starts)
+    return line_starts
+
+
+def find_line_starts(path: os.PathLike, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> array:
+    """
+    Find the position right after every newline character in a byte range of a file
+    :param path: Path to the file to scan
+    :param start: Position of the first byte of the range
+    :param end: Position right after the last byte of the range
+    :param chunk_size: Number of bytes to read at a time
+    :return: array of unsigned 64-bit integers with the position right after each newline character in the range
+    """
+    line_starts = array(OFFSET_TYPECODE)
+    for chunk_line_starts, _ in iter_line_starts(path, start, end, chunk_size):
+        line_starts.extend(chunk_line_starts)
+    return line_starts
+
+
+def _split_chunk(chunk: bytes, position: int, n_newlines: int, line_starts: array) -> None:
+    """
+    Internal method to append the position right after every newline character in a chunk with many short lines
+    :param chunk: Bytes read from the file
+    :param position: Position of the first byte of the chunk in the file
+    :param n_newlines: Number of newline characters in the chunk
+    :param line_starts: Array to append the positions to
+    """
+    # running sum of (part length + newline character), starting at the chunk position
+    ends = accumulate(map(add, map(len, chunk.split(b"\n")), repeat(1)), initial=position)
+    next(ends)
+    line_starts.extend(islice(ends, n_newlines))  # the last part is not followed by a newline
+
+
+def _search_chunk(chunk: bytes, position: int, line_starts: array) -> None:
+    """
+    Internal method to append the position right after every newline character in a chunk with long lines
+    :param chunk: Bytes read from the file
+    :param position: Position of the first byte of the chunk in the file
+    :param line_starts: Array to append the positions to
+    """
+    find, append = chunk.find, line_starts.append
+    newline = find(b"\n")
+    while newline != -1:
+        append(position + newline + 1)
+        newline = find(b"\n", newline + 1)
+
+
+def split_ranges(size: int, workers: int, min_range_size: int = MIN_RANGE_SIZE) -> list[tuple[int, int]]:
+    """
+    Split a file into contiguous byte ranges to be scanned independently
+    :param size: Size of the file, in bytes
+    :param workers: Maximum number of ranges
+    :param min_range_size: Minimum size of each range, except for the last one
+    :return: list of (start, end) positions of each range, covering the entire file
+    """
+    n_ranges = max(min(workers, size // max(min_range_size, 1)), 1)
+    bounds = [size * i // n_ranges for i in range(n_ranges + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def scan_line_offsets(path: os.PathLike, chunk_size: int = CHUNK_SIZE, workers: int = 1,
+                      min_range_size: int = MIN_RANGE_SIZE, offsets: LineOffsets | None = None,
+                      progress: IndexingProgress | None = None, range_size: int = RANGE_SIZE,
+                      size: int | None = None) -> LineOffsets:
+    """
+    Read the entire file and compute the number of bytes before each line begins.
+    With more than one worker, the file is split into byte ranges which are scanned by a pool of processes, and the
+    positions found in each range are concatenated in order
+    :param path: Path to the file to scan
+    :param chunk_size: Number of bytes to read at a time
+    :param workers: Number of processes scanning the file in parallel. A single worker scans it in this process
+    :param min_range_size: Minimum number of bytes of the file per worker
+    :param offsets: Optional empty table to populate, so that the offsets found so far can be used while the file is
+        being scanned. Until the scan is done, the last offset may belong to a line which is not complete yet
+    :param progress: Optional progress to update after each chunk (or range, with more than one worker) is scanned
+    :param range_size: Number of bytes scanned by each task, with more than one worker
+    :param size: Number of bytes to scan, from the start of the file, such as its size when its signature was computed,
+        so that bytes appended while it is scanned are left for the next scan. Defaults to its current size
+    :raises FileNotFoundError: if the file does not exist
+    :raises IndexingCancelledError: if the progress is cancelled before the scan is done
+    :return: table representing the number of bytes in a file before the n-th line begins
+    """
+    size = size if size is not None else os.path.getsize(path)
+    ranges = split_ranges(size, workers, min_range_size)
+    offsets = offsets if offsets is not None else LineOffsets()
+    progress = progress if progress is not None else IndexingProgress()
+    progress.total_bytes = size
+    if size:
+        offsets.append(0)
+
+    if len(ranges) == 1:
+        for line_starts, position in iter_line_starts(path, 0, size, chunk_size):
+            if progress.cancelled:
+                raise IndexingCancelledError()
+            offsets.extend(line_starts)
+            progress.update(position, len(offsets))
+    else:
+        _scan_in_parallel(path, size, len(ranges), chunk_size, range_size, offsets, progress)
+
+    if len(offsets) > 1 and offsets[-1] == size:
+        offsets.pop()  # a newline at the end of the file does not start a new line
+    progress.update(size, len(offsets))
+
+    return offsets
+
+
+def _scan_in_parallel(path: os.PathLike, size: int, workers: int, chunk_size: int, range_size: int,
+                      offsets: LineOffsets, progress: IndexingProgress) -> None:
+    """
+    Internal function to scan a file with a pool of processes, one range of bounded size at a time each. Only a few
+    ranges are submitted ahead of the one being added to the table, so that a cancelled scan stops once the ranges
+    being scanned are done, instead of scanning the rest of the file
+    :param path: Path to the file to scan
+    :param size: Number of bytes to scan, from the start of the file
+    :param workers: Number of processes scanning the file in parallel
+    :param chunk_size: Number of bytes to read at a time
+    :param range_size: Number of bytes scanned by each task
+    :param offsets: Table to populate, which already holds the offset of the first line
+    :param progress: Progress to update after each range is scanned
+    :raises IndexingCancelledError: if the progress is cancelled before the scan is done
+    """
+    ranges = iter(split_ranges(size, max(size // max(range_size, 1), workers), min_range_size=1))
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD))
+    try:
+        pending = deque((executor.submit(find_line_starts, path, start, end, chunk_size), end)
+                        for start, end in islice(ranges, 2 * workers))
+        while pending:
+            future, position = pending.popleft()
+            line_starts = future.result()
+            if progress.cancelled:
+                raise IndexingCancelledError()
+            offsets.extend(line_starts)
+            progress.update(position, len(offsets))
+            for start, end in islice(ranges, 1):
+                pending.append((executor.submit(find_line_starts, path, start, end, chunk_size), end))
+    finally:
+        executor.shutdown(cancel_futures=True)  # only waits for the ranges being scanned
+
+
+def scan_appended_line_offsets(path: os.PathLike, previous_size: int, size: int,
+                               chunk_size: int = CHUNK_SIZE) -> LineOffsets:
+    """
+    Read the bytes appended to a file since it was scanned, and compute the number of bytes before each line beginning
+    in them. A last line which was not complete yet at the previous size (no newline character) is continued by the
+    appended bytes, rather than counted as a new line
+    :param path: Path to the file to scan
+    :param previous_size: Size of the file when it was scanned, in bytes
+    :param size: Current size of the file, in bytes
+    :param chunk_size: Number of bytes to read at a time
+    :raises FileNotFoundError: if the file does not exist
+    :return: table to add to the end of the one computed when the file was scanned
+    """
+    offsets = LineOffsets()
+    if previous_size == 0 and size > 0:
+        offsets.append(0)
+
+    # the newline character ending the file at its previous size, if any, is where the first appended line begins
+    for line_starts, _ in iter_line_starts(path, max(previous_size - 1, 0), size, chunk_size):
+        offsets.extend(line_starts)
+
+    if offsets and offsets[-1] == size:
+        offsets.pop()  # a newline at the end of the file does not start a new line
+    return offsets
@@ -1,11 +1,52 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import uvicorn
 
-from src.router import router
+from src import constants
+from src.metrics import ServingMetrics
+from src.router import files_router, router, status_router
+from src.service import FilesService, LineService
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Create the `LineService` instance shared by all requests when the app starts, which holds the pre-processed
+    offsets, the served file and the cache for the lifetime of the app, and release them when the app stops.
+    The pre-processing step runs in the background, so that the app accepts requests (and reports its progress on
+    `/ready`) while the file is being read, and the served file is then checked for changes in the background.
+    When the app serves many files, a `FilesService` instance is created instead (or as well), which loads them lazily.
+    Both record the time spent serving lines in the same histograms, reported on `/metrics`
+    :param app: App being started
+    """
+    metrics = ServingMetrics()
+    app.state.metrics = metrics
+    files_service = FilesService(metrics) if constants.FILES_TO_SERVE is not None else None
+    app.state.files_service = files_service
+    service = LineService(metrics=metrics) if constants.FILE_PATH_TO_SERVE is not None else None
+    app.state.line_service = service
+    if service is None:
+        yield
+    else:
+        pre_processing = service.pre_process_in_background()  # started here to ensure it only runs once per app
+        watching = service.watch_in_background()
+        yield
+        watching.cancel()
+        service.cancel_pre_processing()
+        await asyncio.gather(pre_processing, watching, return_exceptions=True)
+        service.close()
+    if files_service is not None:
+        files_service.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router, prefix="/lines", tags=["lines"])
+app.include_router(files_router, prefix="/files", tags=["files"])
+app.include_router(status_router, tags=["status"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,155 @@
+import os
+import threading
+from bisect import bisect_left
+from collections.abc import Iterable
+
+# upper bounds of the histogram buckets, in seconds: serving a line takes microseconds, reading a cold page milliseconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# upper bounds of the buckets of the index build duration, in seconds: from loading a persisted index to reading 1 TB
+BUILD_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 300.0, 1800.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text exposition format
+
+
+class Histogram:
+    """
+    Distribution of observed values, counted in buckets, as exposed by Prometheus histograms. Observing a value only
+    increments a few counters, so it can be done on every request, from any thread
+    """
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        """
+        :param buckets: Upper bounds of the buckets, in increasing order. A last bucket without upper bound is added
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # number of values in each bucket, not cumulated
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: Value to count in the bucket with the lowest upper bound greater than or equal to it
+        """
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Exposition:
+    """
+    Metrics written in the Prometheus text exposition format. Samples of the same family may be added several times,
+    with different labels, for instance once by each service; they are rendered together
+    """
+    def __init__(self, prefix: str = "line_server_") -> None:
+        """
+        :param prefix: Prefix of the name of every metric
+        """
+        self.prefix = prefix
+        self._families: dict[str, list[str]] = {}  # lines of each family, starting with its help and type
+
+    def add(self, name: str, kind: str, description: str, value: float, labels: dict[str, str] | None = None) -> None:
+        """
+        Add a sample of a counter or gauge
+        :param name: Name of the metric, without prefix
+        :param kind: "counter" or "gauge"
+        :param description: Help text of the metric
+        :param value: Value of the sample
+        :param labels: Optional labels of the sample
+        """
+        name = self.prefix + name
+        self._family(name, kind, description).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def add_histogram(self, name: str, description: str, histogram: Histogram,
+                      labels: dict[str, str] | None = None) -> None:
+        """
+        Add a sample of a histogram
+        :param name: Name of the metric, without prefix
+        :param description: Help text of the metric
+        :param histogram: Histogram whose buckets, sum and count are added
+        :param labels: Optional labels of the sample
+        """
+        name = self.prefix + name
+        lines = self._family(name, "histogram", description)
+        labels = labels or {}
+        cumulated = 0
+        for bound, count in zip((*histogram.buckets, float("inf")), histogram.counts):
+            cumulated += count
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulated}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        """
+        :return: every metric added, in the Prometheus text exposition format
+        """
+        return "".join(line + "\n" for lines in self._families.values() for line in lines)
+
+    def _family(self, name: str, kind: str, description: str) -> list[str]:
+        """
+        Internal method to find the lines of a family, adding its help and type first if it has no samples yet
+        :param name: Name of the metric, with its prefix
+        :param kind: Type of the metric
+        :param description: Help text of the metric
+        :return: lines of the family, to append samples to
+        """
+        lines = self._families.get(name)
+        if lines is None:
+            lines = self._families[name] = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        return lines
+
+
+class ServingMetrics:
+    """Time spent in each stage of serving lines, and in building indexes, shared by every served file"""
+    def __init__(self) -> None:
+        self.index_lookup = Histogram()  # validating line indices and finding their position in the file
+        self.file_read = Histogram()  # reading bytes from the file, or waiting for a thread to read them
+        self.serialization = Histogram()  # encoding lines into a response body
+        self.index_build = Histogram(BUILD_BUCKETS)  # pre-processing a file, or loading its persisted index
+
+    def write(self, exposition: Exposition) -> None:
+        """
+        :param exposition: Exposition where the histograms are added
+        """
+        description = "Time spent in each stage of serving lines, in seconds"
+        for stage in ("index_lookup", "file_read", "serialization"):
+            exposition.add_histogram("request_stage_seconds", description, getattr(self, stage), {"stage": stage})
+        exposition.add_histogram("index_build_seconds", "Time spent pre-processing files or loading their persisted "
+                                 "index, in seconds", self.index_build)
+
+
+def _format_labels(labels: dict[str, str] | None) -> str:
+    """
+    :param labels: Names and values of the labels of a sample, if any
+    :return: labels formatted as in the Prometheus text exposition format, or an empty string if there are none
+    """
+    if not labels:
+        return ""
+
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{key}="{escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    """
+    :param value: Value of a sample
+    :return: value formatted as in the Prometheus text exposition format
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def count_open_files() -> int | None:
+    """
+    :return: number of file descriptors open in this process, or None if it cannot be found (Linux only)
+    """
+    try:
+        return len(os.listdir("/proc/self/fd")) - 1  # the directory listing itself uses one
+    except OSError:
+        return None
@@ -1,22 +1,305 @@
+import time
+from collections.abc import Awaitable, Callable
+from enum import Enum
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic.types import NonNegativeInt
 
-from src.service import LineService
+from src import constants
+from src.metrics import CONTENT_TYPE, Exposition, count_open_files
+from src.service import FilesService, LineService, Newline
 
 
-router = APIRouter()  # router to append to the main app
-bytes_before_line = LineService().pre_process()  # pre-processing step made here to ensure it only runs once per app
+RAW_MEDIA_TYPE = "application/octet-stream"
+PLAIN_MEDIA_TYPE = f"text/plain; charset={constants.FILE_ENCODING}"
 
 
-@router.get("/{line_index}", responses={413: {"description": "Line index out of range"}})
-async def get_line(service: Annotated[LineService, Depends()], line_index: NonNegativeInt) -> str:
+class LineFormat(str, Enum):
+    """Representation of the lines in responses"""
+    TEXT = "text"  # JSON string, or list of strings, decoded with the encoding of the served files
+    RAW = "raw"  # contents of the lines as stored in the served file, concatenated, without decoding them
+    PLAIN = "plain"  # same contents as `raw`, labelled as text in the encoding of the served files
+
+    @property
+    def media_type(self) -> str:
+        """Media type of the responses"""
+        return {LineFormat.TEXT: "application/json", LineFormat.RAW: RAW_MEDIA_TYPE,
+                LineFormat.PLAIN: PLAIN_MEDIA_TYPE}[self]
+
+
+status_router = APIRouter()  # router with the status of the app, to append to the main app without a prefix
+files_router = APIRouter()  # router serving lines from many files, to append to the main app
+
+
+def get_line_service(request: Request) -> LineService:
+    """
+    :param request: Request being handled
+    :raises HTTPException: with HTTP 404 status, if the app serves many files instead of a single one
+    :return: `LineService` instance created when the app started, and shared by all requests
+    """
+    if request.app.state.line_service is None:
+        raise HTTPException(status_code=404, detail="No file is served under /lines; see /files")
+    return request.app.state.line_service
+
+
+def get_files_service(request: Request) -> FilesService:
+    """
+    :param request: Request being handled
+    :raises HTTPException: with HTTP 404 status, if the app serves a single file instead of many
+    :return: `FilesService` instance created when the app started, and shared by all requests
+    """
+    if request.app.state.files_service is None:
+        raise HTTPException(status_code=404, detail="No files are served under /files; see /lines")
+    return request.app.state.files_service
+
+
+async def get_file_line_service(files_service: Annotated[FilesService, Depends(get_files_service)],
+                                file_name: str) -> LineService:
+    """
+    :param files_service: `FilesService` instance responsible for handling the business logic of serving many files
+    :param file_name: Name of the served file
+    :return: `LineService` instance serving lines from the file, which is loaded first if it is not loaded
+    """
+    return await files_service.get_line_service(file_name)
+
+
+@status_router.get("/ready", responses={503: {"description": "File is still being pre-processed"}})
+async def ready(request: Request) -> JSONResponse:
+    """
+    Report whether the served file was pre-processed, so that every line can be retrieved, along with the progress of
+    the pre-processing step: bytes scanned, total bytes, lines found and estimated remaining time, in seconds.
+    While the file is being pre-processed, HTTP 503 is returned, with a `Retry-After` header.
+    When the app serves many files instead of a single one, they are pre-processed when they are first accessed, so the
+    app is always ready.\f
+    :param request: Request being handled
+    :return: readiness and progress of the pre-processing step
+    """
+    service = request.app.state.line_service
+    if service is None:
+        return JSONResponse({"ready": True})
+    readiness = service.readiness()
+    if readiness["ready"]:
+        return JSONResponse(readiness)
+    return JSONResponse(readiness, status_code=503, headers={"Retry-After": str(service.retry_after())})
+
+
+@status_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request) -> PlainTextResponse:
+    """
+    Report metrics of the app in the Prometheus text exposition format: latency histograms of each stage of serving
+    lines (index lookup, file read and serialization), duration of the pre-processing steps, size of the offsets tables,
+    cache hits and misses, reads in flight and open file handles. Each app worker reports its own metrics.\f
+    :param request: Request being handled
+    :return: metrics of the app
+    """
+    exposition = Exposition()
+    request.app.state.metrics.write(exposition)
+    if request.app.state.line_service is not None:
+        request.app.state.line_service.write_metrics(exposition)
+    if request.app.state.files_service is not None:
+        request.app.state.files_service.write_metrics(exposition)
+    open_files = count_open_files()
+    if open_files is not None:
+        exposition.add("open_files", "gauge", "Number of file descriptors open in the app worker", open_files)
+    return PlainTextResponse(exposition.render(), media_type=CONTENT_TYPE)
+
+
+def _json_response(service: LineService, content: str | list[str]) -> JSONResponse:
+    """
+    Encode lines into a JSON response, recording the time it took
+    :param service: `LineService` instance which retrieved the lines
+    :param content: Text of the line, or of each line
+    :return: response with the encoded lines
+    """
+    started = time.perf_counter()
+    response = JSONResponse(content)
+    if service.metrics is not None:
+        service.metrics.serialization.observe(time.perf_counter() - started)
+    return response
+
+
+def _raw_response(service: LineService, content: bytes | list[bytes], line_format: LineFormat,
+                  etag: str | None = None) -> Response:
     """
-    Retrieve content of the line of the provided index, starting with index 0.
-    If the provided index is beyond the end of the file, HTTP 413 is returned.\f
-    :param service: `LineService` instance responsible for handling the business logic of retrieving a line
-    :param line_index: Line index, as a non-negative integer. The first line of a file is index 0
-    :return: desired line of the served file
+    Concatenate the raw contents of lines into a response, recording the time it took
+    :param service: `LineService` instance which retrieved the lines
+    :param content: Contents of the line, or of each line
+    :param line_format: Representation of the lines, other than `LineFormat.TEXT`
+    :param etag: Entity tag of the lines, if they can be cached
+    :return: response with the contents of the lines
     """
-    return await service.get_line(line_index, bytes_before_line)
+    started = time.perf_counter()
+    response = Response(content if isinstance(content, bytes) else b"".join(content),
+                        media_type=line_format.media_type, headers=_cache_headers(etag))
+    if service.metrics is not None:
+        service.metrics.serialization.observe(time.perf_counter() - started)
+    return response
+
+
+def _check_separated(line_format: LineFormat, newline: Newline, n_lines: int) -> None:
+    """
+    Ensure that lines concatenated into a raw response can be told apart, which they cannot without newline characters
+    :param line_format: Representation of the lines in the response
+    :param newline: Newline convention of the lines returned
+    :param n_lines: Maximum number of lines returned
+    :raises HTTPException: with HTTP 422 status, if several raw lines are requested without their newline characters
+    """
+    if line_format is not LineFormat.TEXT and newline is Newline.STRIP and n_lines > 1:
+        raise HTTPException(status_code=422, detail="Lines without newline characters cannot be concatenated: use "
+                                                    "format=text, or another newline convention")
+
+
+def _cache_headers(etag: str | None) -> dict[str, str]:
+    """
+    :param etag: Entity tag of the lines returned, if they can be cached
+    :return: headers telling clients and caches how to cache the lines
+    """
+    return {"ETag": etag, "Cache-Control": constants.CACHE_CONTROL} if etag is not None else {}
+
+
+def _etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """
+    :param if_none_match: Value of the If-None-Match header of the request: entity tags of the lines held by the client
+    :param etag: Entity tag of the lines requested, if they can be cached
+    :return: whether the client already holds the lines requested, so that they do not need to be read and sent again
+    """
+    if if_none_match is None or etag is None:
+        return False
+    etags = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return etag in etags or "*" in etags
+
+
+def create_lines_router(get_service: Callable[..., LineService | Awaitable[LineService]]) -> APIRouter:
+    """
+    Create the endpoints retrieving lines of a file, so that they can be appended to the main app once for each way of
+    choosing the file to serve
+    :param get_service: Dependency returning the `LineService` instance serving lines from the file
+    :return: router to append to the main app
+    """
+    lines_router = APIRouter()
+    Service = Annotated[LineService, Depends(get_service)]
+    Format = Annotated[LineFormat, Query(alias="format", description="`text` for JSON, `raw` or `plain` for the raw "
+                                                                     "contents, as binary data or text")]
+    NewlineConvention = Annotated[Newline, Query(description="Newline characters ending the lines returned")]
+    IfNoneMatch = Annotated[str | None, Header(description="Entity tags of the lines held, returned with `format=raw` "
+                                                           "or `format=plain`")]
+    responses = {200: {"content": {RAW_MEDIA_TYPE: {}, PLAIN_MEDIA_TYPE: {}}},
+                 304: {"description": "Lines not modified since the request of the provided entity tag"},
+                 413: {"description": "Line index out of range"},
+                 503: {"description": "File is still being pre-processed"}}
+    batch_responses = {status: response for status, response in responses.items() if status != 304}
+
+    @lines_router.get("", response_model=list[str], responses=responses)
+    async def get_line_range(
+        service: Service, start: NonNegativeInt,
+        count: Annotated[int, Query(ge=1, le=constants.MAX_LINES_PER_REQUEST)] = 1,
+        line_format: Format = LineFormat.TEXT, newline: NewlineConvention = Newline.KEEP,
+        if_none_match: IfNoneMatch = None
+    ) -> Response:
+        """
+        Retrieve content of up to `count` consecutive lines, starting with the line of index `start`. Fewer lines are
+        returned if the end of the file is reached. If `start` is beyond the end of the file, HTTP 413 is returned.
+        While the file is being pre-processed, HTTP 503 is returned if the range goes past the lines found so far.
+        With `format=raw` or `format=plain`, the contents of the lines are returned as stored in the file, concatenated,
+        with `ETag` and `Cache-Control` headers. HTTP 304 is returned if the lines did not change since the request of
+        the entity tag provided in the `If-None-Match` header. As the lines could not be told apart, HTTP 422 is
+        returned if more than one of them is requested with `newline=strip`.\f
+        :param service: `LineService` instance responsible for handling the business logic of retrieving lines
+        :param start: Index of the first line, as a non-negative integer. The first line of a file is index 0
+        :param count: Maximum number of lines to retrieve
+        :param line_format: Representation of the lines in the response
+        :param newline: Newline convention of the lines returned
+        :param if_none_match: Entity tags of the lines held by the client
+        :return: desired lines of the served file
+        """
+        if line_format is LineFormat.TEXT:
+            return _json_response(service, await service.get_line_range(start, count, newline))
+        _check_separated(line_format, newline, count)
+        etag = service.etag(line_format.value, start, count, newline.value)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+        return _raw_response(service, await service.get_line_range_bytes(start, count, newline), line_format, etag)
+
+    @lines_router.post("/batch", response_model=list[str], responses=batch_responses)
+    async def get_lines(
+        service: Service,
+        line_indices: Annotated[list[NonNegativeInt], Body(min_length=1, max_length=constants.MAX_LINES_PER_REQUEST)],
+        line_format: Format = LineFormat.TEXT, newline: NewlineConvention = Newline.KEEP
+    ) -> Response:
+        """
+        Retrieve content of the lines of the provided indices, in the same order, with a single request.
+        If any of the provided indices is beyond the end of the file, HTTP 413 is returned.
+        With `format=raw` or `format=plain`, the contents of the lines are returned as stored in the file,
+        concatenated. As the lines could not be told apart, HTTP 422 is returned if more than one of them is requested
+        with `newline=strip`.\f
+        :param service: `LineService` instance responsible for handling the business logic of retrieving lines
+        :param line_indices: Line indices, as non-negative integers. The first line of a file is index 0
+        :param line_format: Representation of the lines in the response
+        :param newline: Newline convention of the lines returned
+        :return: desired lines of the served file
+        """
+        if line_format is not LineFormat.TEXT:
+            _check_separated(line_format, newline, len(line_indices))
+            return _raw_response(service, await service.get_lines_bytes(line_indices, newline), line_format)
+        return _json_response(service, await service.get_lines(line_indices, newline))
+
+    @lines_router.get("/stream", response_class=StreamingResponse,
+                      responses={200: {"content": {"text/plain": {}}}, 413: {"description": "Line index out of range"},
+                                 503: {"description": "File is still being pre-processed"}})
+    async def stream_line_range(service: Service, start: NonNegativeInt,
+                                count: Annotated[int, Query(ge=1)] = 1) -> StreamingResponse:
+        """
+        Stream the raw content of up to `count` consecutive lines, starting with the line of index `start`, as plain
+        text. The content is read from the file in chunks while it is sent, so very long lines and large ranges can be
+        retrieved. If `start` is beyond the end of the file, HTTP 413 is returned. While the file is being
+        pre-processed, HTTP 503 is returned if the range goes past the lines found so far.\f
+        :param service: `LineService` instance responsible for handling the business logic of retrieving lines
+        :param start: Index of the first line, as a non-negative integer. The first line of a file is index 0
+        :param count: Maximum number of lines to retrieve
+        :return: response streaming the desired lines of the served file
+        """
+        return StreamingResponse(service.stream_line_range(start, count), media_type="text/plain")
+
+    @lines_router.get("/{line_index}", response_model=str, responses=responses)
+    async def get_line(service: Service, line_index: NonNegativeInt, line_format: Format = LineFormat.TEXT,
+                       newline: NewlineConvention = Newline.KEEP, if_none_match: IfNoneMatch = None) -> Response:
+        """
+        Retrieve content of the line of the provided index, starting with index 0.
+        If the provided index is beyond the end of the file, HTTP 413 is returned. If the file is still being
+        pre-processed and the line was not reached yet, HTTP 503 is returned, with a `Retry-After` header.
+        With `format=raw` or `format=plain`, the contents of the line are returned as stored in the file, without JSON
+        encoding, with `ETag` and `Cache-Control` headers. HTTP 304 is returned if the line did not change since the
+        request of the entity tag provided in the `If-None-Match` header.\f
+        :param service: `LineService` instance responsible for handling the business logic of retrieving a line
+        :param line_index: Line index, as a non-negative integer. The first line of a file is index 0
+        :param line_format: Representation of the line in the response
+        :param newline: Newline convention of the line returned
+        :param if_none_match: Entity tags of the lines held by the client
+        :return: desired line of the served file
+        """
+        if line_format is LineFormat.TEXT:
+            return _json_response(service, await service.get_line(line_index, newline))
+        etag = service.etag(line_format.value, line_index, newline.value)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+        return _raw_response(service, await service.get_line_bytes(line_index, newline), line_format, etag)
+
+    return lines_router
+
+
+router = create_lines_router(get_line_service)  # router serving lines from a single file, to append to the main app
+
+
+@files_router.get("")
+async def list_files(files_service: Annotated[FilesService, Depends(get_files_service)]) -> list[str]:
+    """
+    List the names of the served files, whose lines can be retrieved under `/files/{file_name}/lines`.\f
+    :param files_service: `FilesService` instance responsible for handling the business logic of serving many files
+    :return: names of the served files
+    """
+    return files_service.list_files()
+
+
+files_router.include_router(create_lines_router(get_file_line_service), prefix="/{file_name}/lines")
@@ -1,43 +1,255 @@
+import asyncio
 import logging
+import math
+from collections.abc import AsyncIterator, Iterator, Sequence
+from contextlib import contextmanager
+from enum import Enum
 
 from fastapi import HTTPException
 
 from src import constants
-from src.file_handlers.exceptions import LineIndexOutOfRangeError
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import (IndexingCancelledError, IndexNotReadyError, LineIndexOutOfRangeError,
+                                         UnknownFileError)
+from src.file_handlers import bgzf
+from src.file_handlers.manager_compressed import CompressedFileManager
 from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.reader import AsyncReader
+from src.file_handlers.registry import FileRegistry, load_manifest
+from src.metrics import Exposition, ServingMetrics
+
+
+class Newline(str, Enum):
+    """Newline convention of the lines returned, whatever the convention of the served file"""
+    KEEP = "keep"  # as in the served file
+    LF = "lf"  # "\n"
+    CRLF = "crlf"  # "\r\n"
+    STRIP = "strip"  # no newline characters
+
+    def apply(self, line: bytes) -> bytes:
+        """
+        :param line: Contents of a line, as read from the served file
+        :return: contents of the line ending with this newline convention. A last line without newline characters is
+            left without them
+        """
+        if self is Newline.KEEP:
+            return line
+        body = line[:-2] if line.endswith(b"\r\n") else line[:-1] if line.endswith(b"\n") else line
+        if self is Newline.STRIP or len(body) == len(line):
+            return body
+        return body + (b"\n" if self is Newline.LF else b"\r\n")
 
 
 class LineService:
     """Service responsible for bridging between the app and the business logic of serving lines from a file"""
-    def __init__(self) -> None:
+    def __init__(self, manager: FileManagerWithPreProcessing | None = None,
+                 metrics: ServingMetrics | None = None) -> None:
+        """
+        :param manager: Optional manager of the served file. If not provided, the file configured by the constants is
+            served, decompressing it block by block if it is block-compressed
+        :param metrics: Optional histograms where the time spent serving lines is recorded
+        """
         self.logger = logging.getLogger("uvicorn")
-        self.manager = FileManagerWithPreProcessing(constants.FILE_PATH_TO_SERVE, logger=self.logger)
+        self.metrics = metrics
+        self.manager = manager if manager is not None else self._create_manager()
 
-    async def get_line(self, line_index: int, bytes_before_line: list[int] | None = None) -> str:
+    def _create_manager(self) -> FileManagerWithPreProcessing:
+        """
+        Internal method to create the manager of the file configured by the constants
+        :return: manager of the served file
         """
-        Retrieve the n-th line of the served file
+        path = constants.FILE_PATH_TO_SERVE
+        index_path = constants.INDEX_FILE_PATH if constants.PERSIST_INDEX else None
+        cache = LineCache(constants.CACHE_MAX_BYTES) if constants.CACHE_MAX_BYTES > 0 else None
+        if bgzf.is_block_compressed(path):
+            block_cache = LineCache(constants.BLOCK_CACHE_MAX_BYTES) if constants.BLOCK_CACHE_MAX_BYTES > 0 else None
+            return CompressedFileManager(path, self.logger, index_path=index_path, reader=_create_reader(),
+                                         cache=cache, block_cache=block_cache, metrics=self.metrics)
+        return FileManagerWithPreProcessing(path, self.logger, index_path=index_path,
+                                            indexing_workers=constants.INDEXING_WORKERS, reader=_create_reader(),
+                                            cache=cache, metrics=self.metrics)
+
+    async def get_line(self, line_index: int, newline: Newline = Newline.KEEP) -> str:
+        """
+        Retrieve the n-th line of the served file, as text
         :param line_index: Index of the line to retrieve. Indices start at 0
-        :param bytes_before_line: Optional list representing the number of bytes to skip before the n-th line starts.
-            If this is provided, or if this method is not being called for the first time, the pre-processing step,
-            which reads the entire file once, is not executed
-        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs, or
-            with HTTP 413 status if the line index is higher than the number of lines existing in the file
+        :param newline: Newline convention of the line returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if the line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if the line was not reached yet by the pre-processing step
         :return: line text
         """
-        self.logger.info("Retrieving line from served file", extra={"line_index": line_index})
-        if bytes_before_line:
-            self.manager.bytes_before_line = bytes_before_line
+        return self.decode(await self.get_line_bytes(line_index, newline))
+
+    async def get_line_bytes(self, line_index: int, newline: Newline = Newline.KEEP) -> bytes:
+        """
+        Retrieve the raw contents of the n-th line of the served file, without decoding them
+        :param line_index: Index of the line to retrieve. Indices start at 0
+        :param newline: Newline convention of the line returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if the line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if the line was not reached yet by the pre-processing step
+        :return: line contents
+        """
+        self.logger.debug("Retrieving line from served file", extra={"line_index": line_index})
+        with self._handle_errors():
+            return newline.apply(await self.manager.get_line_bytes(line_index))
+
+    async def get_lines(self, line_indices: Sequence[int], newline: Newline = Newline.KEEP) -> list[str]:
+        """
+        Retrieve several lines of the served file, in the requested order, as text
+        :param line_indices: Indices of the lines to retrieve. Indices start at 0
+        :param newline: Newline convention of the lines returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if any line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if any line was not reached yet by the pre-processing step
+        :return: text of each line
+        """
+        return [self.decode(line) for line in await self.get_lines_bytes(line_indices, newline)]
 
+    async def get_lines_bytes(self, line_indices: Sequence[int], newline: Newline = Newline.KEEP) -> list[bytes]:
+        """
+        Retrieve the raw contents of several lines of the served file, in the requested order, without decoding them
+        :param line_indices: Indices of the lines to retrieve. Indices start at 0
+        :param newline: Newline convention of the lines returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if any line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if any line was not reached yet by the pre-processing step
+        :return: contents of each line
+        """
+        self.logger.debug("Retrieving lines from served file", extra={"n_lines": len(line_indices)})
+        with self._handle_errors():
+            lines = await self.manager.get_lines_bytes(line_indices)
+        return lines if newline is Newline.KEEP else [newline.apply(line) for line in lines]
+
+    async def get_line_range(self, start: int, count: int, newline: Newline = Newline.KEEP) -> list[str]:
+        """
+        Retrieve up to `count` consecutive lines of the served file, as text
+        :param start: Index of the first line to retrieve. Indices start at 0
+        :param count: Maximum number of lines to retrieve. Fewer lines are returned if the end of the file is reached
+        :param newline: Newline convention of the lines returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if the first line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if any line of the range was not reached yet by the pre-processing step
+        :return: text of each line
+        """
+        return [self.decode(line) for line in await self.get_line_range_bytes(start, count, newline)]
+
+    async def get_line_range_bytes(self, start: int, count: int, newline: Newline = Newline.KEEP) -> list[bytes]:
+        """
+        Retrieve the raw contents of up to `count` consecutive lines of the served file, without decoding them
+        :param start: Index of the first line to retrieve. Indices start at 0
+        :param count: Maximum number of lines to retrieve. Fewer lines are returned if the end of the file is reached
+        :param newline: Newline convention of the lines returned
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if the first line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if any line of the range was not reached yet by the pre-processing step
+        :return: contents of each line
+        """
+        self.logger.debug("Retrieving line range from served file", extra={"start": start, "count": count})
+        with self._handle_errors():
+            lines = await self.manager.get_line_range_bytes(start, count)
+        return lines if newline is Newline.KEEP else [newline.apply(line) for line in lines]
+
+    @staticmethod
+    def decode(line: bytes) -> str:
+        """
+        :param line: Raw contents of a line
+        :return: line text, decoded with the encoding of the served files. Bytes which cannot be decoded are replaced
+            with U+FFFD, so that the raw contents should be requested for files which are not entirely text
+        """
+        return line.decode(constants.FILE_ENCODING, errors="replace")
+
+    def etag(self, *representation: str | int) -> str | None:
+        """
+        Compute the entity tag of lines of the served file, without reading them, so that clients and caches can tell
+        whether the lines they hold are still current. It changes whenever the served file does
+        :param representation: What identifies the lines and the way they are represented, such as their indices
+        :return: quoted entity tag, or None until the served file is entirely pre-processed, as its version is unknown
+            before, and fewer lines may be returned meanwhile than once it is done, for the same request
+        """
+        signature = self.manager.signature
+        if signature is None or not self.manager.ready:
+            return None
+        return f'"{signature.fingerprint}-{"-".join(map(str, representation))}"'
+
+    def stream_line_range(self, start: int, count: int) -> AsyncIterator[bytes]:
+        """
+        Stream the raw contents of up to `count` consecutive lines of the served file, in chunks of bounded size.
+        The lines are located before the stream begins, so that errors are raised before any response is sent
+        :param start: Index of the first line to retrieve. Indices start at 0
+        :param count: Maximum number of lines to retrieve. Fewer lines are returned if the end of the file is reached
+        :raises HTTPException: with HTTP 500 status, if the file is not found or an unhandled error occurs,
+            with HTTP 413 status if the first line index is higher than the number of lines existing in the file, or
+            with HTTP 503 status if any line of the range was not reached yet by the pre-processing step
+        :return: asynchronous iterator over the contents of the lines, including newline characters
+        """
+        self.logger.debug("Streaming line range from served file", extra={"start": start, "count": count})
+        with self._handle_errors():
+            state, range_start, range_end = self.manager.get_line_range_bounds(start, count)
+        return self.manager.iter_bytes(state, range_start, range_end, constants.STREAM_CHUNK_SIZE)
+
+    def readiness(self) -> dict:
+        """
+        :return: whether every line of the served file can be retrieved, along with the progress of the pre-processing
+            step, as a JSON-serializable dictionary
+        """
+        progress = self.manager.progress.as_dict() if self.manager.progress is not None else {}
+        return {"ready": self.manager.ready, **progress}
+
+    def retry_after(self) -> int:
+        """
+        :return: number of seconds a client should wait before retrying a request for a line which was not reached yet
+            by the pre-processing step, based on its estimated remaining time
+        """
+        eta = self.manager.progress.eta_seconds if self.manager.progress is not None else None
+        return min(max(math.ceil(eta), 1), constants.MAX_RETRY_AFTER) if eta is not None else 1
+
+    def write_metrics(self, exposition: Exposition) -> None:
+        """
+        Add the state of the offsets table, the cache and the reader of the served file to the metrics of the app
+        :param exposition: Exposition where the metrics are added
+        """
+        labels = {"source": "lines"}
+        offsets = self.manager.bytes_before_line
+        exposition.add("index_ready", "gauge", "Whether every line of the served files can be retrieved",
+                       int(self.manager.ready), labels)
+        exposition.add("index_lines", "gauge", "Number of lines found in the served files",
+                       len(offsets) if offsets is not None else 0, labels)
+        exposition.add("index_memory_bytes", "gauge", "Size of the offsets tables of the served files, in bytes",
+                       offsets.nbytes if offsets is not None else 0, labels)
+        if self.manager.progress is not None and self.manager.progress.done:
+            exposition.add("index_last_build_seconds", "gauge", "Duration of the last pre-processing step, in seconds",
+                           self.manager.progress.elapsed_seconds, labels)
+        if self.manager.cache is not None:
+            _write_cache_metrics(exposition, self.manager.cache, {**labels, "cache": "lines"})
+        if isinstance(self.manager, CompressedFileManager) and self.manager.block_cache is not None:
+            _write_cache_metrics(exposition, self.manager.block_cache, {**labels, "cache": "blocks"})
+        if self.manager.reader is not None:
+            _write_reader_metrics(exposition, self.manager.reader, labels)
+
+    @contextmanager
+    def _handle_errors(self) -> Iterator[None]:
+        """
+        Internal context manager translating errors raised while retrieving lines into HTTP errors
+        :raises HTTPException: with HTTP 500 status, if the file is not found, with HTTP 413 status if a line index
+            is higher than the number of lines existing in the file, or with HTTP 503 status if a line was not reached
+            yet by the pre-processing step
+        """
         try:
-            return await self.manager.get_line(line_index)
+            yield
         except FileNotFoundError:
             raise HTTPException(status_code=500, detail="File not found")
         except LineIndexOutOfRangeError:
             raise HTTPException(status_code=413, detail="Line index is out of range")
+        except IndexNotReadyError:
+            raise HTTPException(status_code=503, detail="File is still being pre-processed",
+                                headers={"Retry-After": str(self.retry_after())})
 
-    def pre_process(self) -> list[int]:
+    def pre_process(self) -> LineOffsets:
         """
-        :return: list with the number of bytes written in the file before the line of a given index starts
+        :return: table with the number of bytes written in the file before the line of a given index starts
         """
         self.logger.info("Pre-processing file to speed up future requests")
         from time import time
@@ -46,3 +258,164 @@ class LineService:
         end = time()
         self.logger.info(f"Pre-processed file in {end - start} seconds")
         return result
+
+    def pre_process_in_background(self) -> asyncio.Task:
+        """
+        Start the pre-processing step in another thread, without waiting for it. Until it is done, lines found so far
+        can be retrieved, and requests for other lines fail with HTTP 503
+        :return: task which is done when the pre-processing step is done
+        """
+        self.manager.begin_pre_processing()
+        return asyncio.create_task(self._pre_process_in_thread())
+
+    async def _pre_process_in_thread(self) -> None:
+        """Internal method to run the pre-processing step in a thread, logging errors as there is no one to raise to"""
+        try:
+            await asyncio.to_thread(self.pre_process)
+        except IndexingCancelledError:
+            self.logger.info("Pre-processing cancelled")
+        except Exception:
+            self.logger.exception("Pre-processing failed")
+
+    def watch_in_background(self) -> asyncio.Task:
+        """
+        Start checking whether the served file changed periodically, without waiting for it. Lines appended to it can be
+        retrieved shortly after, and if it is rewritten, it is pre-processed again, without interrupting requests
+        :return: task checking the served file until it is cancelled
+        """
+        return asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        """Internal method to check whether the served file changed periodically, logging errors as it goes"""
+        if constants.FILE_VALIDATION_INTERVAL <= 0:
+            return
+        while True:
+            await asyncio.sleep(constants.FILE_VALIDATION_INTERVAL)
+            try:
+                await self.manager.refresh()
+            except IndexingCancelledError:
+                self.logger.info("Pre-processing cancelled")
+            except Exception:
+                self.logger.exception("Could not check whether the served file changed")
+
+    def cancel_pre_processing(self) -> None:
+        """Ask the pre-processing step running in the background, if any, to stop as soon as possible"""
+        self.manager.cancel_pre_processing()
+
+    def close(self) -> None:
+        """Release the served file and the threads reading it"""
+        self.manager.close()
+        if self.manager.reader is not None:
+            self.manager.reader.close()
+
+
+class FilesService:
+    """Service responsible for bridging between the app and the business logic of serving lines from many files"""
+    def __init__(self, metrics: ServingMetrics | None = None) -> None:
+        """
+        :param metrics: Optional histograms where the time spent serving lines and loading files is recorded
+        """
+        self.logger = logging.getLogger("uvicorn")
+        self.registry = FileRegistry(
+            load_manifest(constants.FILES_TO_SERVE), logger=self.logger,
+            memory_budget=constants.INDEX_MEMORY_BUDGET, max_open_files=constants.MAX_OPEN_FILES,
+            persist_index=constants.PERSIST_INDEX, reader=_create_reader(),
+            block_cache_max_bytes=constants.BLOCK_CACHE_MAX_BYTES, metrics=metrics, on_release=self._release
+        )
+        # service of each loaded file, shared by the requests for it, and dropped along with its manager
+        self._line_services: dict[str, LineService] = {}
+
+    def list_files(self) -> list[str]:
+        """
+        :return: names of the served files
+        """
+        return list(self.registry.paths)
+
+    async def get_line_service(self, name: str) -> LineService:
+        """
+        Retrieve the service serving lines from one of the served files, which is loaded first if it is not loaded
+        :param name: Name of the file
+        :raises HTTPException: with HTTP 404 status, if no file is served under this name, or with HTTP 500 status, if
+            the file is not found
+        :return: `LineService` instance serving lines from the file, shared by the requests for it while it is loaded
+        """
+        try:
+            manager = await self.registry.get(name)
+        except UnknownFileError:
+            raise HTTPException(status_code=404, detail="Unknown file")
+        except FileNotFoundError:
+            raise HTTPException(status_code=500, detail="File not found")
+
+        line_service = self._line_services.get(name)
+        if line_service is None or line_service.manager is not manager:  # the file was loaded again since
+            line_service = self._line_services[name] = LineService(manager, self.registry.metrics)
+        return line_service
+
+    def _release(self, name: str) -> None:
+        """
+        Internal method to drop the service of a file released by the registry, so that its manager is not kept
+        :param name: Name of the file
+        """
+        self._line_services.pop(name, None)
+
+    def write_metrics(self, exposition: Exposition) -> None:
+        """
+        Add the state of the registry of served files and of their reader to the metrics of the app
+        :param exposition: Exposition where the metrics are added
+        """
+        labels = {"source": "files"}
+        exposition.add("files_served", "gauge", "Number of files served under /files", len(self.registry.paths))
+        exposition.add("files_loaded", "gauge", "Number of served files kept open, with their offsets table loaded",
+                       len(self.registry))
+        exposition.add("files_released_total", "counter", "Number of served files released to respect the limits",
+                       self.registry.evictions)
+        exposition.add("index_memory_bytes", "gauge", "Size of the offsets tables of the served files, in bytes",
+                       self.registry.index_memory_usage, labels)
+        exposition.add("files_memory_bytes", "gauge", "Size of the offsets tables and decompressed blocks of the "
+                       "served files, in bytes, counted against the memory budget", self.registry.memory_usage)
+        if self.registry.reader is not None:
+            _write_reader_metrics(exposition, self.registry.reader, labels)
+
+    def close(self) -> None:
+        """Release the served files and the threads reading them"""
+        self.registry.close()
+        self._line_services.clear()
+        if self.registry.reader is not None:
+            self.registry.reader.close()
+
+
+def _write_cache_metrics(exposition: Exposition, cache: LineCache, labels: dict[str, str]) -> None:
+    """
+    :param exposition: Exposition where the metrics of the cache are added
+    :param cache: Cache of recently retrieved lines or decompressed blocks
+    :param labels: Labels of the samples
+    """
+    exposition.add("cache_hits_total", "counter", "Number of lookups that found the entry in the cache", cache.hits,
+                   labels)
+    exposition.add("cache_misses_total", "counter", "Number of lookups that did not find the entry in the cache",
+                   cache.misses, labels)
+    exposition.add("cache_evictions_total", "counter", "Number of entries evicted from the cache to make room",
+                   cache.evictions, labels)
+    exposition.add("cache_hit_ratio", "gauge", "Fraction of lookups that found the entry in the cache",
+                   cache.hit_ratio, labels)
+    exposition.add("cache_bytes", "gauge", "Total size of the cached entries, in bytes", cache.size, labels)
+    exposition.add("cache_entries", "gauge", "Number of cached entries", len(cache), labels)
+
+
+def _write_reader_metrics(exposition: Exposition, reader: AsyncReader, labels: dict[str, str]) -> None:
+    """
+    :param exposition: Exposition where the metrics of the reader are added
+    :param reader: Thread pool where lines are read
+    :param labels: Labels of the samples
+    """
+    exposition.add("reads_in_flight", "gauge", "Number of reads being executed by a thread", reader.in_flight, labels)
+    exposition.add("reads_queued", "gauge", "Number of reads waiting for a free thread", reader.queued, labels)
+    exposition.add("reads_total", "counter", "Number of reads completed by a thread", reader.completed, labels)
+
+
+def _create_reader() -> AsyncReader | None:
+    """
+    :return: thread pool where lines are read, as configured by the constants, or None if they are read in the event
+        loop
+    """
+    return AsyncReader(constants.READ_CONCURRENCY) if constants.READ_CONCURRENCY > 0 else None
@@ -1,11 +1,15 @@
 import json
 import os
 import tempfile
+import time
 import unittest
-from unittest.mock import patch
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
 
 from fastapi.testclient import TestClient
 
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+
 
 class TestApp(unittest.TestCase):
     path = None
@@ -19,13 +23,29 @@ class TestApp(unittest.TestCase):
         with open(cls.path, "w") as f:
             f.writelines(content)
 
-        with patch.dict(os.environ, {"FILE_PATH_TO_SERVE": cls.path}):
-            from src import main  # Import can only occur after we patch the desired env var
+        from src import constants, main
+        # The served file is only read from the constants when the app starts, so they can be patched after the import
+        with patch.object(constants, "FILE_PATH_TO_SERVE", Path(cls.path)), \
+             patch.object(constants, "INDEX_FILE_PATH", Path(f"{cls.path}.idx")):
             cls.client = TestClient(main.app)
+            cls.client.__enter__()  # start the app, running its lifespan
+            while cls.client.get("/ready").status_code != 200:  # wait for the file to be pre-processed
+                time.sleep(0.01)
 
     @classmethod
     def tearDownClass(cls) -> None:
+        cls.client.__exit__(None, None, None)  # stop the app
         os.remove(cls.path)  # Remove temporary file after all tests run
+        for suffix in (".idx", ".idx.lock"):
+            if os.path.exists(f"{cls.path}{suffix}"):
+                os.remove(f"{cls.path}{suffix}")  # and its persisted index
+
+    def test_ready(self) -> None:
+        response = self.client.get("/ready")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["ready"])
+        self.assertEqual(response.json()["lines_found"], 3)
 
     def test_get_line_valid(self) -> None:
         response = self.client.get("/lines/1")
@@ -33,7 +53,174 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.text, json.dumps("I am line 1\n"))
 
+    def test_get_line_raw(self) -> None:
+        response = self.client.get("/lines/1", params={"format": "raw"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/octet-stream")
+        self.assertEqual(response.content, b"I am line 1\n")
+
+    def test_get_line_plain(self) -> None:
+        response = self.client.get("/lines/1", params={"format": "plain"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "text/plain; charset=utf-8")
+        self.assertEqual(response.text, "I am line 1\n")
+
+    def test_get_line_raw_cache_headers(self) -> None:
+        response = self.client.get("/lines/1", params={"format": "raw"})
+        etag = response.headers["etag"]
+
+        self.assertIn("max-age", response.headers["cache-control"])
+        self.assertNotEqual(etag, self.client.get("/lines/2", params={"format": "raw"}).headers["etag"])
+        self.assertNotEqual(etag, self.client.get("/lines/1", params={"format": "raw", "newline": "strip"})
+                            .headers["etag"])
+        self.assertNotIn("etag", self.client.get("/lines/1").headers)
+
+    def test_get_line_raw_not_modified(self) -> None:
+        etag = self.client.get("/lines/1", params={"format": "raw"}).headers["etag"]
+
+        for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            with self.subTest(if_none_match=if_none_match):
+                response = self.client.get("/lines/1", params={"format": "raw"},
+                                           headers={"If-None-Match": if_none_match})
+
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers["etag"], etag)
+                self.assertEqual(response.content, b"")
+        response = self.client.get("/lines/2", params={"format": "raw"}, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"I am line 2\n")
+
+    def test_get_line_newline(self) -> None:
+        for newline, expected in (("keep", "I am line 1\n"), ("lf", "I am line 1\n"), ("crlf", "I am line 1\r\n"),
+                                  ("strip", "I am line 1")):
+            with self.subTest(newline=newline):
+                response = self.client.get("/lines/1", params={"newline": newline})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected)
+
+    def test_get_line_invalid_format(self) -> None:
+        response = self.client.get("/lines/1", params={"format": "xml"})
+
+        self.assertEqual(response.status_code, 422)
+
     def test_get_line_out_of_range(self) -> None:
         response = self.client.get("/lines/3")
 
         self.assertEqual(response.status_code, 413)
+
+    def test_get_line_range_valid(self) -> None:
+        response = self.client.get("/lines", params={"start": 1, "count": 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), ["I am line 1\n", "I am line 2\n"])
+
+    def test_get_line_range_raw(self) -> None:
+        response = self.client.get("/lines", params={"start": 0, "count": 2, "format": "raw"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"I am line 0\nI am line 1\n")
+        etag = response.headers["etag"]
+        response = self.client.get("/lines", params={"start": 0, "count": 2, "format": "raw"},
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_line_range_raw_newline_strip(self) -> None:
+        for line_format in ("raw", "plain"):
+            with self.subTest(line_format=line_format):
+                response = self.client.get("/lines", params={"start": 0, "count": 2, "format": line_format,
+                                                             "newline": "strip"})
+
+                self.assertEqual(response.status_code, 422)
+
+        response = self.client.get("/lines", params={"start": 1, "count": 1, "format": "raw", "newline": "strip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"I am line 1")
+
+    def test_get_line_range_while_indexing(self) -> None:
+        # while indexing, the last line found is not served, as it may not be complete yet
+        with patch.object(FileManagerWithPreProcessing, "indexing", new_callable=PropertyMock, return_value=True):
+            within = self.client.get("/lines", params={"start": 0, "count": 2})
+            past = self.client.get("/lines", params={"start": 1, "count": 5})
+
+        self.assertEqual(within.status_code, 200)
+        self.assertEqual(within.json(), ["I am line 0\n", "I am line 1\n"])
+        self.assertEqual(past.status_code, 503)  # rather than cut short, as if the file ended there
+        self.assertIn("retry-after", past.headers)
+
+    def test_get_line_range_raw_while_indexing(self) -> None:
+        etag = self.client.get("/lines", params={"start": 0, "count": 2, "format": "raw"}).headers["etag"]
+        with patch.object(FileManagerWithPreProcessing, "indexing", new_callable=PropertyMock, return_value=True):
+            response = self.client.get("/lines", params={"start": 0, "count": 2, "format": "raw"},
+                                       headers={"If-None-Match": etag})
+
+        # the lines found so far may change once the file is indexed, so they are neither cached nor revalidated
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"I am line 0\nI am line 1\n")
+        self.assertNotIn("etag", response.headers)
+        self.assertNotIn("cache-control", response.headers)
+
+    def test_get_line_range_out_of_range(self) -> None:
+        response = self.client.get("/lines", params={"start": 3})
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_stream_line_range_valid(self) -> None:
+        response = self.client.get("/lines/stream", params={"start": 1, "count": 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "I am line 1\nI am line 2\n")
+
+    def test_stream_line_range_while_indexing(self) -> None:
+        with patch.object(FileManagerWithPreProcessing, "indexing", new_callable=PropertyMock, return_value=True):
+            within = self.client.get("/lines/stream", params={"start": 0, "count": 2})
+            past = self.client.get("/lines/stream", params={"start": 1, "count": 5})
+
+        self.assertEqual(within.status_code, 200)
+        self.assertEqual(within.text, "I am line 0\nI am line 1\n")
+        self.assertEqual(past.status_code, 503)
+        self.assertIn("retry-after", past.headers)
+
+    def test_stream_line_range_out_of_range(self) -> None:
+        response = self.client.get("/lines/stream", params={"start": 3})
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_get_lines_batch_valid(self) -> None:
+        response = self.client.post("/lines/batch", json=[2, 0, 2])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), ["I am line 2\n", "I am line 0\n", "I am line 2\n"])
+
+    def test_get_lines_batch_raw(self) -> None:
+        response = self.client.post("/lines/batch", params={"format": "raw", "newline": "crlf"}, json=[2, 0])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"I am line 2\r\nI am line 0\r\n")
+
+    def test_get_lines_batch_raw_newline_strip(self) -> None:
+        response = self.client.post("/lines/batch", params={"format": "plain", "newline": "strip"}, json=[2, 0])
+
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post("/lines/batch", params={"format": "plain", "newline": "strip"}, json=[2])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "I am line 2")
+
+    def test_get_lines_batch_out_of_range(self) -> None:
+        response = self.client.post("/lines/batch", json=[0, 3])
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_metrics(self) -> None:
+        self.client.get("/lines/0")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('line_server_request_stage_seconds_bucket{stage="serialization",le="+Inf"}', response.text)
+        self.assertIn('line_server_index_lines{source="lines"} 3\n', response.text)
+        self.assertIn("line_server_index_build_seconds_count 1\n", response.text)
+        self.assertIn('line_server_cache_hits_total{source="lines",cache="lines"}', response.text)
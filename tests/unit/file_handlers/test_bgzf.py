@@ -0,0 +1,105 @@
+import gzip
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from src.file_handlers import bgzf
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.progress import IndexingProgress
+
+
+def write_block_compressed(path: Path, content: bytes, block_size: int) -> None:
+    """Write a block-compressed file with small blocks, so that lines span several of them"""
+    blocks = [bgzf.compress_block(content[i:i + block_size]) for i in range(0, len(content), block_size)]
+    path.write_bytes(b"".join(blocks) + bgzf.EOF_BLOCK)
+
+
+class TestBgzf(unittest.TestCase):
+    def test_compress_block_readable_by_gzip(self) -> None:
+        content = b"ABC\nDEFG\nHI\n"
+
+        compressed = bgzf.compress_block(content[:5]) + bgzf.compress_block(content[5:]) + bgzf.EOF_BLOCK
+
+        self.assertEqual(gzip.decompress(compressed), content)
+        self.assertEqual(bgzf.decompress_block(compressed), content[:5])
+
+    def test_eof_block(self) -> None:
+        self.assertEqual(bgzf.compress_block(b""), bgzf.EOF_BLOCK)
+
+    def test_is_block_compressed(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            compressed_path, gzip_path, text_path = Path(tmpdir, "a.gz"), Path(tmpdir, "b.gz"), Path(tmpdir, "c.txt")
+            write_block_compressed(compressed_path, b"ABC\n", 2)
+            gzip_path.write_bytes(gzip.compress(b"ABC\n"))
+            text_path.write_bytes(b"ABC\n")
+
+            self.assertTrue(bgzf.is_block_compressed(compressed_path))
+            self.assertFalse(bgzf.is_block_compressed(gzip_path))  # a regular gzip file cannot be read block by block
+            self.assertFalse(bgzf.is_block_compressed(text_path))
+            self.assertFalse(bgzf.is_block_compressed(Path(tmpdir, "missing.gz")))
+
+    def test_scan_line_offsets_valid(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            write_block_compressed(path, b"ABC\nDEFG\nHI\n", 5)
+
+            offsets, blocks = bgzf.scan_line_offsets(path)
+
+        self.assertEqual(offsets, [0, 4, 9])
+        self.assertEqual(list(blocks.positions), [0, 5, 10])
+        self.assertEqual(blocks.size, 12)
+
+    def test_scan_line_offsets_no_trailing_newline(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            write_block_compressed(path, b"ABC\nDEFG\nHI", 4)
+
+            offsets, _ = bgzf.scan_line_offsets(path)
+
+        self.assertEqual(offsets, [0, 4, 9])
+
+    def test_scan_line_offsets_empty_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            path.write_bytes(bgzf.EOF_BLOCK)
+
+            offsets, blocks = bgzf.scan_line_offsets(path)
+
+        self.assertEqual(offsets, [])
+        self.assertEqual(len(blocks), 0)
+
+    def test_scan_line_offsets_corrupted(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            write_block_compressed(path, b"ABC\nDEFG\nHI\n", 5)
+            path.write_bytes(path.read_bytes()[:-40])  # truncated in the middle of a block
+
+            with self.assertRaises(ValueError):
+                bgzf.scan_line_offsets(path)
+
+    def test_scan_line_offsets_cancelled(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            write_block_compressed(path, b"ABC\nDEFG\nHI\n", 5)
+            progress = IndexingProgress()
+            progress.cancel()
+
+            with self.assertRaises(IndexingCancelledError):
+                bgzf.scan_line_offsets(path, progress=progress)
+
+    def test_read_block_index(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.gz")
+            write_block_compressed(path, b"ABC\nDEFG\nHI\n", 5)
+
+            _, scanned = bgzf.scan_line_offsets(path)
+            blocks = bgzf.read_block_index(path)
+
+        self.assertEqual(blocks.offsets, scanned.offsets)
+        self.assertEqual(blocks.positions, scanned.positions)
+        self.assertEqual(blocks.size, 12)
+        self.assertEqual([blocks.find(position) for position in (0, 4, 5, 11)], [0, 0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
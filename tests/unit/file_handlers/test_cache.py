@@ -0,0 +1,83 @@
+import unittest
+
+from src.file_handlers.cache import LineCache
+
+
+class TestLineCache(unittest.TestCase):
+    def test_get_hit_and_miss(self) -> None:
+        cache = LineCache(100)
+        cache.put(1, b"line 1\n")
+
+        self.assertEqual(cache.get(1), b"line 1\n")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.hit_ratio, 0.5)
+
+    def test_put_evicts_least_recently_used(self) -> None:
+        cache = LineCache(10)
+        cache.put(0, b"aaaa")
+        cache.put(1, b"bbbb")
+        cache.get(0)  # line 1 becomes the least recently used
+
+        cache.put(2, b"cccc")
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0), b"aaaa")
+        self.assertEqual(cache.get(2), b"cccc")
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 8)
+
+    def test_put_evicts_until_line_fits(self) -> None:
+        cache = LineCache(10)
+        for line_index in range(5):
+            cache.put(line_index, b"aa")
+
+        cache.put(5, b"b" * 9)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 9)
+        self.assertEqual(cache.evictions, 5)
+
+    def test_put_line_larger_than_cache(self) -> None:
+        cache = LineCache(10)
+        cache.put(0, b"aa")
+
+        cache.put(1, b"b" * 11)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0), b"aa")
+
+    def test_put_existing_line(self) -> None:
+        cache = LineCache(10)
+        cache.put(0, b"aa")
+
+        cache.put(0, b"bbb")
+
+        self.assertEqual(cache.get(0), b"bbb")
+        self.assertEqual(cache.size, 3)
+
+    def test_discard(self) -> None:
+        cache = LineCache(10)
+        cache.put(0, b"aa")
+        cache.put(1, b"bbb")
+
+        cache.discard(0)
+        cache.discard(2)  # not cached
+
+        self.assertEqual((len(cache), cache.size), (1, 3))
+        self.assertIsNone(cache.get(0))
+
+    def test_clear(self) -> None:
+        cache = LineCache(10)
+        cache.put(0, b"aa")
+        cache.get(0)
+
+        cache.clear()
+
+        self.assertEqual((len(cache), cache.size), (0, 0))
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.hits, 1)  # counters are kept
+
+
+if __name__ == '__main__':
+    unittest.main()
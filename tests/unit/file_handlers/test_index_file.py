@@ -0,0 +1,140 @@
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from src.file_handlers import index_file
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.offsets import LineOffsets
+
+
+class TestIndexFile(unittest.TestCase):
+    def test_index_path_for(self) -> None:
+        self.assertEqual(index_file.index_path_for(Path("/data/file.txt")), Path("/data/file.txt.idx"))
+
+    def test_save_and_load_valid(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"ABC\nDEFG\nHI\n")
+            index_path = index_file.index_path_for(served_path)
+            signature = index_file.FileSignature.of(served_path)
+
+            index_file.save_index(index_path, signature, LineOffsets([0, 4, 9]))
+            result = index_file.load_index(index_path, index_file.FileSignature.of(served_path))
+
+            self.assertEqual(result, [0, 4, 9])
+            self.assertIsInstance(result.buffer, memoryview)  # memory-mapped rather than copied
+
+    def test_save_and_load_empty(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.touch()
+            index_path = index_file.index_path_for(served_path)
+            signature = index_file.FileSignature.of(served_path)
+
+            index_file.save_index(index_path, signature, LineOffsets())
+            result = index_file.load_index(index_path, signature)
+
+            self.assertEqual(len(result), 0)
+
+    def test_load_missing(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"ABC\n")
+
+            result = index_file.load_index(Path(tmpdir, "missing.idx"), index_file.FileSignature.of(served_path))
+
+        self.assertIsNone(result)
+
+    def test_load_corrupted(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"ABC\n")
+            index_path = index_file.index_path_for(served_path)
+            signature = index_file.FileSignature.of(served_path)
+            index_file.save_index(index_path, signature, LineOffsets([0]))
+            with open(index_path, "ab") as f:
+                f.write(b"garbage")
+
+            result = index_file.load_index(index_path, signature)
+
+        self.assertIsNone(result)
+
+    def test_load_file_modified(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"ABC\nDEF\n")
+            index_path = index_file.index_path_for(served_path)
+            signature = index_file.FileSignature.of(served_path)
+            index_file.save_index(index_path, signature, LineOffsets([0, 4]))
+            served_path.write_bytes(b"ABCD\nEF\n")  # same size, different contents
+            os.utime(served_path, ns=(signature.mtime_ns, signature.mtime_ns))  # and same modification time
+
+            result = index_file.load_index(index_path, index_file.FileSignature.of(served_path))
+
+        self.assertIsNone(result)
+
+    def test_append_index(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"a\nb\n")
+            index_path = Path(tmpdir, "served.idx")
+            previous_signature = index_file.FileSignature.of(served_path)
+            index_file.save_index(index_path, previous_signature, LineOffsets([0, 2]))
+            served_path.write_bytes(b"a\nb\nc\nd\n")
+            signature = index_file.FileSignature.of(served_path)
+
+            index_file.append_index(index_path, signature, LineOffsets([4, 6]))
+
+            self.assertIsNone(index_file.load_index(index_path, previous_signature))
+            self.assertEqual(list(index_file.load_index(index_path, signature)), [0, 2, 4, 6])
+
+    def test_append_index_corrupted(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            index_path = Path(tmpdir, "served.idx")
+            index_path.write_bytes(b"not an index")
+
+            with self.assertRaises(ValueError):
+                index_file.append_index(index_path, index_file.FileSignature(0, 0, b"", b""), LineOffsets([0]))
+
+    def test_signature_is_prefix_of(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"a\nb\n")
+            signature = index_file.FileSignature.of(served_path)
+
+            served_path.write_bytes(b"a\nb\nc\n")
+            self.assertTrue(signature.is_prefix_of(served_path))
+            served_path.write_bytes(b"a\nx\nc\n")
+            self.assertFalse(signature.is_prefix_of(served_path))
+            served_path.write_bytes(b"a\n")
+            self.assertFalse(signature.is_prefix_of(served_path))
+
+    def test_signature_fingerprint(self) -> None:
+        signature = index_file.FileSignature(4, 10, b"head", b"tail")
+
+        self.assertEqual(signature.fingerprint, index_file.FileSignature(4, 10, b"head", b"tail").fingerprint)
+        self.assertRegex(signature.fingerprint, "^[0-9a-f]{16}$")
+        self.assertNotEqual(signature.fingerprint, index_file.FileSignature(4, 11, b"head", b"tail").fingerprint)
+        self.assertNotEqual(signature.fingerprint, index_file.FileSignature(4, 10, b"head", b"tall").fingerprint)
+
+    def test_lock_index_exclusive(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            index_path = Path(tmpdir, "served.idx")
+
+            with index_file.lock_index(index_path):
+                with self.assertRaises(IndexingCancelledError):
+                    with index_file.lock_index(index_path, cancelled=lambda: True):
+                        pass
+
+            with index_file.lock_index(index_path, cancelled=lambda: True):  # released
+                pass
+
+    def test_lock_index_cannot_create_lock_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            with index_file.lock_index(Path(tmpdir, "missing", "served.idx")):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
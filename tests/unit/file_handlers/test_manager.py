@@ -5,6 +5,7 @@ from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 from src.file_handlers.exceptions import LineIndexOutOfRangeError
 from src.file_handlers.manager import FileManager
+from src.file_handlers.reader import AsyncReader
 
 
 class TestFileManager(unittest.IsolatedAsyncioTestCase):
@@ -19,6 +20,20 @@ class TestFileManager(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(result, content[1])
 
+    async def test_get_line_with_reader(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            reader = AsyncReader(1)
+            manager = FileManager(Path(served_file.name), MagicMock(), reader=reader)
+
+            result = await manager.get_line(1)
+            reader.close()
+
+        self.assertEqual(result, content[1])
+        self.assertEqual(reader.completed, 1)
+
     async def test_get_line_empty_line(self) -> None:
         content = ["l0\n", "\n", "l2\n"]
         with TemporaryDirectory() as tmpdir:
@@ -0,0 +1,102 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock
+
+from src.file_handlers import bgzf
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import LineIndexOutOfRangeError
+from src.file_handlers.manager_compressed import CompressedFileManager
+from src.file_handlers.reader import AsyncReader
+
+
+def write_block_compressed(path: Path, content: bytes, block_size: int) -> None:
+    """Write a block-compressed file with small blocks, so that lines span several of them"""
+    blocks = [bgzf.compress_block(content[i:i + block_size]) for i in range(0, len(content), block_size)]
+    path.write_bytes(b"".join(blocks) + bgzf.EOF_BLOCK)
+
+
+class TestCompressedFileManager(unittest.IsolatedAsyncioTestCase):
+    content = [b"I am line 0\n", b"I am line 1\n", b"\n", b"I am a longer line 3\n", b"I am line 4"]
+
+    def setUp(self) -> None:
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name, "served.gz")
+        write_block_compressed(self.path, b"".join(self.content), 5)  # most lines span several blocks
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    async def test_get_line_valid(self) -> None:
+        manager = CompressedFileManager(self.path, MagicMock())
+
+        results = [await manager.get_line_bytes(i) for i in range(len(self.content))]
+        manager.close()
+
+        self.assertEqual(results, self.content)
+
+    async def test_get_line_out_of_range(self) -> None:
+        manager = CompressedFileManager(self.path, MagicMock())
+
+        with self.assertRaises(LineIndexOutOfRangeError):
+            await manager.get_line(len(self.content))
+        manager.close()
+
+    async def test_get_lines_bytes_valid(self) -> None:
+        manager = CompressedFileManager(self.path, MagicMock())
+
+        result = await manager.get_lines_bytes([3, 0, 1, 4])
+        manager.close()
+
+        self.assertEqual(result, [self.content[3], self.content[0], self.content[1], self.content[4]])
+
+    async def test_iter_bytes_valid(self) -> None:
+        manager = CompressedFileManager(self.path, MagicMock())
+
+        state, start, end = manager.get_line_range_bounds(1, 3)
+        result = b"".join([chunk async for chunk in manager.iter_bytes(state, start, end, 7)])
+        manager.close()
+
+        self.assertEqual(result, b"".join(self.content[1:4]))
+
+    async def test_get_line_with_reader_and_block_cache(self) -> None:
+        reader = AsyncReader(2)
+        block_cache = LineCache(1024)
+        manager = CompressedFileManager(self.path, MagicMock(), reader=reader, block_cache=block_cache)
+
+        results = [await manager.get_line_bytes(i) for i in (0, 0, 1)]
+        manager.close()
+        reader.close()
+
+        self.assertEqual(results, [self.content[0], self.content[0], self.content[1]])
+        self.assertEqual(reader.completed, 5)  # the blocks of the first two lines are decompressed once
+        self.assertEqual(block_cache.misses, 5)
+        self.assertEqual(len(block_cache), 0)  # cleared when the file is closed
+
+    async def test_pre_process_maps_persisted_index(self) -> None:
+        index_path = Path(self.tmpdir.name, "served.gz.idx")
+        CompressedFileManager(self.path, MagicMock(), index_path=index_path).pre_process()
+        manager = CompressedFileManager(self.path, MagicMock(), index_path=index_path)
+
+        result = manager.pre_process()
+        line = await manager.get_line_bytes(3)
+        manager.close()
+
+        self.assertIsInstance(result.buffer, memoryview)
+        self.assertEqual(line, self.content[3])
+
+    async def test_refresh_served_file_rewritten(self) -> None:
+        manager = CompressedFileManager(self.path, MagicMock(), index_path=Path(self.tmpdir.name, "served.gz.idx"))
+        self.assertEqual(await manager.get_line_bytes(4), self.content[4])
+
+        write_block_compressed(self.path, b"".join(self.content) + b"\nI am line 5\n", 5)  # appended, compressed again
+        changed = await manager.refresh()
+        result = await manager.get_line_bytes(5)
+        manager.close()
+
+        self.assertTrue(changed)
+        self.assertEqual(result, b"I am line 5\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,19 @@
+import asyncio
+import os
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch, AsyncMock
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 
-from src.file_handlers.exceptions import LineIndexOutOfRangeError
-from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers import index_file, scanner
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import IndexingCancelledError, IndexNotReadyError, LineIndexOutOfRangeError
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing, FileState
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.reader import AsyncReader
+from src.metrics import ServingMetrics
 
 
 class TestFileManagerWithPreProcessing(unittest.IsolatedAsyncioTestCase):
@@ -30,6 +39,62 @@ class TestFileManagerWithPreProcessing(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(result), 0)
 
+    async def test_pre_process_persists_index(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            index_path = Path(tmpdir, "served.idx")
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), index_path=index_path)
+            manager.pre_process()
+
+            other_manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), index_path=index_path)
+            with patch.object(other_manager, "_scan") as mock_scan:
+                result = other_manager.pre_process()
+
+            mock_scan.assert_not_called()  # the persisted index was loaded instead
+            self.assertEqual(list(result), [0, len(content[0]), len(content[0])+len(content[1])])
+            self.assertEqual(await other_manager.get_line(2), content[2])
+
+    async def test_pre_process_maps_persisted_index(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\nc\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), index_path=Path(tmpdir, "served.idx"))
+
+            result = manager.pre_process()
+
+            # the table built by the manager was replaced by the mapped index, which can be shared with other processes
+            self.assertIsInstance(result.buffer, memoryview)
+            self.assertEqual(list(result), [0, 2, 4])
+
+    async def test_pre_process_concurrently_builds_index_once(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\nc\n")
+            managers = [FileManagerWithPreProcessing(served_path, MagicMock(), index_path=Path(tmpdir, "served.idx"))
+                        for _ in range(4)]
+
+            with patch.object(scanner, "scan_line_offsets", wraps=scanner.scan_line_offsets) as mock_scan:
+                with ThreadPoolExecutor(len(managers)) as executor:
+                    results = list(executor.map(lambda manager: manager.pre_process(), managers))
+
+            mock_scan.assert_called_once()
+            for result in results:
+                self.assertEqual(list(result), [0, 2, 4])
+
+    async def test_pre_process_outdated_index(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\n")
+            index_path = Path(tmpdir, "served.idx")
+            FileManagerWithPreProcessing(served_path, MagicMock(), index_path=index_path).pre_process()
+            served_path.write_text("a\nb\nc\n")
+
+            result = FileManagerWithPreProcessing(served_path, MagicMock(), index_path=index_path).pre_process()
+
+        self.assertEqual(list(result), [0, 2, 4])
+
     async def test_get_line_not_pre_processed(self) -> None:
         with TemporaryDirectory() as tmpdir:
             with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
@@ -92,6 +157,488 @@ class TestFileManagerWithPreProcessing(unittest.IsolatedAsyncioTestCase):
             with self.assertRaises(LineIndexOutOfRangeError):
                 await manager.get_line(len(content))
 
+    async def test_internal_get_line_no_trailing_newline(self) -> None:
+        content = ["a\n", "b\n", "c"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+            manager.bytes_before_line = LineOffsets([0, 2, 4])
+
+            result = await manager._get_line_pre_processed(2)
+            manager.close()
+
+        self.assertEqual(result, "c")
+
+    async def test_get_line_bytes_valid(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            result = await manager.get_line_bytes(1)
+            manager.close()
+
+        self.assertEqual(result, content[1].encode())
+
+    async def test_get_line_bytes_binary(self) -> None:
+        content = ["Ünïcödé\n".encode(), "日本語\r\n".encode(), b"\xff\xfe invalid\n",
+                   b"lone\rcarriage return\n", b"\x00\n", "😀".encode()]
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"".join(content))
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            manager.pre_process()
+
+            offsets = list(manager.bytes_before_line)
+            results = [await manager.get_line_bytes(i) for i in range(len(content))]
+            manager.close()
+
+        self.assertEqual(offsets, [sum(map(len, content[:i])) for i in range(len(content))])
+        self.assertEqual(results, content)
+
+    async def test_get_line_beyond_4_gib(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            with open(served_path, "wb") as served_file:  # sparse file, whose first 5 GiB are not written to the disk
+                served_file.write(b"first\n")
+                served_file.seek(5 * 1024**3)
+                served_file.write(b"\nfar\nlast")
+            size = os.path.getsize(served_path)
+            offsets = LineOffsets([0, 6])  # the second line is only made of the 5 GiB hole, so it is not scanned
+            offsets.extend(scanner.scan_appended_line_offsets(served_path, 5 * 1024**3, size))
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), bytes_before_line=offsets)
+
+            results = [await manager.get_line_bytes(i) for i in (0, 2, 3)]
+            manager.close()
+
+        self.assertEqual(list(offsets), [0, 6, 5 * 1024**3 + 1, 5 * 1024**3 + 5])
+        self.assertEqual(results, [b"first\n", b"far\n", b"last"])
+
+    async def test_get_line_opens_file_once(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+            manager.pre_process()
+
+            with patch.object(manager, "_open", wraps=manager._open) as mock_open:
+                results = [await manager.get_line(i) for i in (2, 0, 1)]
+            manager.close()
+
+        mock_open.assert_called_once()
+        self.assertEqual(results, [content[2], content[0], content[1]])
+
+    async def test_get_line_file_truncated(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"I am line 0\n" + b"x" * 8192 + b"\nI am line 2\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            manager.pre_process()
+            first = await manager.get_line_bytes(0)
+
+            os.truncate(served_path, 100)  # truncated before the change is noticed, which a mapped file crashes on
+            truncated = await manager.get_line_bytes(1)
+            missing = await manager.get_line_bytes(2)
+            manager.close()
+
+        self.assertEqual(first, b"I am line 0\n")
+        self.assertEqual(truncated, b"x" * 88)
+        self.assertEqual(missing, b"")
+
+    async def test_get_line_with_reader(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            reader = AsyncReader(2)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), reader=reader)
+
+            results = [await manager.get_line(i) for i in range(len(content))]
+            manager.close()
+            reader.close()
+
+        self.assertEqual(results, content)
+        self.assertEqual(reader.completed, len(content))
+
+    async def test_get_lines_bytes_valid(self) -> None:
+        content = [b"l0\n", b"l1\n", b"\n", b"l3\n", b"l4\n", b"l5"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="wb", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+            manager.pre_process()
+
+            with patch.object(manager, "_read_bytes", wraps=manager._read_bytes) as mock_read_bytes:
+                result = await manager.get_lines_bytes([5, 0, 1, 2, 4, 0])
+            manager.close()
+
+        self.assertEqual(result, [content[5], content[0], content[1], content[2], content[4], content[0]])
+        self.assertEqual(mock_read_bytes.await_count, 2)  # lines 0-2 and lines 4-5 are read at once
+
+    async def test_get_lines_bytes_out_of_range(self) -> None:
+        content = ["a\n", "b\n", "c\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            with self.assertRaises(LineIndexOutOfRangeError):
+                await manager.get_lines_bytes([0, len(content)])
+
+    async def test_get_line_range_bytes_valid(self) -> None:
+        content = [b"l0\n", b"l1\n", b"l2\n", b"l3\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="wb", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            result = await manager.get_line_range_bytes(1, 2)
+            result_beyond_end = await manager.get_line_range_bytes(2, 10)
+            manager.close()
+
+        self.assertEqual(result, content[1:3])
+        self.assertEqual(result_beyond_end, content[2:])
+
+    async def test_get_line_range_bytes_out_of_range(self) -> None:
+        content = ["a\n", "b\n", "c\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            with self.assertRaises(LineIndexOutOfRangeError):
+                await manager.get_line_range_bytes(len(content), 1)
+
+    async def test_iter_line_range_valid(self) -> None:
+        content = [b"l0\n", b"x" * 1000 + b"\n", b"l2\n", b"l3"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="wb", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            state, start, end = manager.get_line_range_bounds(1, 10)
+            chunks = [chunk async for chunk in manager.iter_bytes(state, start, end, chunk_size=64)]
+            manager.close()
+
+        self.assertEqual(b"".join(chunks), b"".join(content[1:]))
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+
+    async def test_iter_line_range_file_pre_processed_again(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"old0\nold1\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            manager.pre_process()
+
+            state, start, end = manager.get_line_range_bounds(0, 2)
+            served_path.unlink()
+            served_path.write_bytes(b"NEW line 0\n")
+            manager.pre_process()
+            chunks = [chunk async for chunk in manager.iter_bytes(state, start, end, chunk_size=64)]
+            result = await manager.get_line_bytes(0)
+            manager.close()
+
+        self.assertEqual(b"".join(chunks), b"old0\nold1\n")  # read from the version the lines were located in
+        self.assertIsNone(state.file)  # closed once the stream was done
+        self.assertEqual(result, b"NEW line 0\n")
+
+    async def test_get_line_range_bounds_out_of_range(self) -> None:
+        content = ["a\n", "b\n", "c\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+
+            with self.assertRaises(LineIndexOutOfRangeError):
+                manager.get_line_range_bounds(len(content), 1)
+
+    async def test_get_line_with_cache(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            cache = LineCache(1024)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), cache=cache)
+            manager.pre_process()
+
+            with patch.object(manager, "_read_bytes", wraps=manager._read_bytes) as mock_read_bytes:
+                results = [await manager.get_line(i) for i in (1, 1, 2, 1)]
+            manager.close()
+
+        self.assertEqual(results, [content[1], content[1], content[2], content[1]])
+        self.assertEqual(mock_read_bytes.await_count, 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    async def test_get_line_with_cache_file_changed_while_reading(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"old0\nold1\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), reader=AsyncReader(1),
+                                                   cache=LineCache(1024))
+            manager.pre_process()
+            read_range = manager._read_range
+
+            async def read_range_while_rewritten(state: FileState, start: int, end: int) -> bytes:
+                data = await read_range(state, start, end)
+                served_path.write_bytes(b"NEW0\nNEW1\n")
+                await manager.refresh()
+                return data
+
+            with patch.object(manager, "_read_range", side_effect=read_range_while_rewritten):
+                stale = await manager.get_line_bytes(0)
+            result = await manager.get_line_bytes(0)
+            manager.close()
+            manager.reader.close()
+
+        self.assertEqual(stale, b"old0\n")  # read before the file changed
+        self.assertEqual(result, b"NEW0\n")
+
+    async def test_get_lines_file_pre_processed_again_after_check(self) -> None:
+        cases = [("get_line_bytes", (1,), b"line1\n"), ("get_line_range_bytes", (0, 2), [b"line0\n", b"line1\n"]),
+                 ("get_lines_bytes", ([1, 0],), [b"line1\n", b"line0\n"])]
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"line0\nline1\n")
+            for method, args, expected in cases:
+                with self.subTest(method=method):
+                    manager = FileManagerWithPreProcessing(served_path, MagicMock())
+                    manager.pre_process()
+                    check_line_index = manager._check_line_index
+
+                    def check_then_replace_state(line_index: int, n_lines: int) -> None:
+                        check_line_index(line_index, n_lines)
+                        manager._replace_state(manager._new_state())  # as the pre-processing step does
+
+                    with patch.object(manager, "_check_line_index", side_effect=check_then_replace_state):
+                        result = await getattr(manager, method)(*args)
+                    manager.close()
+
+                    self.assertEqual(result, expected)  # checked and read against the same version of the file
+
+    async def test_get_line_file_pre_processed_again_while_reading(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"old0\nold1\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), reader=AsyncReader(1))
+            manager.pre_process()
+            pread = os.pread
+            started, resumed = threading.Event(), threading.Event()
+
+            def pread_until_resumed(fd: int, n: int, offset: int) -> bytes:
+                started.set()
+                resumed.wait(5)
+                return pread(fd, n, offset)
+
+            with patch("os.pread", side_effect=pread_until_resumed):
+                # the second read waits for the first one, with the descriptor of the file it started with
+                reads = [asyncio.create_task(manager.get_line_bytes(i)) for i in (0, 1)]
+                await asyncio.to_thread(started.wait, 5)
+                previous = manager._state
+                served_path.unlink()
+                served_path.write_bytes(b"NEW0\nNEW1\nNEW2\n")
+                await asyncio.to_thread(manager.pre_process)
+                resumed.set()
+                stale = await asyncio.gather(*reads)
+            result = await manager.get_line_bytes(2)
+            manager.close()
+            manager.reader.close()
+
+        self.assertEqual(stale, [b"old0\n", b"old1\n"])  # read from the version of the file they started with
+        self.assertEqual(result, b"NEW2\n")
+        self.assertIsNone(previous.file)  # closed once the reads using it were done
+
+    async def test_get_line_records_metrics(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            metrics = ServingMetrics()
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), cache=LineCache(1024),
+                                                   metrics=metrics)
+            manager.pre_process()
+
+            for line_index in (1, 1):
+                await manager.get_line(line_index)
+            await manager.get_lines_bytes([0, 2])
+            manager.close()
+
+        self.assertEqual(metrics.index_build.count, 1)
+        self.assertEqual(metrics.index_lookup.count, 3)
+        self.assertEqual(metrics.file_read.count, 3)  # the second line once, then two runs of one line
+        self.assertEqual(metrics.serialization.count, 0)
+
+    async def test_refresh_served_file_rewritten(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\n")
+            cache = LineCache(1024)
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), cache=cache)
+            self.assertEqual(await manager.get_line(1), "b\n")
+
+            served_path.write_text("a\nbbb\nc\n")
+            changed = await manager.refresh()
+            result = await manager.get_line(1)
+            result_new_line = await manager.get_line(2)
+            manager.close()
+
+        self.assertTrue(changed)
+        self.assertTrue(manager.ready)
+        self.assertEqual(result, "bbb\n")
+        self.assertEqual(result_new_line, "c\n")
+
+    async def test_refresh_served_file_unchanged(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            await manager.get_line(1)
+
+            with patch.object(manager, "pre_process") as mock_pre_process:
+                changed = await manager.refresh()
+            manager.close()
+
+        self.assertFalse(changed)
+        mock_pre_process.assert_not_called()
+
+    async def test_refresh_lines_appended(self) -> None:
+        for persisted in (False, True):
+            with self.subTest(persisted=persisted), TemporaryDirectory() as tmpdir:
+                served_path = Path(tmpdir, "served.txt")
+                served_path.write_bytes(b"a\nb")  # the last line is not complete yet
+                index_path = Path(tmpdir, "served.idx") if persisted else None
+                manager = FileManagerWithPreProcessing(served_path, MagicMock(), index_path=index_path,
+                                                       cache=LineCache(1024))
+                self.assertEqual(await manager.get_line(1), "b")
+
+                with open(served_path, "ab") as f:
+                    f.write(b"bb\nc\n")
+                with patch.object(manager, "pre_process") as mock_pre_process:
+                    changed = await manager.refresh()
+                lines = [await manager.get_line(i) for i in range(3)]
+                with self.assertRaises(LineIndexOutOfRangeError):
+                    await manager.get_line(3)
+                manager.close()
+
+                self.assertTrue(changed)
+                mock_pre_process.assert_not_called()  # only the appended bytes were read
+                self.assertEqual(lines, ["a\n", "bbb\n", "c\n"])
+                self.assertEqual(list(manager.bytes_before_line), [0, 2, 6])
+                if persisted:
+                    self.assertIsInstance(manager.bytes_before_line.buffer, memoryview)  # still shared
+
+    async def test_refresh_lines_appended_while_pre_processing(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_bytes(b"a\nb\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            signature_of = index_file.FileSignature.of
+
+            def signature_then_append(path: os.PathLike) -> index_file.FileSignature:
+                signature = signature_of(path)
+                with open(path, "ab") as f:
+                    f.write(b"c\n")  # appended after the signature was computed, before the file is scanned
+                return signature
+
+            with patch.object(index_file.FileSignature, "of", side_effect=signature_then_append):
+                manager.pre_process()
+            offsets = list(manager.bytes_before_line)
+            changed = await manager.refresh()
+            lines = [await manager.get_line_bytes(i) for i in range(3)]
+            manager.close()
+
+        self.assertEqual(offsets, [0, 2])
+        self.assertTrue(changed)
+        self.assertEqual(list(manager.bytes_before_line), [0, 2, 4])
+        self.assertEqual(lines, [b"a\n", b"b\n", b"c\n"])
+
+    async def test_refresh_served_file_replaced(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\n")
+            manager = FileManagerWithPreProcessing(served_path, MagicMock())
+            await manager.get_line(1)
+
+            new_path = Path(tmpdir, "new.txt")
+            new_path.write_text("a\nb\nc\n")
+            os.replace(new_path, served_path)
+            with patch.object(manager, "pre_process", wraps=manager.pre_process) as mock_pre_process:
+                changed = await manager.refresh()
+            result = await manager.get_line(2)
+            manager.close()
+
+        self.assertTrue(changed)
+        mock_pre_process.assert_called_once()  # the previous file is still open, so it cannot be read further
+        self.assertEqual(result, "c\n")
+
+    async def test_pre_process_lines_appended_to_persisted_index(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            served_path = Path(tmpdir, "served.txt")
+            served_path.write_text("a\nb\n")
+            index_path = Path(tmpdir, "served.idx")
+            FileManagerWithPreProcessing(served_path, MagicMock(), index_path=index_path).pre_process()
+            with open(served_path, "a") as f:
+                f.write("c\n")
+
+            manager = FileManagerWithPreProcessing(served_path, MagicMock(), index_path=index_path)
+            with patch.object(manager, "_scan") as mock_scan:
+                result = manager.pre_process()
+
+        mock_scan.assert_not_called()  # only the appended bytes were read
+        self.assertEqual(list(result), [0, 2, 4])
+
+    async def test_get_line_while_indexing(self) -> None:
+        content = ["I am line 0\n", "I am line 1\n", "I am line 2\n"]
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(content)
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock())
+            manager.begin_pre_processing()
+            # two lines found so far by the pre-processing step running in another thread
+            manager.bytes_before_line = LineOffsets([0, len(content[0])])
+
+            self.assertFalse(manager.ready)
+            self.assertEqual(await manager.get_line(0), content[0])
+            with self.assertRaises(IndexNotReadyError):
+                await manager.get_line(1)  # may not be complete yet
+            with self.assertRaises(IndexNotReadyError):
+                await manager.get_line_range_bytes(2, 1)
+            self.assertEqual(await manager.get_line_range_bytes(0, 1), [content[0].encode()])
+            # a range going past the lines found so far is not cut short, as they may not be all of them
+            with self.assertRaises(IndexNotReadyError):
+                await manager.get_line_range_bytes(0, 2)
+            with self.assertRaises(IndexNotReadyError):
+                manager.get_line_range_bounds(0, 2)
+            self.assertEqual(manager._state.readers, 0)  # released when the range is rejected
+            with self.assertRaises(LineIndexOutOfRangeError):
+                await manager.get_line(-1)
+            manager.close()
+
+            manager.pre_process()
+
+            self.assertTrue(manager.ready)
+            self.assertEqual(await manager.get_line(2), content[2])
+            manager.close()
+
+    async def test_pre_process_cancelled(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
+                served_file.writelines(["I am a line\n"] * 10)
+            index_path = Path(tmpdir, "served.idx")
+            manager = FileManagerWithPreProcessing(Path(served_file.name), MagicMock(), index_path=index_path)
+            manager.begin_pre_processing()
+
+            manager.cancel_pre_processing()
+            with self.assertRaises(IndexingCancelledError):
+                manager.pre_process()
+
+            self.assertIsNone(manager.bytes_before_line)
+            self.assertFalse(manager.indexing)
+            self.assertFalse(manager.ready)
+            self.assertFalse(index_path.exists())  # a partial table is never persisted
+
     async def test_get_line_file_empty(self) -> None:
         with TemporaryDirectory() as tmpdir:
             with NamedTemporaryFile(dir=tmpdir, mode="w", delete=False) as served_file:
@@ -0,0 +1,51 @@
+import unittest
+from array import array
+
+from src.file_handlers.offsets import LineOffsets
+
+
+class TestLineOffsets(unittest.TestCase):
+    def test_random_access(self) -> None:
+        offsets = LineOffsets([0, 4, 9])
+
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual(offsets[1], 4)
+        self.assertEqual(offsets[-1], 9)
+        with self.assertRaises(IndexError):
+            _ = offsets[3]
+
+    def test_large_offsets(self) -> None:
+        offsets = LineOffsets([0, 2**32 + 1, 2**40])
+
+        self.assertEqual(list(offsets), [0, 2**32 + 1, 2**40])
+
+    def test_nbytes(self) -> None:
+        offsets = LineOffsets(range(1000))
+
+        self.assertEqual(offsets.nbytes, 8000)
+
+    def test_equality(self) -> None:
+        self.assertEqual(LineOffsets([0, 4, 9]), [0, 4, 9])
+        self.assertEqual(LineOffsets([0, 4, 9]), LineOffsets([0, 4, 9]))
+        self.assertNotEqual(LineOffsets([0, 4, 9]), [0, 4])
+        self.assertNotEqual(LineOffsets([0, 4, 9]), [0, 4, 10])
+
+    def test_memoryview_is_not_copied(self) -> None:
+        buffer = memoryview(array("Q", [0, 4, 9]).tobytes()).cast("Q")
+
+        offsets = LineOffsets(buffer)
+
+        self.assertIs(offsets.buffer, buffer)
+        self.assertEqual(offsets, [0, 4, 9])
+
+    def test_extend_read_only_view(self) -> None:
+        offsets = LineOffsets(memoryview(array("Q", [0, 4]).tobytes()).cast("Q"))
+
+        offsets.append(9)
+        offsets.extend([12, 20])
+
+        self.assertEqual(offsets, [0, 4, 9, 12, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+
+from src.file_handlers.progress import IndexingProgress
+
+
+class TestIndexingProgress(unittest.TestCase):
+    def test_eta_unknown_before_first_update(self) -> None:
+        progress = IndexingProgress(total_bytes=100)
+
+        self.assertFalse(progress.done)
+        self.assertIsNone(progress.eta_seconds)
+
+    @patch("src.file_handlers.progress.time.monotonic")
+    def test_eta_from_throughput(self, monotonic) -> None:
+        monotonic.return_value = 10.0
+        progress = IndexingProgress(total_bytes=100)
+
+        monotonic.return_value = 12.0
+        progress.update(25, 3)
+
+        self.assertEqual(progress.elapsed_seconds, 2.0)
+        self.assertEqual(progress.eta_seconds, 6.0)  # 75 bytes left at 12.5 bytes per second
+
+    @patch("src.file_handlers.progress.time.monotonic")
+    def test_finish(self, monotonic) -> None:
+        monotonic.return_value = 10.0
+        progress = IndexingProgress(total_bytes=100)
+        progress.update(100, 7)
+
+        monotonic.return_value = 11.5
+        progress.finish()
+        monotonic.return_value = 20.0
+
+        self.assertTrue(progress.done)
+        self.assertEqual(progress.elapsed_seconds, 1.5)
+        self.assertEqual(progress.eta_seconds, 0.0)
+        self.assertEqual(progress.as_dict(), {"done": True, "bytes_scanned": 100, "total_bytes": 100,
+                                              "lines_found": 7, "elapsed_seconds": 1.5, "eta_seconds": 0.0})
+
+    def test_cancel(self) -> None:
+        progress = IndexingProgress()
+
+        progress.cancel()
+
+        self.assertTrue(progress.cancelled)
+        self.assertFalse(progress.done)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import unittest
+
+from src.file_handlers.reader import AsyncReader
+
+
+class TestAsyncReader(unittest.IsolatedAsyncioTestCase):
+    async def test_run_valid(self) -> None:
+        reader = AsyncReader(2)
+
+        result = await reader.run(sum, [1, 2, 3])
+        reader.close()
+
+        self.assertEqual(result, 6)
+        self.assertEqual(reader.completed, 1)
+        self.assertEqual(reader.in_flight, 0)
+
+    async def test_run_outside_event_loop_thread(self) -> None:
+        reader = AsyncReader(1)
+
+        result = await reader.run(threading.get_ident)
+        reader.close()
+
+        self.assertNotEqual(result, threading.get_ident())
+
+    async def test_run_exception(self) -> None:
+        reader = AsyncReader(1)
+
+        with self.assertRaises(FileNotFoundError):
+            await reader.run(open, "/this/file/does/not/exist")
+        reader.close()
+
+        self.assertEqual(reader.in_flight, 0)
+
+    async def test_run_concurrency_limit(self) -> None:
+        reader = AsyncReader(2)
+        release = threading.Event()
+
+        tasks = [asyncio.create_task(reader.run(release.wait)) for _ in range(5)]
+        while reader.in_flight < 2:
+            await asyncio.sleep(0.001)
+
+        self.assertEqual(reader.in_flight, 2)
+        self.assertEqual(reader.queued, 3)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        reader.close()
+
+        self.assertEqual((reader.in_flight, reader.queued, reader.completed), (0, 0, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from src.file_handlers import bgzf
+from src.file_handlers.exceptions import UnknownFileError
+from src.file_handlers.manager_compressed import CompressedFileManager
+from src.file_handlers.manager_with_preprocessing import FileManagerWithPreProcessing
+from src.file_handlers.registry import FileRegistry, load_manifest
+
+
+def write_files(directory: str, n_files: int) -> dict[str, Path]:
+    """
+    :param directory: Directory where the files are written
+    :param n_files: Number of files to write
+    :return: path of each file, by name
+    """
+    paths = {}
+    for i in range(n_files):
+        paths[f"file{i}.txt"] = Path(directory, f"file{i}.txt")
+        paths[f"file{i}.txt"].write_text(f"I am line 0 of file {i}\nI am line 1 of file {i}\n")
+    return paths
+
+
+class TestLoadManifest(unittest.TestCase):
+    def test_load_manifest_directory(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            paths = write_files(tmpdir, 2)
+            Path(tmpdir, "file0.txt.idx").write_bytes(b"")
+            Path(tmpdir, ".hidden").write_text("")
+            Path(tmpdir, "subdirectory").mkdir()
+
+            result = load_manifest(tmpdir)
+
+        self.assertEqual(result, {name: path.resolve() for name, path in paths.items()})
+
+    def test_load_manifest_json(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            manifest_path = Path(tmpdir, "manifest.json")
+            manifest_path.write_text(json.dumps({"logs": "logs/app.log", "data": "/data/file.txt"}))
+
+            result = load_manifest(manifest_path)
+
+        self.assertEqual(result, {"logs": Path(tmpdir, "logs", "app.log").resolve(), "data": Path("/data/file.txt")})
+
+    def test_load_manifest_invalid(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            manifest_path = Path(tmpdir, "manifest.json")
+            manifest_path.write_text(json.dumps(["file.txt"]))
+
+            with self.assertRaises(ValueError):
+                load_manifest(manifest_path)
+
+
+class TestFileRegistry(unittest.IsolatedAsyncioTestCase):
+    async def test_get_block_compressed_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "file.txt.gz")
+            path.write_bytes(bgzf.compress_block(b"I am line 0\nI am line 1\n") + bgzf.EOF_BLOCK)
+            registry = FileRegistry({"file": path}, MagicMock(), memory_budget=1024, max_open_files=10,
+                                    block_cache_max_bytes=1024)
+
+            manager = await registry.get("file")
+            line = await manager.get_line(1)
+            registry.close()
+            manager.close()
+
+        self.assertIsInstance(manager, CompressedFileManager)
+        self.assertIsNotNone(manager.block_cache)
+        self.assertEqual(line, "I am line 1\n")
+
+    async def test_get_loads_lazily(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 3), MagicMock(), memory_budget=1024, max_open_files=10)
+            self.assertEqual(len(registry), 0)  # nothing is loaded before it is accessed
+
+            manager = await registry.get("file1.txt")
+
+            self.assertEqual(await manager.get_line(1), "I am line 1 of file 1\n")
+            self.assertEqual(len(registry), 1)
+            self.assertIs(await registry.get("file1.txt"), manager)
+            self.assertTrue(Path(tmpdir, "file1.txt.idx").exists())  # persisted next to the file
+            registry.close()
+
+    async def test_get_concurrently_loads_once(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 1), MagicMock(), memory_budget=1024, max_open_files=10,
+                                    persist_index=False)
+
+            with patch.object(FileManagerWithPreProcessing, "pre_process", autospec=True) as mock_pre_process:
+                managers = await asyncio.gather(*(registry.get("file0.txt") for _ in range(5)))
+
+            mock_pre_process.assert_called_once()
+            self.assertTrue(all(manager is managers[0] for manager in managers))
+
+    async def test_get_unknown_file(self) -> None:
+        registry = FileRegistry({}, MagicMock(), memory_budget=1024, max_open_files=10)
+
+        with self.assertRaises(UnknownFileError):
+            await registry.get("missing.txt")
+
+    async def test_get_file_not_found(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry({"missing.txt": Path(tmpdir, "missing.txt")}, MagicMock(), memory_budget=1024,
+                                    max_open_files=10)
+
+            with self.assertRaises(FileNotFoundError):
+                await registry.get("missing.txt")
+
+        self.assertEqual(len(registry), 0)  # retried on the next access
+
+    async def test_evict_least_recently_used_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 3), MagicMock(), memory_budget=1024, max_open_files=2)
+
+            await registry.get("file0.txt")
+            await registry.get("file1.txt")
+            await registry.get("file0.txt")
+            await registry.get("file2.txt")
+
+            self.assertEqual(len(registry), 2)
+            self.assertEqual(registry.evictions, 1)
+            self.assertEqual(list(registry._managers), ["file0.txt", "file2.txt"])
+
+    async def test_evict_closes_released_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 2), MagicMock(), memory_budget=1024, max_open_files=1)
+
+            manager = await registry.get("file0.txt")
+            await manager.get_line(0)
+            state = manager._state
+            await registry.get("file1.txt")
+
+            self.assertIsNone(state.file)  # no request was reading it
+            registry.close()
+
+    async def test_close_closes_files(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 2), MagicMock(), memory_budget=1024, max_open_files=2)
+            managers = [await registry.get(name) for name in ("file0.txt", "file1.txt")]
+            for manager in managers:
+                await manager.get_line(0)
+            states = [manager._state for manager in managers]
+
+            registry.close()
+
+            self.assertEqual([state.file for state in states], [None, None])
+
+    async def test_evict_counts_decompressed_blocks(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            paths = write_files(tmpdir, 1)
+            paths["file.txt.gz"] = Path(tmpdir, "file.txt.gz")
+            paths["file.txt.gz"].write_bytes(bgzf.compress_block(b"I am line 0\nI am line 1\n") + bgzf.EOF_BLOCK)
+            # each offsets table takes 16 bytes, and the decompressed block 24 bytes
+            registry = FileRegistry(paths, MagicMock(), memory_budget=40, max_open_files=10,
+                                    block_cache_max_bytes=1024)
+
+            manager = await registry.get("file.txt.gz")
+            await manager.get_line(0)
+            self.assertEqual((registry.index_memory_usage, registry.memory_usage), (16, 40))
+            await registry.get("file0.txt")
+
+            self.assertEqual(list(registry._managers), ["file0.txt"])
+            registry.close()
+
+    async def test_evict_calls_on_release(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            on_release = MagicMock()
+            registry = FileRegistry(write_files(tmpdir, 2), MagicMock(), memory_budget=1024, max_open_files=1,
+                                    on_release=on_release)
+
+            await registry.get("file0.txt")
+            await registry.get("file1.txt")
+
+            on_release.assert_called_once_with("file0.txt")
+
+    async def test_evict_over_memory_budget(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            # each file has two lines, so its offsets table takes 16 bytes
+            registry = FileRegistry(write_files(tmpdir, 3), MagicMock(), memory_budget=40, max_open_files=10)
+
+            for name in ("file0.txt", "file1.txt", "file2.txt"):
+                await registry.get(name)
+
+            self.assertEqual(len(registry), 2)
+            self.assertEqual(registry.memory_usage, 32)
+
+    async def test_evict_keeps_most_recently_used_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            registry = FileRegistry(write_files(tmpdir, 2), MagicMock(), memory_budget=0, max_open_files=10)
+
+            await registry.get("file0.txt")
+            manager = await registry.get("file1.txt")
+
+            self.assertEqual(list(registry._managers), ["file1.txt"])
+            self.assertEqual(await manager.get_line(0), "I am line 0 of file 1\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
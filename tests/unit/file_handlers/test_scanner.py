@@ -0,0 +1,203 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from src.file_handlers import scanner
+from src.file_handlers.exceptions import IndexingCancelledError
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.progress import IndexingProgress
+
+
+class TestScanner(unittest.TestCase):
+    def test_find_line_starts_valid(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI\n")
+
+            result = scanner.find_line_starts(path, 0, 12)
+
+        self.assertEqual(list(result), [4, 9, 12])
+
+    def test_find_line_starts_range(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI\n")
+
+            result = scanner.find_line_starts(path, 4, 9)
+
+        self.assertEqual(list(result), [9])
+
+    def test_scan_line_offsets_valid(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI\n")
+
+            result = scanner.scan_line_offsets(path)
+
+        self.assertEqual(result, [0, 4, 9])
+
+    def test_scan_line_offsets_no_trailing_newline(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI")
+
+            result = scanner.scan_line_offsets(path)
+
+        self.assertEqual(result, [0, 4, 9])
+
+    def test_scan_line_offsets_empty_lines(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"\n\nA\n\n")
+
+            result = scanner.scan_line_offsets(path)
+
+        self.assertEqual(result, [0, 1, 2, 4])
+
+    def test_scan_line_offsets_size(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI\n")
+
+            for workers in (1, 2):
+                with self.subTest(workers=workers):
+                    result = scanner.scan_line_offsets(path, workers=workers, min_range_size=1, size=9)
+                    self.assertEqual(result, [0, 4])
+
+    def test_scan_line_offsets_parallel_does_not_fork(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"ABC\nDEFG\nHI\n")
+
+            with patch.object(scanner, "ProcessPoolExecutor", wraps=scanner.ProcessPoolExecutor) as mock_executor:
+                result = scanner.scan_line_offsets(path, workers=2, min_range_size=1)
+
+        self.assertEqual(result, [0, 4, 9])
+        self.assertEqual(mock_executor.call_args.kwargs["mp_context"].get_start_method(), "forkserver")
+
+    def test_scan_line_offsets_empty_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.touch()
+
+            result = scanner.scan_line_offsets(path)
+
+        self.assertEqual(len(result), 0)
+
+    def test_scan_line_offsets_chunk_boundaries(self) -> None:
+        lines = [b"x" * (i % 7) + b"\n" for i in range(100)] + [b"y" * (i * 37) + b"\n" for i in range(20)]
+        expected = [sum(len(line) for line in lines[:i]) for i in range(len(lines))]
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"".join(lines))
+
+            for chunk_size in (1, 2, 3, 5, 64, 4096):
+                with self.subTest(chunk_size=chunk_size):
+                    self.assertEqual(scanner.scan_line_offsets(path, chunk_size=chunk_size), expected)
+
+    def test_scan_line_offsets_parallel(self) -> None:
+        lines = [b"x" * (i % 13) + b"\n" for i in range(1000)]
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"".join(lines))
+            expected = scanner.scan_line_offsets(path)
+
+            for workers in (2, 3, 4):
+                with self.subTest(workers=workers):
+                    result = scanner.scan_line_offsets(path, chunk_size=100, workers=workers, min_range_size=1)
+                    self.assertEqual(result, expected)
+
+    def test_scan_line_offsets_progress(self) -> None:
+        lines = [b"x" * (i % 13) + b"\n" for i in range(1000)]
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"".join(lines))
+            offsets = LineOffsets()
+            progress = IndexingProgress()
+
+            result = scanner.scan_line_offsets(path, chunk_size=100, offsets=offsets, progress=progress)
+
+        self.assertIs(result, offsets)  # populated in place
+        self.assertEqual(progress.total_bytes, sum(map(len, lines)))
+        self.assertEqual(progress.bytes_scanned, progress.total_bytes)
+        self.assertEqual(progress.lines_found, len(lines))
+
+    def test_scan_line_offsets_parallel_progress(self) -> None:
+        lines = [b"x" * (i % 13) + b"\n" for i in range(1000)]
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"".join(lines))
+            expected = scanner.scan_line_offsets(path)
+            progress = IndexingProgress()
+
+            with patch.object(progress, "update", wraps=progress.update) as mock_update:
+                result = scanner.scan_line_offsets(path, chunk_size=100, workers=2, min_range_size=1,
+                                                   progress=progress, range_size=500)
+
+        updates = [bytes_scanned for (bytes_scanned, _), _ in mock_update.call_args_list]
+        self.assertEqual(result, expected)
+        self.assertGreater(len(updates), 10)  # after each range, rather than after each half of the file
+        self.assertEqual(updates, sorted(updates))
+        self.assertEqual(progress.bytes_scanned, sum(map(len, lines)))
+
+    def test_scan_line_offsets_parallel_cancelled_while_scanning(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"line\n" * 10000)
+            progress = IndexingProgress()
+
+            def update_then_cancel(bytes_scanned: int, lines_found: int) -> None:
+                IndexingProgress.update(progress, bytes_scanned, lines_found)
+                progress.cancel()
+
+            with patch.object(progress, "update", side_effect=update_then_cancel), \
+                    self.assertRaises(IndexingCancelledError):
+                scanner.scan_line_offsets(path, chunk_size=100, workers=2, min_range_size=1, progress=progress,
+                                          range_size=500)
+
+        self.assertEqual(progress.bytes_scanned, 500)  # stopped after the first range
+
+    def test_scan_line_offsets_cancelled(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(b"line\n" * 1000)
+            progress = IndexingProgress()
+            progress.cancel()
+
+            for workers in (1, 2):
+                with self.subTest(workers=workers), self.assertRaises(IndexingCancelledError):
+                    scanner.scan_line_offsets(path, chunk_size=100, workers=workers, min_range_size=1,
+                                              progress=progress)
+
+    def test_scan_appended_line_offsets(self) -> None:
+        content = b"ABC\nDEFG\n\nHI\nJ"
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir, "served.txt")
+            path.write_bytes(content)
+            expected = scanner.scan_line_offsets(path)
+
+            for previous_size in range(len(content) + 1):
+                with self.subTest(previous_size=previous_size):
+                    path.write_bytes(content[:previous_size])
+                    offsets = scanner.scan_line_offsets(path)
+                    path.write_bytes(content)
+
+                    offsets.extend(scanner.scan_appended_line_offsets(path, previous_size, len(content), chunk_size=3))
+
+                    self.assertEqual(offsets, expected)
+
+    def test_split_ranges(self) -> None:
+        self.assertEqual(scanner.split_ranges(100, 4, min_range_size=10), [(0, 25), (25, 50), (50, 75), (75, 100)])
+        self.assertEqual(scanner.split_ranges(100, 4, min_range_size=40), [(0, 50), (50, 100)])
+        self.assertEqual(scanner.split_ranges(100, 1, min_range_size=10), [(0, 100)])
+        self.assertEqual(scanner.split_ranges(0, 4, min_range_size=10), [(0, 0)])
+
+    def test_scan_line_offsets_file_not_found(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            with self.assertRaises(FileNotFoundError):
+                scanner.scan_line_offsets(Path(tmpdir, "missing.txt"))
+
+
+if __name__ == '__main__':
+    unittest.main()
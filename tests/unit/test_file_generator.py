@@ -0,0 +1,69 @@
+import string
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import file_generator
+from src.file_handlers import scanner
+
+POOL = string.ascii_letters + string.digits + " \t"
+
+
+class TestFileGenerator(unittest.TestCase):
+    def test_generate_file_same_seed_any_workers(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            paths = [Path(tmpdir, "sequential.txt"), Path(tmpdir, "parallel.txt")]
+            with patch.object(file_generator, "BATCH_SIZE", 256):  # so that the file spans many batches
+                file_generator.generate_file(paths[0], 500, 20, POOL, seed=42, workers=1)
+                file_generator.generate_file(paths[1], 500, 20, POOL, seed=42, workers=3)
+
+            contents = [path.read_bytes() for path in paths]
+
+        self.assertEqual(contents[0], contents[1])
+        self.assertEqual(contents[0].count(b"\n"), 500)
+        self.assertTrue(set(contents[0]) <= set(POOL.encode("ascii") + b"\n"))
+
+    def test_generate_file_different_seeds(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            paths = [Path(tmpdir, "first.txt"), Path(tmpdir, "second.txt")]
+            file_generator.generate_file(paths[0], 100, 20, POOL, seed=1)
+            file_generator.generate_file(paths[1], 100, 20, POOL, seed=2)
+
+            self.assertNotEqual(paths[0].read_bytes(), paths[1].read_bytes())
+
+    def test_load_offsets_matches_scanner(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path, index_path = Path(tmpdir, "generated.txt"), Path(tmpdir, "generated.offsets")
+            with patch.object(file_generator, "BATCH_SIZE", 256):
+                file_generator.generate_file(path, 500, 20, POOL, seed=42, workers=2, index_path=index_path)
+
+            self.assertEqual(file_generator.load_offsets(index_path), scanner.scan_line_offsets(path))
+
+    def test_generate_file_no_lines(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path, index_path = Path(tmpdir, "generated.txt"), Path(tmpdir, "generated.offsets")
+            file_generator.generate_file(path, 0, 20, POOL, seed=42, index_path=index_path)
+
+            self.assertEqual(path.read_bytes(), b"")
+            self.assertEqual(list(file_generator.load_offsets(index_path)), [])
+            self.assertEqual(file_generator.load_offsets(index_path), scanner.scan_line_offsets(path))
+
+    def test_generate_file_empty_lines(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path, index_path = Path(tmpdir, "generated.txt"), Path(tmpdir, "generated.offsets")
+            file_generator.generate_file(path, 5, 0, POOL, seed=42, workers=2, index_path=index_path)
+
+            self.assertEqual(path.read_bytes(), b"\n" * 5)
+            self.assertEqual(list(file_generator.load_offsets(index_path)), [0, 1, 2, 3, 4])
+            self.assertEqual(file_generator.load_offsets(index_path), scanner.scan_line_offsets(path))
+
+    def test_generate_file_invalid_pool(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            for pool in ("", "é", "a" * 257):
+                with self.subTest(pool=pool), self.assertRaises(ValueError):
+                    file_generator.generate_file(Path(tmpdir, "generated.txt"), 5, 20, pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
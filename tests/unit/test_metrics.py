@@ -0,0 +1,83 @@
+import unittest
+
+from src.metrics import Exposition, Histogram, ServingMetrics, count_open_files
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self) -> None:
+        histogram = Histogram(buckets=(1.0, 2.0))
+
+        for value in (0.5, 1.0, 1.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.sum, 6.0)
+        self.assertEqual(histogram.count, 4)
+
+
+class TestExposition(unittest.TestCase):
+    def test_render_gauges(self) -> None:
+        exposition = Exposition(prefix="test_")
+
+        exposition.add("lines", "gauge", "Number of lines", 3, {"source": "lines"})
+        exposition.add("ratio", "gauge", "Ratio", 0.5)
+        exposition.add("lines", "gauge", "Number of lines", 4, {"source": "files"})
+
+        self.assertEqual(exposition.render(), "# HELP test_lines Number of lines\n"
+                                              "# TYPE test_lines gauge\n"
+                                              'test_lines{source="lines"} 3\n'
+                                              'test_lines{source="files"} 4\n'
+                                              "# HELP test_ratio Ratio\n"
+                                              "# TYPE test_ratio gauge\n"
+                                              "test_ratio 0.5\n")
+
+    def test_render_histogram(self) -> None:
+        histogram = Histogram(buckets=(1.0, 2.0))
+        histogram.observe(0.5)
+        histogram.observe(3.0)
+        exposition = Exposition(prefix="test_")
+
+        exposition.add_histogram("seconds", "Duration", histogram, {"stage": "read"})
+
+        self.assertEqual(exposition.render(), "# HELP test_seconds Duration\n"
+                                              "# TYPE test_seconds histogram\n"
+                                              'test_seconds_bucket{stage="read",le="1.0"} 1\n'
+                                              'test_seconds_bucket{stage="read",le="2.0"} 1\n'
+                                              'test_seconds_bucket{stage="read",le="+Inf"} 2\n'
+                                              'test_seconds_sum{stage="read"} 3.5\n'
+                                              'test_seconds_count{stage="read"} 2\n')
+
+    def test_render_escapes_labels(self) -> None:
+        exposition = Exposition(prefix="test_")
+
+        exposition.add("lines", "gauge", "Number of lines", 1, {"file": 'a "quoted"\\name\n'})
+
+        self.assertIn('test_lines{file="a \\"quoted\\"\\\\name\\n"} 1\n', exposition.render())
+
+
+class TestServingMetrics(unittest.TestCase):
+    def test_write(self) -> None:
+        metrics = ServingMetrics()
+        metrics.file_read.observe(0.001)
+        exposition = Exposition()
+
+        metrics.write(exposition)
+
+        rendered = exposition.render()
+        self.assertIn('line_server_request_stage_seconds_count{stage="file_read"} 1\n', rendered)
+        self.assertIn('line_server_request_stage_seconds_count{stage="index_lookup"} 0\n', rendered)
+        self.assertIn("line_server_index_build_seconds_count 0\n", rendered)
+
+
+class TestCountOpenFiles(unittest.TestCase):
+    def test_count_open_files(self) -> None:
+        before = count_open_files()
+        if before is None:
+            self.skipTest("Open file descriptors cannot be listed on this platform")
+
+        with open(__file__):
+            self.assertEqual(count_open_files(), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
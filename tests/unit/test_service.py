@@ -1,10 +1,34 @@
+import asyncio
 import unittest
-from unittest.mock import AsyncMock, MagicMock
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi import HTTPException
 
-from src.file_handlers.exceptions import LineIndexOutOfRangeError
-from src.service import LineService
+from src import constants
+from src.file_handlers.cache import LineCache
+from src.file_handlers.exceptions import IndexNotReadyError, LineIndexOutOfRangeError
+from src.file_handlers.index_file import FileSignature
+from src.file_handlers.offsets import LineOffsets
+from src.file_handlers.progress import IndexingProgress
+from src.metrics import Exposition
+from src.service import FilesService, LineService, Newline
+
+
+class TestNewline(unittest.TestCase):
+    def test_apply(self) -> None:
+        lines = [b"a\n", b"b\r\n", b"c\rd", b""]
+        expected = {
+            Newline.KEEP: lines,
+            Newline.LF: [b"a\n", b"b\n", b"c\rd", b""],
+            Newline.CRLF: [b"a\r\n", b"b\r\n", b"c\rd", b""],
+            Newline.STRIP: [b"a", b"b", b"c\rd", b""],
+        }
+
+        for newline, expected_lines in expected.items():
+            with self.subTest(newline=newline):
+                self.assertEqual([newline.apply(line) for line in lines], expected_lines)
 
 
 class TestLineService(unittest.IsolatedAsyncioTestCase):
@@ -20,27 +44,32 @@ class TestLineService(unittest.IsolatedAsyncioTestCase):
         content = "hi! I am a line\n"
         line_index = 1234567
         service = LineService()
-        service.manager.get_line = AsyncMock(return_value=content)
+        service.manager.get_line_bytes = AsyncMock(return_value=content.encode())
 
-        await service.get_line(line_index)
+        result = await service.get_line(line_index)
 
-        service.manager.get_line.assert_awaited_once_with(line_index)
+        service.manager.get_line_bytes.assert_awaited_once_with(line_index)
+        self.assertEqual(result, content)
 
-    async def test_get_line_valid_with_bytes_before_line(self) -> None:
-        content = "hi! I am a line\n"
-        line_index = 1234567
-        bytes_before_line = [0, 1, 2, 3]
+    async def test_get_line_multibyte(self) -> None:
+        content = "ünïcödé 日本語 🙂\r\n".encode()
         service = LineService()
-        service.manager.get_line = AsyncMock(return_value=content)
+        service.manager.get_line_bytes = AsyncMock(return_value=content)
+
+        self.assertEqual(await service.get_line(0), "ünïcödé 日本語 🙂\r\n")
+        self.assertEqual(await service.get_line(0, Newline.LF), "ünïcödé 日本語 🙂\n")
+        self.assertEqual(await service.get_line_bytes(0, Newline.STRIP), "ünïcödé 日本語 🙂".encode())
 
-        await service.get_line(line_index, bytes_before_line)
+    async def test_get_line_invalid_bytes(self) -> None:
+        service = LineService()
+        service.manager.get_line_bytes = AsyncMock(return_value=b"caf\xe9\n")  # Latin-1, not UTF-8
 
-        service.manager.get_line.assert_awaited_once_with(line_index)
-        self.assertEqual(service.manager.bytes_before_line, bytes_before_line)
+        self.assertEqual(await service.get_line(0), "caf\ufffd\n")
+        self.assertEqual(await service.get_line_bytes(0), b"caf\xe9\n")
 
     async def test_get_line_file_not_found(self) -> None:
         service = LineService()
-        service.manager.get_line = AsyncMock(side_effect=FileNotFoundError)
+        service.manager.get_line_bytes = AsyncMock(side_effect=FileNotFoundError)
 
         with self.assertRaises(HTTPException) as e_context:
             await service.get_line(1234567)
@@ -49,13 +78,241 @@ class TestLineService(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_line_out_of_range(self) -> None:
         service = LineService()
-        service.manager.get_line = AsyncMock(side_effect=LineIndexOutOfRangeError)
+        service.manager.get_line_bytes = AsyncMock(side_effect=LineIndexOutOfRangeError)
+
+        with self.assertRaises(HTTPException) as e_context:
+            await service.get_line(1234567)
+
+        self.assertEqual(413, e_context.exception.status_code)
+
+    async def test_get_line_not_ready(self) -> None:
+        service = LineService()
+        service.manager.progress = IndexingProgress(total_bytes=100)
+        service.manager.progress.update(0, 0)
+        service.manager.get_line_bytes = AsyncMock(side_effect=IndexNotReadyError)
 
         with self.assertRaises(HTTPException) as e_context:
             await service.get_line(1234567)
 
+        self.assertEqual(503, e_context.exception.status_code)
+        self.assertEqual("1", e_context.exception.headers["Retry-After"])  # no estimate yet
+
+    def test_retry_after_bounded(self) -> None:
+        service = LineService()
+        service.manager.progress = IndexingProgress(total_bytes=100)
+        service.manager.progress.started_at -= 1000
+        service.manager.progress.update(1, 0)
+
+        self.assertEqual(service.retry_after(), 60)
+
+    async def test_readiness(self) -> None:
+        service = LineService()
+        service.manager.begin_pre_processing()
+
+        readiness = service.readiness()
+
+        self.assertFalse(readiness["ready"])
+        self.assertFalse(readiness["done"])
+
+    def test_etag(self) -> None:
+        service = LineService()
+        self.assertIsNone(service.etag("raw", 1))
+
+        service.manager._state.signature = FileSignature(4, 10, b"head", b"tail")
+        service.manager.bytes_before_line = LineOffsets([0, 2])
+        etag = service.etag("raw", 1, "keep")
+
+        self.assertEqual(etag, f'"{service.manager.signature.fingerprint}-raw-1-keep"')
+        self.assertNotEqual(etag, service.etag("raw", 2, "keep"))
+        service.manager._state.signature = FileSignature(5, 11, b"head", b"tail")
+        self.assertNotEqual(etag, service.etag("raw", 1, "keep"))
+        service.manager.begin_pre_processing()
+        self.assertIsNone(service.etag("raw", 1, "keep"))  # the same request may return more lines once indexed
+
+    async def test_write_metrics(self) -> None:
+        service = LineService()
+        service.manager.bytes_before_line = LineOffsets([0, 12, 24])
+        service.manager.cache = LineCache(1024)
+        service.manager.cache.get(0)
+        exposition = Exposition()
+
+        service.write_metrics(exposition)
+
+        rendered = exposition.render()
+        self.assertIn('line_server_index_lines{source="lines"} 3\n', rendered)
+        self.assertIn(f'line_server_index_memory_bytes{{source="lines"}} {service.manager.bytes_before_line.nbytes}\n',
+                      rendered)
+        self.assertIn('line_server_cache_misses_total{source="lines",cache="lines"} 1\n', rendered)
+
+    async def test_pre_process_in_background(self) -> None:
+        service = LineService()
+        service.manager.pre_process = MagicMock()
+
+        await service.pre_process_in_background()
+
+        service.manager.pre_process.assert_called_once()
+        self.assertIsNotNone(service.manager.progress)
+
+    async def test_pre_process_in_background_error_logged(self) -> None:
+        service = LineService()
+        service.logger = MagicMock()
+        service.manager.pre_process = MagicMock(side_effect=FileNotFoundError)
+
+        await service.pre_process_in_background()  # does not raise, as no one is waiting for the result
+
+        service.logger.exception.assert_called_once()
+
+    async def test_watch_in_background(self) -> None:
+        service = LineService()
+        service.manager.refresh = AsyncMock(side_effect=[FileNotFoundError, True, False])
+
+        with patch.object(constants, "FILE_VALIDATION_INTERVAL", 0.001):
+            task = service.watch_in_background()
+            while service.manager.refresh.await_count < 3:  # errors do not stop the checks
+                await asyncio.sleep(0.001)
+            task.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_watch_in_background_disabled(self) -> None:
+        service = LineService()
+        service.manager.refresh = AsyncMock()
+
+        with patch.object(constants, "FILE_VALIDATION_INTERVAL", 0):
+            await service.watch_in_background()
+
+        service.manager.refresh.assert_not_awaited()
+
+    async def test_get_lines_valid(self) -> None:
+        service = LineService()
+        service.manager.get_lines_bytes = AsyncMock(return_value=[b"line 3\n", b"line 1\n"])
+
+        result = await service.get_lines([3, 1])
+
+        service.manager.get_lines_bytes.assert_awaited_once_with([3, 1])
+        self.assertEqual(result, ["line 3\n", "line 1\n"])
+
+    async def test_get_lines_out_of_range(self) -> None:
+        service = LineService()
+        service.manager.get_lines_bytes = AsyncMock(side_effect=LineIndexOutOfRangeError)
+
+        with self.assertRaises(HTTPException) as e_context:
+            await service.get_lines([1234567])
+
+        self.assertEqual(413, e_context.exception.status_code)
+
+    async def test_get_line_range_valid(self) -> None:
+        service = LineService()
+        service.manager.get_line_range_bytes = AsyncMock(return_value=[b"line 1\n", b"line 2\n"])
+
+        result = await service.get_line_range(1, 2)
+
+        service.manager.get_line_range_bytes.assert_awaited_once_with(1, 2)
+        self.assertEqual(result, ["line 1\n", "line 2\n"])
+
+    async def test_get_line_range_file_not_found(self) -> None:
+        service = LineService()
+        service.manager.get_line_range_bytes = AsyncMock(side_effect=FileNotFoundError)
+
+        with self.assertRaises(HTTPException) as e_context:
+            await service.get_line_range(1, 2)
+
+        self.assertEqual(500, e_context.exception.status_code)
+
+    async def test_stream_line_range_valid(self) -> None:
+        service = LineService()
+        state = MagicMock()
+        service.manager.get_line_range_bounds = MagicMock(return_value=(state, 10, 20))
+        service.manager.iter_bytes = MagicMock()
+
+        service.stream_line_range(1, 2)
+
+        service.manager.get_line_range_bounds.assert_called_once_with(1, 2)
+        service.manager.iter_bytes.assert_called_once()
+        self.assertEqual(service.manager.iter_bytes.call_args.args[:3], (state, 10, 20))
+
+    async def test_stream_line_range_out_of_range(self) -> None:
+        service = LineService()
+        service.manager.get_line_range_bounds = MagicMock(side_effect=LineIndexOutOfRangeError)
+
+        with self.assertRaises(HTTPException) as e_context:
+            service.stream_line_range(1234567, 1)
+
         self.assertEqual(413, e_context.exception.status_code)
 
+    def test_close(self) -> None:
+        service = LineService()
+        service.manager.close = MagicMock()
+
+        service.close()
+
+        service.manager.close.assert_called_once()
+
+
+class TestFilesService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.tmpdir = TemporaryDirectory()
+        Path(self.tmpdir.name, "served.txt").write_text("I am line 0\n")
+        with patch.object(constants, "FILES_TO_SERVE", Path(self.tmpdir.name)):
+            self.service = FilesService()
+
+    def tearDown(self) -> None:
+        self.service.close()
+        self.tmpdir.cleanup()
+
+    def test_list_files(self) -> None:
+        self.assertEqual(self.service.list_files(), ["served.txt"])
+
+    async def test_write_metrics(self) -> None:
+        await self.service.get_line_service("served.txt")
+        exposition = Exposition()
+
+        self.service.write_metrics(exposition)
+
+        rendered = exposition.render()
+        self.assertIn("line_server_files_served 1\n", rendered)
+        self.assertIn("line_server_files_loaded 1\n", rendered)
+        self.assertIn('line_server_index_memory_bytes{source="files"} 8\n', rendered)
+        self.assertIn("line_server_files_memory_bytes 8\n", rendered)
+
+    async def test_get_line_service_valid(self) -> None:
+        line_service = await self.service.get_line_service("served.txt")
+
+        self.assertEqual(await line_service.get_line(0), "I am line 0\n")
+
+    async def test_get_line_service_shared(self) -> None:
+        line_service = await self.service.get_line_service("served.txt")
+
+        self.assertIs(await self.service.get_line_service("served.txt"), line_service)
+
+    async def test_get_line_service_file_released(self) -> None:
+        Path(self.tmpdir.name, "other.txt").write_text("I am another line 0\n")
+        self.service.registry.paths["other.txt"] = Path(self.tmpdir.name, "other.txt")
+        self.service.registry.max_open_files = 1
+        line_service = await self.service.get_line_service("served.txt")
+
+        await self.service.get_line_service("other.txt")
+        self.assertNotIn("served.txt", self.service._line_services)
+        reloaded = await self.service.get_line_service("served.txt")
+
+        self.assertIsNot(reloaded, line_service)
+        self.assertEqual(await reloaded.get_line(0), "I am line 0\n")
+
+    async def test_get_line_service_unknown_file(self) -> None:
+        with self.assertRaises(HTTPException) as e_context:
+            await self.service.get_line_service("missing.txt")
+
+        self.assertEqual(404, e_context.exception.status_code)
+
+    async def test_get_line_service_file_not_found(self) -> None:
+        Path(self.tmpdir.name, "served.txt").unlink()
+
+        with self.assertRaises(HTTPException) as e_context:
+            await self.service.get_line_service("served.txt")
+
+        self.assertEqual(500, e_context.exception.status_code)
+
 
 if __name__ == '__main__':
     unittest.main()